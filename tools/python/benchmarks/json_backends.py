@@ -0,0 +1,67 @@
+#! /usr/bin/env python
+#
+"""
+Benchmark the JSON decoding backends supported by xjs.jsonbackend.
+
+Two corpora are decoded with each available backend: the schema documents
+and examples shipped in schemas/json and examples/json, decoded one file at
+a time (as when loading schemas), and a single large document made of 200
+copies of all of them (as when validating a large instance).
+
+Usage: json_backends.py [REPEAT]
+"""
+import os, sys
+from timeit import default_timer as timer
+
+try:
+    import xjs
+except ImportError:
+    sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from xjs import jsonbackend
+
+basedir = os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(
+                                              os.path.abspath(__file__)))))
+dirs = [ os.path.join(basedir, "schemas", "json"),
+         os.path.join(basedir, "schemas", "json", "extern"),
+         os.path.join(basedir, "examples", "json") ]
+
+def corpus():
+    out = []
+    for d in dirs:
+        for f in sorted(os.listdir(d)):
+            if f.endswith(".json"):
+                with open(os.path.join(d, f)) as fd:
+                    out.append(fd.read())
+    return out
+
+def best(func, repeat):
+    out = None
+    for i in xrange(repeat):
+        t = timer()
+        func()
+        t = timer() - t
+        if out is None or t < out:
+            out = t
+    return out
+
+def main(repeat=20):
+    docs = corpus()
+    big = "[" + ",".join(docs * 200) + "]"
+    small = sum([len(d) for d in docs])
+
+    print "{0} files ({1} bytes); large document: {2} bytes".format(
+        len(docs), small, len(big))
+    print "{0:12} {1:>12} {2:>12} {3:>10}".format("backend", "files",
+                                                  "large", "MB/s")
+    for name in jsonbackend.available_backends():
+        jsonbackend.use_backend(name)
+        tfiles = best(lambda: [jsonbackend.loads(d) for d in docs], repeat)
+        tbig = best(lambda: jsonbackend.loads(big), max(repeat/4, 1))
+        print "{0:12} {1:>10.2f}ms {2:>10.1f}ms {3:>10.1f}".format(
+            name, tfiles*1e3, tbig*1e3, len(big)/tbig/1e6)
+
+if __name__ == '__main__':
+    repeat = 20
+    if len(sys.argv) > 1:
+        repeat = int(sys.argv[1])
+    main(repeat)
@@ -0,0 +1,151 @@
+#! /usr/bin/env python
+#
+"""
+Benchmark the time to the first validation error with and without 
+cost-ordered keyword evaluation (ExtValidator(failfast=True)).
+
+The corpus is built from the schema documents in schemas/json (which are
+themselves validated against the JSON Schema meta-schema and the 
+mgi-json-schema extension) and the examples in examples/json.  Each 
+document is broken in a few realistic ways: a mistyped value deep in the 
+document, a misspelled type name, a mistyped "required" list, and an 
+object that has been double-encoded as a JSON string.
+
+Usage: keyword_order.py [REPEAT]
+"""
+import os, sys, json, copy
+from timeit import default_timer as timer
+
+try:
+    import xjs
+except ImportError:
+    sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from xjs.validate import ExtValidator, ValidationError
+from xjs.schemaloader import SchemaLoader
+
+basedir = os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(
+                                              os.path.abspath(__file__)))))
+schemadir = os.path.join(basedir, "schemas", "json")
+exdir = os.path.join(basedir, "examples", "json")
+
+def _nodes(data, path=()):
+    # iterate through all the objects in data
+    if isinstance(data, dict):
+        yield path, data
+        for k in sorted(data.keys()):
+            for out in _nodes(data[k], path + (k,)):
+                yield out
+    elif isinstance(data, list):
+        for i, v in enumerate(data):
+            for out in _nodes(v, path + (i,)):
+                yield out
+
+def _last(doc, test):
+    # return the last (deepest) object passing the test
+    out = None
+    for path, node in _nodes(doc):
+        if test(node):
+            out = node
+    return out
+
+def mutants(doc):
+    """
+    return a list of broken copies of doc
+    """
+    out = []
+
+    d = copy.deepcopy(doc)
+    node = _last(d, lambda n: isinstance(n.get("description"), basestring))
+    if node is not None:
+        node["description"] = 42
+        out.append(("mistyped description", d))
+
+    d = copy.deepcopy(doc)
+    node = _last(d, lambda n: isinstance(n.get("type"), basestring))
+    if node is not None:
+        node["type"] = node["type"][:-1]
+        out.append(("misspelled type", d))
+
+    d = copy.deepcopy(doc)
+    node = _last(d, lambda n: isinstance(n.get("title"), basestring))
+    if node is not None:
+        node["title"] = [ node["title"] ]
+        out.append(("mistyped title", d))
+
+    d = copy.deepcopy(doc)
+    node = _last(d, lambda n: isinstance(n.get("required"), list) or 
+                              isinstance(n.get("properties"), dict))
+    if node is not None:
+        node["required"] = "id"
+        out.append(("bad required", d))
+
+    d = copy.deepcopy(doc)
+    parent = _last(d, lambda n: any([isinstance(v, dict) and v 
+                                     for v in n.values()]))
+    if parent is not None:
+        k = sorted([k for k in parent if isinstance(parent[k], dict) and
+                                         parent[k]])[-1]
+        parent[k] = json.dumps(parent[k])
+        out.append(("double-encoded object", d))
+
+    return out
+
+def corpus():
+    out = []
+    files = [os.path.join(schemadir, f) for f in sorted(os.listdir(schemadir))
+                                        if f.endswith("_schema.json") or 
+                                           f.startswith("mgi-json") or
+                                           f.startswith("jsont-")]
+    files += [os.path.join(exdir, f) for f in sorted(os.listdir(exdir))
+                                     if f.endswith(".json")]
+    for f in files:
+        with open(f) as fd:
+            doc = json.load(fd)
+        for why, d in mutants(doc):
+            out.append((os.path.basename(f), why, d))
+    return out
+
+def time_to_error(validator, doc, repeat):
+    best = None
+    for i in xrange(repeat):
+        t = timer()
+        try:
+            validator.validate(doc)
+            return None
+        except ValidationError, ex:
+            pass
+        t = timer() - t
+        if best is None or t < best:
+            best = t
+    return best
+
+def main(repeat=50):
+    ldr = SchemaLoader.from_directory(schemadir)
+    default = ExtValidator(ldr)
+    ordered = ExtValidator(ldr, failfast=True)
+
+    docs = corpus()
+    tot = [0.0, 0.0]
+    print "{0:32} {1:22} {2:>10} {3:>10}".format("document", "mutation",
+                                                 "default", "failfast")
+    for name, why, doc in docs:
+        # warm up each validator's caches
+        times = []
+        for val in (default, ordered):
+            time_to_error(val, doc, 1)
+            times.append(time_to_error(val, doc, repeat))
+        if None in times:
+            continue
+        tot = [tot[0]+times[0], tot[1]+times[1]]
+        print "{0:32} {1:22} {2:>8.1f}us {3:>8.1f}us".format(name, why,
+                                                 times[0]*1e6, times[1]*1e6)
+
+    print "{0:55} {1:>8.1f}us {2:>8.1f}us".format("total (best of {0})"
+                                                  .format(repeat),
+                                                  tot[0]*1e6, tot[1]*1e6)
+
+if __name__ == '__main__':
+    repeat = 50
+    if len(sys.argv) > 1:
+        repeat = int(sys.argv[1])
+    main(repeat)
@@ -0,0 +1,225 @@
+"""
+a module that provides support for packing a collection of schemas into a
+single bundle file and for loading schemas from it.
+
+A bundle file contains:
+  *  an 8-byte magic string identifying the format and its version,
+  *  the length of the index as an 8-byte, big-endian unsigned integer,
+  *  the index, a UTF-8-encoded JSON object, and
+  *  the serialized schemas and any other artifacts.
+
+The index gives the offset (relative to the end of the index) and length of
+each schema, keyed by URI, and of each artifact, keyed by artifact name and
+URI.  Artifacts are optional precomputed forms of the schemas (e.g.
+dereferenced ones) stored under a name chosen by the writer.
+
+A BundleLoader memory-maps the file and decodes a schema only when it is
+first requested, so processes on the same host loading the same bundle
+share its pages.
+"""
+from __future__ import with_statement
+import os, json, mmap, struct, threading
+from urlparse import urlparse
+
+from . import jsonbackend
+from .schemaloader import (BaseSchemaLoad, SchemaLoader, DirectorySchemaCache,
+                           SCHEMA_LOCATION_FILE)
+
+MAGIC = "XJSBNDL1"
+_LEN = struct.Struct(">Q")
+
+class BundleFormatError(Exception):
+    """
+    an error indicating that a file is not a valid schema bundle
+    """
+    def __init__(self, why, path=None):
+        self.why = why
+        self.path = path
+
+    def __str__(self):
+        out = ""
+        if self.path:
+            out += self.path + ": "
+        return out + "Not a valid schema bundle: " + self.why
+
+def write_bundle(outfile, schemas, artifacts=None):
+    """
+    write a collection of schemas to a bundle file.
+
+    :argument str outfile:    the path to the bundle file to write
+    :argument dict schemas:   a mapping of URIs to the parsed schemas to
+                              include
+    :argument dict artifacts: a mapping of artifact names to mappings of URIs
+                              to JSON data to include
+    """
+    if artifacts is None:
+        artifacts = {}
+
+    bodies = []
+    index = { "schemas": {}, "artifacts": {} }
+    offset = 0
+    for section, entries in [("schemas", schemas)] + \
+                            [(name, artifacts[name])
+                             for name in sorted(artifacts.keys())]:
+        if section == "schemas":
+            idx = index["schemas"]
+        else:
+            idx = index["artifacts"].setdefault(section, {})
+        for uri in sorted(entries.keys()):
+            body = json.dumps(entries[uri], separators=(",", ":"))
+            if isinstance(body, unicode):
+                body = body.encode("utf-8")
+            idx[uri] = [offset, len(body)]
+            bodies.append(body)
+            offset += len(body)
+
+    header = json.dumps(index, separators=(",", ":"), sort_keys=True)
+
+    tmpfile = outfile + ".tmp"
+    with open(tmpfile, "wb") as fd:
+        fd.write(MAGIC)
+        fd.write(_LEN.pack(len(header)))
+        fd.write(header)
+        for body in bodies:
+            fd.write(body)
+    os.rename(tmpfile, outfile)
+
+class BundleLoader(BaseSchemaLoad):
+    """
+    a schema loader that reads schemas from a bundle file (see
+    write_bundle()).  Schemas are decoded on first access; the returned
+    documents are shared and should not be modified.
+    """
+
+    def __init__(self, bundlefile):
+        """
+        open the bundle
+
+        :argument str bundlefile:  the path to the bundle file
+
+        :exc `IOError` if the file cannot be opened
+        :exc `BundleFormatError` if the file is not a schema bundle
+        """
+        self.path = bundlefile
+        self._fd = open(bundlefile, "rb")
+        try:
+            head = self._fd.read(len(MAGIC) + _LEN.size)
+            if len(head) < len(MAGIC) + _LEN.size or \
+               not head.startswith(MAGIC):
+                raise BundleFormatError("bad magic string", bundlefile)
+            hlen = _LEN.unpack(head[len(MAGIC):])[0]
+            try:
+                index = json.loads(self._fd.read(hlen).decode("utf-8"))
+                self._index = index["schemas"]
+                self._artifacts = index["artifacts"]
+            except (ValueError, KeyError, TypeError), ex:
+                raise BundleFormatError("bad index", bundlefile)
+            self._start = len(head) + hlen
+
+            self._mm = mmap.mmap(self._fd.fileno(), 0, access=mmap.ACCESS_READ)
+        except:
+            self._fd.close()
+            raise
+
+        self._decoded = {}
+        self._lock = threading.Lock()
+
+        # used to support SchemaHandler
+        self._schemes = set([urlparse(u).scheme for u in self._index])
+
+    def _decode(self, entry):
+        (offset, length) = entry
+        start = self._start + offset
+        return jsonbackend.loads(self._mm[start:start+length])
+
+    def load_schema(self, uri):
+        """
+        return the parsed json schema document for a given URI.
+
+        :exc `KeyError` if the bundle does not contain the schema
+        """
+        out = self._decoded.get(uri)
+        if out is None:
+            entry = self._index[uri]
+            with self._lock:
+                out = self._decoded.get(uri)
+                if out is None:
+                    out = self._decode(entry)
+                    self._decoded[uri] = out
+        return out
+
+    def locate(self, uri):
+        """
+        return a description of the location of the schema with the given
+        URI, as "path#offset".
+
+        :exc `KeyError` if the bundle does not contain the schema
+        """
+        return "%s#%d" % (self.path, self._start + self._index[uri][0])
+
+    def iterURIs(self):
+        """
+        return an iterator for the uris of the schemas in this bundle
+        """
+        return iter(self._index)
+
+    def __len__(self):
+        return len(self._index)
+
+    def __contains__(self, uri):
+        return uri in self._index
+
+    def artifact_names(self):
+        """
+        return the names of the artifacts stored in this bundle
+        """
+        return self._artifacts.keys()
+
+    def load_artifact(self, name, uri):
+        """
+        return the artifact of the given name for the given URI.  Artifacts
+        are not cached by this loader.
+
+        :exc `KeyError` if the bundle does not contain the artifact
+        """
+        return self._decode(self._artifacts[name][uri])
+
+    def decoded(self):
+        """
+        return the number of schemas decoded so far
+        """
+        return len(self._decoded)
+
+    def close(self):
+        """
+        release the bundle file
+        """
+        if self._mm is not None:
+            self._mm.close()
+            self._mm = None
+        self._fd.close()
+
+def write_directory_bundle(dirpath, outfile, artifacts=None,
+                           locfile=SCHEMA_LOCATION_FILE):
+    """
+    write all of the schemas found under a directory into a bundle file.
+    The schemas are those listed in the directory's location file, if it
+    exists; otherwise, all the schema files under the directory are
+    included.
+
+    :argument str dirpath:    the directory containing the schemas
+    :argument str outfile:    the path to the bundle file to write
+    :argument dict artifacts: a mapping of artifact names to mappings of URIs
+                              to JSON data to include
+    :argument str locfile:    the name of the location file in the directory
+    :return int:  the number of schemas written
+    """
+    locpath = os.path.join(dirpath, locfile)
+    if os.path.exists(locpath):
+        ldr = SchemaLoader.from_location_file(locpath, dirpath)
+        schemas = dict([(u, ldr.load_schema(u)) for u in ldr.iterURIs()])
+    else:
+        schemas = DirectorySchemaCache(dirpath).schemas()
+
+    write_bundle(outfile, schemas, artifacts)
+    return len(schemas)
@@ -0,0 +1,367 @@
+"""
+a module that provides bounded caches used throughout xjs to keep memory
+use of long-running processes predictable.
+"""
+import sys, time
+from collections import MutableMapping, OrderedDict
+
+def estimate_size(obj, _seen=None):
+    """
+    return a rough estimate of the memory, in bytes, used by an object.
+    Containers of the types produced by JSON parsing (dicts, lists, strings,
+    numbers) are measured deeply; for other objects, only the object itself
+    is counted.
+    """
+    if _seen is None:
+        _seen = set()
+    if id(obj) in _seen:
+        return 0
+    _seen.add(id(obj))
+
+    out = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        for k, v in obj.iteritems():
+            out += estimate_size(k, _seen) + estimate_size(v, _seen)
+    elif isinstance(obj, (list, tuple)):
+        for v in obj:
+            out += estimate_size(v, _seen)
+    return out
+
+class TransientDict(dict):
+    """
+    a dict built for a single use, such as a schema constructed for one
+    validation.  Caches keyed on the identity of schema objects (see 
+    dispatch.DiscriminatorIndex and ordering.KeywordOrder) do not hold on 
+    to these.
+    """
+    pass
+
+class TransientList(list):
+    """
+    a list built for a single use (see TransientDict)
+    """
+    pass
+
+def is_transient(obj):
+    """
+    return True if the given object was built for a single use and so 
+    should not be cached against its identity
+    """
+    return isinstance(obj, (TransientDict, TransientList))
+
+class _NoLock(object):
+    # stands in for a lock when a cache is not shared by threads
+    def __enter__(self):
+        pass
+    def __exit__(self, *exc):
+        pass
+
+_nolock = _NoLock()
+
+class LRUCache(MutableMapping):
+    """
+    a dictionary that holds a limited number of entries (and/or estimated
+    bytes), evicting the least recently used ones as needed to stay within
+    its limits.  Entries can be pinned so that they are never evicted.
+
+    Statistics on the use of the cache are available via stats().
+    """
+
+    def __init__(self, maxsize=None, maxbytes=None, sizeof=estimate_size,
+                 normalize=None, on_evict=None, lock=None):
+        """
+        create the cache
+
+        :argument int maxsize:   the maximum number of entries to hold; if
+                                 None, the number is not limited.
+        :argument int maxbytes:  the maximum number of (estimated) bytes to
+                                 hold; if None, the size is not limited.
+        :argument func sizeof:   a function that estimates the size of a 
+                                 value; if None, sizes are not tracked (and
+                                 maxbytes is ignored).
+        :argument func normalize: a function that converts keys to a
+                                 normalized form (e.g. for URIs)
+        :argument func on_evict: a function to call with the key and value of
+                                 each entry that is evicted
+        :argument lock:          a lock (e.g. a threading.Lock) to hold 
+                                 while the cache is accessed so that it can 
+                                 be shared by threads.  on_evict is called 
+                                 after the lock is released.
+        """
+        self.maxsize = maxsize
+        self.maxbytes = maxbytes
+        self._sizeof = sizeof
+        self._normalize = normalize
+        self._on_evict = on_evict
+        self._lock = lock or _nolock
+
+        self._data = OrderedDict()
+        self._sizes = {}
+        self._pinned = set()
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _norm(self, key):
+        if self._normalize:
+            return self._normalize(key)
+        return key
+
+    def __getitem__(self, key):
+        key = self._norm(key)
+        with self._lock:
+            try:
+                val = self._data.pop(key)
+            except KeyError:
+                self.misses += 1
+                raise
+            self._data[key] = val
+            self.hits += 1
+        return val
+
+    def __setitem__(self, key, val):
+        key = self._norm(key)
+        size = 0
+        if self._sizeof:
+            size = self._sizeof(val)
+        with self._lock:
+            if key in self._data:
+                self._remove(key)
+            self._data[key] = val
+            if self._sizeof:
+                self._sizes[key] = size
+                self._bytes += size
+            victims = self._evict()
+        self._notify(victims)
+
+    def __delitem__(self, key):
+        with self._lock:
+            self._remove(self._norm(key))
+
+    def pop(self, key, *default):
+        """
+        remove the entry with the given key and return its value, or return
+        default if there is no such entry (raising KeyError if no default 
+        is given)
+        """
+        with self._lock:
+            try:
+                return self._remove(self._norm(key))
+            except KeyError:
+                if default:
+                    return default[0]
+                raise
+
+    def _remove(self, key):
+        val = self._data.pop(key)
+        self._bytes -= self._sizes.pop(key, 0)
+        return val
+
+    def __contains__(self, key):
+        key = self._norm(key)
+        with self._lock:
+            return key in self._data
+
+    def __iter__(self):
+        with self._lock:
+            return iter(self._data.keys())
+
+    def __len__(self):
+        return len(self._data)
+
+    def peek(self, key, default=None):
+        """
+        return the value for key without affecting its recency or the
+        statistics
+        """
+        key = self._norm(key)
+        with self._lock:
+            return self._data.get(key, default)
+
+    def _over(self):
+        return (self.maxsize is not None and len(self._data) > self.maxsize) \
+            or (self.maxbytes is not None and self._sizeof and 
+                self._bytes > self.maxbytes)
+
+    def _evict(self):
+        # remove entries as needed to get within the limits; the removed 
+        # (key, value) pairs are returned for _notify().  The lock must be 
+        # held.
+        if not self._over():
+            return []
+
+        # find the least recently used, unpinned entries that need to go
+        excess = 0
+        if self.maxsize is not None:
+            excess = len(self._data) - self.maxsize
+        excessb = 0
+        if self.maxbytes is not None and self._sizeof:
+            excessb = self._bytes - self.maxbytes
+        victims = []
+        for key in self._data:
+            if excess <= 0 and excessb <= 0:
+                break
+            if key in self._pinned:
+                continue
+            victims.append(key)
+            excess -= 1
+            excessb -= self._sizes.get(key, 0)
+
+        out = []
+        for key in victims:
+            out.append((key, self._remove(key)))
+            self.evictions += 1
+        return out
+
+    def _notify(self, victims):
+        # report evicted entries; the lock must not be held
+        if self._on_evict:
+            for key, val in victims:
+                self._on_evict(key, val)
+
+    def pin(self, key):
+        """
+        prevent the entry with the given key from being evicted.  The key
+        need not be in the cache yet.
+        """
+        key = self._norm(key)
+        with self._lock:
+            self._pinned.add(key)
+
+    def unpin(self, key):
+        """
+        allow the entry with the given key to be evicted again
+        """
+        key = self._norm(key)
+        with self._lock:
+            self._pinned.discard(key)
+            victims = self._evict()
+        self._notify(victims)
+
+    def is_pinned(self, key):
+        """
+        return True if the given key is pinned
+        """
+        key = self._norm(key)
+        with self._lock:
+            return key in self._pinned
+
+    @property
+    def bytes(self):
+        """
+        the estimated number of bytes held by the values in this cache, or 
+        None if sizes are not tracked
+        """
+        if not self._sizeof:
+            return None
+        return self._bytes
+
+    def stats(self):
+        """
+        return a dictionary of statistics describing the use of this cache:
+        entries, bytes (estimated, or None if sizes are not tracked), hits, 
+        misses, evictions, and the number of pinned entries
+        """
+        with self._lock:
+            return { "entries": len(self._data), "bytes": self.bytes,
+                     "hits": self.hits, "misses": self.misses,
+                     "evictions": self.evictions,
+                     "pinned": len(self._pinned.intersection(
+                                                         self._data.keys())),
+                     "maxsize": self.maxsize, "maxbytes": self.maxbytes }
+
+    def clear(self):
+        """
+        remove all entries (including pinned ones, which remain pinned)
+        """
+        with self._lock:
+            self._data.clear()
+            self._sizes.clear()
+            self._bytes = 0
+
+class NegativeCache(object):
+    """
+    a record of keys (e.g. URIs) that recently failed to resolve so that 
+    repeated attempts to look them up can fail immediately.  Entries expire
+    after a configurable time-to-live.
+    """
+
+    def __init__(self, ttl=300.0, maxsize=10000, clock=time.time, lock=None):
+        """
+        create the cache
+
+        :argument float ttl:   the number of seconds to remember a failure; 
+                               if None, failures are remembered until 
+                               explicitly discarded.  If 0, nothing is 
+                               remembered.
+        :argument int maxsize: the maximum number of failures to remember; 
+                               the oldest are forgotten first.  If None, the
+                               number is not limited.
+        :argument func clock:  the function to call to get the current time
+        :argument lock:        a lock (e.g. a threading.Lock) to hold while 
+                               the cache is accessed so that it can be 
+                               shared by threads
+        """
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self._clock = clock
+        self._lock = lock or _nolock
+        self._data = OrderedDict()
+        self.hits = 0
+        self.evictions = 0
+
+    def add(self, key):
+        """
+        remember that the given key failed to resolve
+        """
+        if self.ttl == 0:
+            return
+        with self._lock:
+            self._data.pop(key, None)
+            self._data[key] = self._clock()
+            if self.maxsize is not None:
+                while len(self._data) > self.maxsize:
+                    self._data.popitem(last=False)
+                    self.evictions += 1
+
+    def __contains__(self, key):
+        with self._lock:
+            added = self._data.get(key)
+            if added is None:
+                return False
+            if self.ttl is not None and self._clock() - added >= self.ttl:
+                del self._data[key]
+                return False
+            self.hits += 1
+            return True
+
+    def discard(self, key):
+        """
+        forget the failure of the given key, if it was recorded
+        """
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        """
+        forget all recorded failures
+        """
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+    def __iter__(self):
+        with self._lock:
+            return iter(self._data.keys())
+
+    def stats(self):
+        """
+        return a dictionary of statistics describing the use of this cache:
+        entries, hits (lookups that failed immediately), and evictions
+        """
+        with self._lock:
+            return { "entries": len(self._data), "hits": self.hits,
+                     "evictions": self.evictions, "ttl": self.ttl }
@@ -0,0 +1,53 @@
+"""
+The implementation for the script that converts schema location files into
+a location database
+"""
+import sys
+from argparse import ArgumentParser
+from .validate import Runner, BADINPUTS
+from ..locdb import convert_location_file
+
+description = \
+"""convert schema location files to a location database"""
+
+epilog=None
+
+def define_opts(progname=None):
+
+    parser = ArgumentParser(progname, None, description, epilog)
+    parser.add_argument('locfiles', metavar='LOCFILE', type=str, nargs='+',
+                        help="the location files to convert")
+    parser.add_argument('-o', '--output', type=str, dest='dbfile',
+                        metavar='DBFILE', required=True,
+                        help="the database file to write to")
+    parser.add_argument('-f', '--format', type=str, dest='fmt',
+                        metavar='FMT', default=None,
+                        help="the format of the location files (json or txt)")
+    parser.add_argument('-q', '--quiet', action='store_true',
+                        help="suppress error messages")
+    parser.add_argument('-s', '--silent', action='store_true',
+                        help="suppress all output; the exit code indicates "
+                            +"if any of the files could not be converted.")
+
+    return parser
+
+class LocDB(Runner):
+    def __init__(self, progname=None, out=sys.stdout, err=sys.stderr):
+        Runner.__init__(self, progname, define_opts, out, err)
+
+    def run(self):
+        """
+        execute the locdb script.
+
+        Command line arguments are parsed from sys.argv.
+        """
+        for locfile in self.opts.locfiles:
+            try:
+                n = convert_location_file(locfile, self.opts.dbfile,
+                                          self.opts.fmt)
+            except (IOError, ValueError, RuntimeError), ex:
+                return self.fail(BADINPUTS, "{0}: {1}".format(locfile,
+                                                              str(ex)))
+            self.tell("{0}: {1} mappings".format(locfile, n))
+
+        return 0
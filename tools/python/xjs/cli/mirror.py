@@ -0,0 +1,101 @@
+"""
+The implementation for the script that takes a snapshot of remote schemas
+for use without network access
+"""
+import os, sys
+from argparse import ArgumentParser
+from .validate import Runner, BADSCHEMA, BADINPUTS
+from ..schemaloader import SchemaLoader
+from ..remote import RemoteLoader
+from ..mirror import mirror
+from .. import jsonbackend
+
+description = \
+"""fetch the schemas that documents or schema URIs refer to, transitively,
+and save them into a directory for use without network access"""
+
+epilog=None
+
+def define_opts(progname=None):
+
+    parser = ArgumentParser(progname, None, description, epilog)
+    parser.add_argument('seeds', metavar='URI_OR_FILE', type=str, nargs='+',
+                        help="the URI of a schema to mirror or a JSON "
+                            +"document whose schemas should be mirrored")
+    parser.add_argument('-d', '--directory', type=str, dest='dir',
+                        metavar='DIR', required=True,
+                        help="the directory to save the schemas into")
+    parser.add_argument('-L', '--schema-location', type=str, dest='loc',
+                        metavar='DIR_OR_FILE', default=None,
+                        help="Either a directory containing cached schemas "
+                             +"or a schema location file to consult before "
+                             +"fetching schemas remotely")
+    parser.add_argument('-b', '--bundle', type=str, dest='bundle',
+                        metavar='FILE', default=None,
+                        help="also pack the schemas into this bundle file")
+    parser.add_argument('-w', '--workers', type=int, dest='workers',
+                        metavar='N', default=8,
+                        help="the maximum number of schemas to fetch at once "
+                            +"(default: 8)")
+    parser.add_argument('-c', '--cache-dir', type=str, dest='cachedir',
+                        metavar='DIR', default=None,
+                        help="a directory for caching HTTP responses between "
+                            +"runs")
+    parser.add_argument('-q', '--quiet', action='store_true',
+                        help="suppress messages about schemas that could not "
+                            +"be retrieved")
+    parser.add_argument('-s', '--silent', action='store_true',
+                        help="suppress all output; the exit code indicates "
+                            +"if any of the schemas could not be retrieved.")
+
+    return parser
+
+class Mirror(Runner):
+    def __init__(self, progname=None, out=sys.stdout, err=sys.stderr):
+        Runner.__init__(self, progname, define_opts, out, err)
+
+    def run(self):
+        """
+        execute the mirror script.
+
+        Command line arguments are parsed from sys.argv.
+        """
+        remote = RemoteLoader(self.opts.cachedir)
+        if self.opts.loc:
+            if not os.path.exists(self.opts.loc):
+                return self.fail(BADINPUTS,
+                                 self.opts.loc + ": schema file/dir not found")
+
+            if os.path.isdir(self.opts.loc):
+                loader = SchemaLoader.from_directory(self.opts.loc, 
+                                                     remote=remote)
+            else:
+                loader = SchemaLoader.from_location_file(self.opts.loc, 
+                                                         remote=remote)
+        else:
+            loader = SchemaLoader(remote=remote)
+
+        seeds = []
+        for seed in self.opts.seeds:
+            if os.path.isfile(seed):
+                try:
+                    with open(seed) as fd:
+                        seeds.append(jsonbackend.load(fd))
+                except ValueError, ex:
+                    return self.fail(BADINPUTS,
+                                     seed + ": not a JSON document: " + str(ex))
+            else:
+                seeds.append(seed)
+
+        try:
+            (mirrored, missing) = mirror(seeds, self.opts.dir, loader,
+                                         self.opts.workers, self.opts.bundle)
+        finally:
+            remote.close()
+
+        for uri in missing:
+            self.advise("{0}: unable to retrieve schema".format(uri))
+        self.tell("{0} schemas saved to {1}".format(len(mirrored),
+                                                    self.opts.dir))
+
+        return (missing and BADSCHEMA) or 0
@@ -0,0 +1,51 @@
+# import pytest
+from __future__ import with_statement
+import os, pytest
+from cStringIO import StringIO
+
+from xjs.tests import Tempfiles
+import xjs.cli.locdb as cli
+import xjs.locdb as locdb
+
+datadir = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(
+                           __file__))), "tests", "data")
+schemadir = os.path.join(os.path.dirname(
+   os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(__file__)))))),
+                         "schemas", "json")
+
+@pytest.fixture
+def dbfile(request):
+    tf = Tempfiles()
+    request.addfinalizer(tf.clean)
+    tf.track("locs.db")
+    return os.path.join(tf.parent, "locs.db")
+
+def test_opts():
+    parser = cli.define_opts("goob")
+    opts = parser.parse_args("-o locs.db -f txt a.txt b.txt".split())
+    assert opts.dbfile == "locs.db"
+    assert opts.fmt == "txt"
+    assert opts.locfiles == ["a.txt", "b.txt"]
+
+def test_convert(dbfile):
+    stdout = StringIO()
+    stderr = StringIO()
+    cmd = cli.LocDB("goob", stdout, stderr)
+    assert cmd.execute(["-o", dbfile, 
+                        os.path.join(schemadir, "schemaLocation.json")]) == 0
+    assert "7 mappings" in stdout.getvalue()
+    assert stderr.getvalue() == ""
+
+    cmd = cli.LocDB("goob", stdout, stderr)
+    assert cmd.execute(["-o", dbfile, "-f", "txt",
+                        os.path.join(datadir, "loc.txt")]) == 0
+    db = locdb.LocationDB(dbfile)
+    assert len(db) == 9
+    db.close()
+
+def test_badfile(dbfile):
+    stdout = StringIO()
+    stderr = StringIO()
+    cmd = cli.LocDB("goob", stdout, stderr)
+    assert cmd.execute(["-o", dbfile, "/no/such/file.json"]) == cli.BADINPUTS
+    assert "goob: /no/such/file.json:" in stderr.getvalue()
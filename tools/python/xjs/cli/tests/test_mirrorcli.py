@@ -0,0 +1,85 @@
+# import pytest
+from __future__ import with_statement
+import json, os, sys, pytest
+from cStringIO import StringIO
+
+from xjs.tests import Tempfiles
+from xjs.tests.test_remote import server, handler, schemadir
+import xjs.cli.mirror as cli
+import xjs.schemaloader as loader
+from xjs.bundle import BundleLoader
+
+exdir = os.path.join(os.path.dirname(
+   os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(__file__)))))),
+                        "examples", "json")
+ipr_ex = os.path.join(exdir, "ipr.json")
+
+@pytest.fixture
+def tf(request):
+    out = Tempfiles()
+    request.addfinalizer(out.clean)
+    return out
+
+@pytest.fixture
+def locfile(tf, server):
+    # map the schema URIs to their locations on the test server
+    with open(os.path.join(schemadir, "schemaLocation.json")) as fd:
+        locs = json.load(fd)
+    out = os.path.join(tf.parent, "remoteLocation.json")
+    tf.track("remoteLocation.json")
+    with open(out, "w") as fd:
+        json.dump(dict([(u, server+f) for u, f in locs.iteritems()]), fd)
+    return out
+
+def test_opts():
+    parser = cli.define_opts("goob")
+    opts = parser.parse_args("-d mirror -L locs.json -w 3 urn:goob".split())
+    assert opts.dir == "mirror"
+    assert opts.loc == "locs.json"
+    assert opts.workers == 3
+    assert opts.bundle is None
+    assert opts.seeds == ["urn:goob"]
+
+def test_mirror(tf, locfile, handler):
+    out = tf.mkdir("mirror")
+    bundle = os.path.join(tf.parent, "mirror.bndl")
+    tf.track("mirror.bndl")
+    stdout = StringIO()
+    stderr = StringIO()
+    cmd = cli.Mirror("goob", stdout, stderr)
+
+    assert cmd.execute(["-d", out, "-L", locfile, "-b", bundle,
+                        "http://mgi.nist.gov/jsont-xml-transf/v0.1"]) == 0
+    assert "3 schemas saved" in stdout.getvalue()
+    assert stderr.getvalue() == ""
+    assert len(handler.log) == 3
+
+    uris = ["http://mgi.nist.gov/jsont-xml-transf/v0.1",
+            "http://mgi.nist.gov/mgi-json-schema/v0.1",
+            "http://mgi.nist.gov/mgi-json-trans/v0.1"]
+    assert os.path.exists(os.path.join(out, loader.SCHEMA_INDEX_FILE))
+    ldr = loader.SchemaLoader.from_directory(out)
+    assert sorted(ldr.iterURIs()) == uris
+    for uri in uris:
+        assert ldr.locate(uri).startswith(os.path.join(out, "mgi.nist.gov"))
+        assert ldr.load_schema(uri)['id'] == uri
+    assert len(handler.log) == 3
+
+    bl = BundleLoader(bundle)
+    try:
+        assert sorted(bl.iterURIs()) == uris
+    finally:
+        bl.close()
+
+def test_mirror_document(tf, locfile, handler):
+    out = tf.mkdir("mirror")
+    stdout = StringIO()
+    stderr = StringIO()
+    cmd = cli.Mirror("goob", stdout, stderr)
+
+    # the extension schemas in the document are not available
+    assert cmd.execute(["-d", out, "-L", locfile, ipr_ex]) == cli.BADSCHEMA
+    assert "ms:Database: unable to retrieve" in stderr.getvalue()
+    ldr = loader.SchemaLoader.from_directory(out)
+    assert "http://mgi.nist.gov/json/registry-resource/v0.1" in \
+        list(ldr.iterURIs())
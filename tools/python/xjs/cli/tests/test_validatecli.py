@@ -4,6 +4,7 @@ import json, os, sys, pytest, shutil, argparse
 from cStringIO import StringIO
 
 import xjs.cli.validate as cli
+import xjs.jsonbackend as jsonbackend
 
 schemadir = os.path.join(os.path.dirname(
    os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(__file__)))))),
@@ -68,6 +69,22 @@ def test_simple_valid(tstsys):
     assert not tstsys.stderr.getvalue()
     assert exit == 0
 
+def test_json_backend(tstsys):
+    name = jsonbackend.backend_name()
+    try:
+        app = cli.Validate("goob", tstsys.stdout, tstsys.stderr)
+        tstsys.argv[1:] = "-J json -L {0} {1}".format(schemadir, 
+                                                      mgi_json_schema).split()
+        assert app.execute() == 0
+        assert jsonbackend.backend_name() == "json"
+
+        app = cli.Validate("goob", tstsys.stdout, tstsys.stderr)
+        tstsys.argv[1:] = "-J goober {0}".format(mgi_json_schema).split()
+        assert app.execute() == cli.BADINPUTS
+        assert "goober" in tstsys.stderr.getvalue()
+    finally:
+        jsonbackend.use_backend(name)
+
 def test_simple_invalid(tstsys):
 
     baddoc = os.path.join(datadir, "invalidextension.json")
@@ -6,6 +6,7 @@ from argparse import ArgumentParser
 from ..validate import ExtValidator
 from ..validate import ValidationError, SchemaError, RefResolutionError
 from ..schemaloader import SchemaLoader
+from .. import jsonbackend
 
 description = \
 """validate one or more JSON documents against their schemas"""
@@ -33,6 +34,13 @@ def define_opts(progname=None):
                         dest='strict', 
                         help="Fail if an extensions schema cannot be loaded "
                             +"(otherwise, ignore unresolvable extensions)")
+    parser.add_argument('-J', '--json-backend', type=str, dest='jsonbackend',
+                        metavar='NAME', default=None,
+                        help="the JSON parser to use (one of "
+                            +", ".join(jsonbackend.PREFERENCE)+"; default: "
+                            +jsonbackend.DEFAULT+"); "
+                            +", ".join(jsonbackend.LENIENT)+" should only be "
+                            +"used on documents known to be valid")
     parser.add_argument('-q', '--quiet', action='store_true', 
                         help="suppress messages explaining why documents are "
                             +"invalid; only short success/failure message for "
@@ -130,6 +138,13 @@ class Validate(Runner):
         """
         loader = None
 
+        if self.opts.jsonbackend:
+            try:
+                jsonbackend.use_backend(self.opts.jsonbackend)
+            except (ValueError, ImportError), ex:
+                return self.fail(BADINPUTS, 
+                                 "--json-backend: {0}".format(str(ex)))
+
         if self.opts.loc:
             if not os.path.exists(self.opts.loc):
                 return fail(BADINPUTS, 
@@ -152,7 +167,7 @@ class Validate(Runner):
                     self.complain(filename + ": file not found.")
                     continue
                 with open(filename) as fd:
-                    doc = json.load(fd)
+                    doc = jsonbackend.load(fd)
 
                 val.validate(doc, self.opts.minimal, self.opts.strict, 
                              self.opts.docschema)
@@ -167,6 +182,9 @@ class Validate(Runner):
                                 str(ex))
                 else:
                     self.advise(str(ex))
+                    if getattr(ex, 'schema_uri', None):
+                        self.advise("(while validating against "+
+                                    ex.schema_uri+")")
                 self.tell("{0}: not valid.".format(f))
                 anyinvalid = True
                 if isinstance(ex, SchemaError):
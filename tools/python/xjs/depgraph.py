@@ -0,0 +1,279 @@
+"""
+a module that provides a graph of the dependencies among schema documents.
+
+A schema depends on another if it refers to it via "$ref" or
+"$extensionSchemas" (see schemaloader.schema_dependencies()).  The graph
+supports ordering schemas so that each comes after those it depends on
+(e.g. for precompiling validators; see ExtValidator.precompile()), finding
+cycles of references, and finding the schemas affected by a change to
+another.
+
+Schemas are identified in the graph by their URIs without fragments (so
+"http://json-schema.org/draft-04/schema#" appears as
+"http://json-schema.org/draft-04/schema").
+"""
+from urlparse import urldefrag
+from multiprocessing.pool import ThreadPool
+
+from .schemaloader import schema_dependencies
+
+def _node(uri):
+    return urldefrag(uri)[0]
+
+class DependencyCycleError(Exception):
+    """
+    an error indicating that schemas refer to each other in a cycle where
+    an acyclic order was required
+    """
+    def __init__(self, cycles):
+        self.cycles = cycles
+
+    def __str__(self):
+        return "Schemas refer to each other in cycles: " + \
+            "; ".join([" -> ".join(c + c[:1]) for c in self.cycles])
+
+class SchemaGraph(object):
+    """
+    a graph of the dependencies among a set of schema documents
+    """
+
+    def __init__(self):
+        self._deps = {}
+        self._rdeps = {}
+        self._uris = {}
+        self.errors = {}
+
+    @classmethod
+    def from_loader(cls, loader, uris=None, workers=1, documents=None):
+        """
+        build the graph for the schemas available from a loader.  Schemas
+        that cannot be loaded are left out of the graph and listed, with
+        the exception raised, in the graph's errors dictionary.
+
+        :argument loader:     the schema loader (e.g. a SchemaLoader)
+        :argument list uris:  the URIs of the schemas to include; if None,
+                              all the URIs given by loader.iterURIs() are
+                              included.
+        :argument int workers: the number of schemas to load in parallel
+        :argument dict documents:  if given, the schemas loaded are added to
+                              it, keyed by URI.
+        """
+        if uris is None:
+            uris = list(loader.iterURIs())
+
+        def load(uri):
+            try:
+                return (uri, loader.load_schema(uri), None)
+            except (KeyError, IOError, ValueError), ex:
+                return (uri, None, ex)
+
+        if workers > 1:
+            pool = ThreadPool(workers)
+            try:
+                loaded = pool.map(load, uris)
+            finally:
+                pool.close()
+                pool.join()
+        else:
+            loaded = map(load, uris)
+
+        out = cls()
+        for uri, schema, ex in loaded:
+            if ex is not None:
+                out.errors[uri] = ex
+            else:
+                out.add_schema(uri, schema)
+                if documents is not None:
+                    documents[uri] = schema
+        return out
+
+    def add_schema(self, uri, schema):
+        """
+        add (or replace) a schema in the graph
+
+        :argument str uri:     the schema's URI
+        :argument dict schema: the parsed schema document
+        """
+        self.add_node(uri, schema_dependencies(schema, uri))
+
+    def add_node(self, uri, dependencies):
+        """
+        add (or replace) a schema in the graph given the URIs of the schemas
+        it depends on
+        """
+        node = _node(uri)
+        for dep in self._deps.get(node, ()):
+            self._rdeps[dep].discard(node)
+        deps = [_node(d) for d in dependencies]
+        self._deps[node] = deps
+        self._uris[node] = uri
+        for dep in deps:
+            self._rdeps.setdefault(dep, set()).add(node)
+
+    def remove_node(self, uri):
+        """
+        remove a schema from the graph.  References to it from other schemas
+        remain.
+        """
+        node = _node(uri)
+        for dep in self._deps.pop(node, ()):
+            self._rdeps[dep].discard(node)
+        self._uris.pop(node, None)
+
+    def __contains__(self, uri):
+        return _node(uri) in self._deps
+
+    def __len__(self):
+        return len(self._deps)
+
+    def __iter__(self):
+        return iter(self._deps)
+
+    def uri_for(self, node):
+        """
+        return the URI, as originally given, of a schema in the graph
+
+        :exc `KeyError` if the schema is not in the graph
+        """
+        return self._uris[_node(node)]
+
+    def dependencies(self, uri):
+        """
+        return the URIs of the schemas that the given one refers to directly
+
+        :exc `KeyError` if the schema is not in the graph
+        """
+        return list(self._deps[_node(uri)])
+
+    def dependents(self, uri, transitive=False):
+        """
+        return the URIs of the schemas in the graph that refer to the given
+        one.
+
+        :argument bool transitive:  if True, include the schemas that refer
+                                    to it indirectly as well.
+        """
+        node = _node(uri)
+        if not transitive:
+            return sorted(self._rdeps.get(node, ()))
+
+        out = set()
+        stack = [node]
+        while stack:
+            for u in self._rdeps.get(stack.pop(), ()):
+                if u not in out:
+                    out.add(u)
+                    stack.append(u)
+        out.discard(node)
+        return sorted(out)
+
+    def missing(self):
+        """
+        return the URIs of the schemas that are referred to but are not in
+        the graph
+        """
+        return sorted([u for u in self._rdeps
+                         if u not in self._deps and self._rdeps[u]])
+
+    def components(self):
+        """
+        return the strongly connected components of the graph--i.e. the
+        groups of schemas that refer to each other, directly or
+        indirectly--ordered so that each comes after those it depends on.
+        Schemas not in a cycle make up components of their own.
+        """
+        # Tarjan's algorithm, without recursion
+        index = {}
+        low = {}
+        onstack = set()
+        stack = []
+        out = []
+        counter = 0
+
+        for start in sorted(self._deps):
+            if start in index:
+                continue
+            work = [(start, iter(self._deps[start]))]
+            index[start] = low[start] = counter
+            counter += 1
+            stack.append(start)
+            onstack.add(start)
+            while work:
+                (node, deps) = work[-1]
+                for dep in deps:
+                    if dep not in self._deps:
+                        continue
+                    if dep not in index:
+                        index[dep] = low[dep] = counter
+                        counter += 1
+                        stack.append(dep)
+                        onstack.add(dep)
+                        work.append((dep, iter(self._deps[dep])))
+                        break
+                    elif dep in onstack:
+                        low[node] = min(low[node], index[dep])
+                else:
+                    work.pop()
+                    if work:
+                        parent = work[-1][0]
+                        low[parent] = min(low[parent], low[node])
+                    if low[node] == index[node]:
+                        comp = []
+                        while True:
+                            u = stack.pop()
+                            onstack.discard(u)
+                            comp.append(u)
+                            if u == node:
+                                break
+                        out.append(sorted(comp))
+        return out
+
+    def cycles(self):
+        """
+        return the groups of schemas that refer to each other in cycles,
+        including schemas that refer to themselves
+        """
+        return [c for c in self.components()
+                  if len(c) > 1 or c[0] in self._deps[c[0]]]
+
+    def topological_order(self, strict=False):
+        """
+        return the URIs of the schemas in the graph ordered so that each
+        comes after those it depends on.  Schemas in a cycle appear
+        together, in an arbitrary order.
+
+        :argument bool strict:  if True, raise an exception if there are
+                                cycles
+        :exc `DependencyCycleError` if strict is True and there are cycles
+        """
+        if strict:
+            cycles = self.cycles()
+            if cycles:
+                raise DependencyCycleError(cycles)
+        out = []
+        for comp in self.components():
+            out.extend(comp)
+        return out
+
+    def levels(self):
+        """
+        return the schemas in the graph grouped into levels such that each
+        schema depends only on schemas in earlier levels (or in its own
+        cycle).  The schemas within a level can thus be processed in
+        parallel once the earlier levels are done.
+        """
+        level = {}
+        for comp in self.components():
+            members = set(comp)
+            lev = 0
+            for u in comp:
+                for dep in self._deps[u]:
+                    if dep in level and dep not in members:
+                        lev = max(lev, level[dep] + 1)
+            for u in comp:
+                level[u] = lev
+
+        out = [[] for i in xrange(max(level.values() or [-1]) + 1)]
+        for u in sorted(level):
+            out[level[u]].append(u)
+        return out
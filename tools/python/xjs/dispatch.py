@@ -0,0 +1,274 @@
+"""
+a module that provides support for discriminator-based dispatch of oneOf and
+anyOf combinators.
+
+Schemas like the JSON transform schemas describe a family of object types
+that are distinguished by a single property (e.g. "$type") constrained to a
+constant value.  When such a family is combined via oneOf or anyOf, the
+standard jsonschema implementation will try every alternative, building a
+tree of errors for each failed one.  This module can detect when all the
+branches of a combinator are discriminated by a constant property so that a
+validator can jump straight to the one branch that can possibly match.
+"""
+import threading
+from collections import deque
+import jsonschema.validators as jsch
+from jsonschema.exceptions import ValidationError, RefResolutionError
+from .cache import LRUCache, is_transient
+
+# properties that, when available as discriminators, are preferred
+PREFERRED_DISCRIMINATORS = [ "$type" ]
+
+# limits how far we will chase $refs and allOfs when looking for constants
+_MAX_DEPTH = 16
+
+def _isscalar(val):
+    return val is None or isinstance(val, (basestring, bool, int, long, float))
+
+def _collect_constants(schema, resolver, out, required, depth=0):
+    # find the properties of the given (sub-)schema that are required and
+    # constrained to a single value.  Constants are added to out; names of
+    # required properties are added to required
+    if depth > _MAX_DEPTH or not isinstance(schema, dict):
+        return
+
+    scope = schema.get(u"id")
+    if scope:
+        resolver.push_scope(scope)
+    try:
+        ref = schema.get(u"$ref")
+        if ref is not None:
+            # as with jsonschema, sibling keywords of $ref are ignored
+            with resolver.resolving(ref) as resolved:
+                _collect_constants(resolved, resolver, out, required, depth+1)
+            return
+
+        required.update(schema.get(u"required", []))
+        props = schema.get(u"properties", {})
+        if isinstance(props, dict):
+            for name, pschema in props.iteritems():
+                if not isinstance(pschema, dict):
+                    continue
+                enum = pschema.get(u"enum")
+                if isinstance(enum, list) and len(enum) == 1 and \
+                   _isscalar(enum[0]):
+                    out.setdefault(name, set()).add(enum[0])
+
+        for sub in schema.get(u"allOf", []):
+            _collect_constants(sub, resolver, out, required, depth+1)
+    finally:
+        if scope:
+            resolver.pop_scope()
+
+def branch_constants(schema, resolver):
+    """
+    return a dictionary of the properties that the given schema requires
+    to have a single constant value.  The keys will be the property names
+    and the values, the required constant values.
+
+    :argument dict schema:  the schema to examine; $refs and allOf
+                            combinations will be followed to find constant
+                            properties.
+    :argument resolver:     the jsonschema.RefResolver to use to resolve
+                            $refs, set to the resolution scope of schema.
+    """
+    consts = {}
+    required = set()
+    _collect_constants(schema, resolver, consts, required)
+
+    # a property must be required and have exactly one allowed value.  If
+    # different parts of an allOf allow different values, then nothing can
+    # match, and the property is not useful as a discriminator.
+    return dict([(name, list(vals)[0]) for name, vals in consts.iteritems()
+                                       if name in required and len(vals) == 1])
+
+def find_discriminator(branches, resolver):
+    """
+    determine if the given list of combinator branches are discriminated by
+    a constant property.
+
+    :argument list branches:  the list of subschemas given as the value of
+                              a oneOf or anyOf keyword
+    :argument resolver:       the jsonschema.RefResolver to use to resolve
+                              $refs, set to the resolution scope of the
+                              combinator.
+    :return tuple: a 2-tuple containing the name of the discriminating
+                   property and a dictionary mapping the allowed constant
+                   values to the index of the branch requiring it, or None
+                   if the branches are not discriminated by a single
+                   property.
+    """
+    if not isinstance(branches, list) or len(branches) < 2:
+        return None
+
+    try:
+        consts = [branch_constants(b, resolver) for b in branches]
+    except RefResolutionError:
+        # let the normal validation report the problem
+        return None
+
+    candidates = set(consts[0].keys())
+    for c in consts[1:]:
+        candidates &= set(c.keys())
+
+    for name in PREFERRED_DISCRIMINATORS + sorted(candidates):
+        if name not in candidates:
+            continue
+        index = {}
+        for i, c in enumerate(consts):
+            if c[name] in index:
+                break
+            index[c[name]] = i
+        else:
+            return (name, index)
+
+    return None
+
+class DiscriminatorIndex(object):
+    """
+    a cache of the results of discriminator analysis over the combinators
+    found in schemas.  An index may be shared by threads.
+    """
+
+    def __init__(self, maxsize=4096):
+        """
+        create the index
+
+        :argument int maxsize:  the maximum number of analyses to cache; the
+                                least recently used are dropped first.  If
+                                None, the number is not limited.
+        """
+        self._cache = LRUCache(maxsize, sizeof=None, lock=threading.Lock())
+
+    def lookup(self, branches, resolver):
+        """
+        return the discriminator for the given combinator branches as
+        determined by find_discriminator().  The result will be cached
+        against the branch list and the resolver's current resolution scope
+        unless the list is transient (see cache.TransientList).
+        """
+        if is_transient(branches):
+            return find_discriminator(branches, resolver)
+
+        key = (id(branches), resolver.resolution_scope)
+        hit = self._cache.get(key)
+        if hit is not None and hit[0] is branches:
+            return hit[1]
+
+        # hold on to the branches so that its id is not reused
+        out = find_discriminator(branches, resolver)
+        self._cache[key] = (branches, out)
+        return out
+
+    def clear(self):
+        """
+        forget all cached analyses
+        """
+        self._cache.clear()
+
+    def stats(self):
+        """
+        return statistics describing the use of the cache (see 
+        cache.LRUCache.stats())
+        """
+        return self._cache.stats()
+
+    def __len__(self):
+        return len(self._cache)
+
+def _dispatch(index, branches, resolver, instance):
+    # return None if dispatch is not possible; otherwise, return a 2-tuple
+    # of the index of the selected branch (or None if there is no match) and
+    # the discriminator description
+    if not isinstance(instance, dict):
+        return None
+    disc = index.lookup(branches, resolver)
+    if not disc or disc[0] not in instance:
+        return None
+    try:
+        return (disc[1].get(instance[disc[0]]), disc)
+    except TypeError:
+        # unhashable value: it can't match any of the constants
+        return (None, disc)
+
+def select_branch(index, branches, resolver, instance):
+    """
+    return the index of the only one of the given combinator branches that
+    the instance could be valid against, or None if the branches are not 
+    discriminated or the instance does not match any of them.
+
+    :argument DiscriminatorIndex index:  the cache of analyses to use
+    :argument list branches:  the list of subschemas given as the value of
+                              a oneOf or anyOf keyword
+    :argument resolver:       the jsonschema.RefResolver to use to resolve
+                              $refs, set to the resolution scope of the
+                              combinator.
+    :argument instance:       the instance data being validated
+    """
+    sel = _dispatch(index, branches, resolver, instance)
+    return sel and sel[0]
+
+def _nomatch(instance, disc):
+    err = ValidationError("%r is not one of %r" %
+                          (instance[disc[0]], sorted(disc[1].keys())),
+                          path=deque([disc[0]]))
+    return ValidationError(
+        "%r is not valid under any of the given schemas" % (instance,),
+        context=[err]
+    )
+
+def make_combinator(default, index):
+    """
+    return a jsonschema keyword validator function for oneOf or anyOf that
+    dispatches on a discriminating property when possible.
+
+    :argument func default:  the standard jsonschema validator function to
+                             fall back on when the branches are not
+                             discriminated or the instance does not contain
+                             the discriminating property.
+    :argument DiscriminatorIndex index:  the cache of analyses to use
+    """
+    def combinator(validator, branches, instance, schema):
+        sel = _dispatch(index, branches, validator.resolver, instance)
+        if sel is None:
+            for error in default(validator, branches, instance, schema):
+                yield error
+            return
+
+        (i, disc) = sel
+        if i is None:
+            yield _nomatch(instance, disc)
+            return
+
+        # only the selected branch can match; because the others require a
+        # different value for the discriminator, oneOf's exclusivity
+        # condition is automatically satisfied.
+        errs = list(validator.descend(instance, branches[i], schema_path=i))
+        if errs:
+            yield ValidationError(
+                "%r is not valid under any of the given schemas" % (instance,),
+                context=errs
+            )
+
+    combinator.__name__ = default.__name__
+    return combinator
+
+def extend_validator(cls, index):
+    """
+    return a new validator class that extends the given jsonschema validator
+    class with oneOf and anyOf validators that will dispatch on
+    discriminating properties.  If cls does not support oneOf or anyOf,
+    cls is returned unchanged.
+
+    :argument type cls:  the jsonschema validator class to extend
+    :argument DiscriminatorIndex index:  the cache of analyses to use
+    """
+    validators = {}
+    for kw in ("oneOf", "anyOf"):
+        default = cls.VALIDATORS.get(kw)
+        if default:
+            validators[kw] = make_combinator(default, index)
+    if not validators:
+        return cls
+
+    return jsch.extend(cls, validators)
@@ -4,19 +4,329 @@ extended JSON schemas
 """
 from __future__ import with_statement
 
-import os, json, jsonspec.pointer
+import os, re, json, threading
 from urlparse import urlparse
 from urllib2 import urlopen
 
+from . import jsonbackend
+from . import remote as _remote
+from .cache import LRUCache
+
 EXTSCHEMAS = "$extensionSchemas"
 
+# marks an argument as not given
+_NOTSET = object()
+
+def escape_token(token):
+    """
+    return the given JSON Pointer reference token (a property name or 
+    array index) escaped for inclusion in a pointer string
+    """
+    return unicode(token).replace('~', '~0').replace('/', '~1')
+
+def pointer_from_path(path):
+    """
+    return the JSON Pointer string for a path given as a sequence of 
+    reference tokens.  As elsewhere in xjs, the empty path (i.e. the whole 
+    document) is given as "/".
+    """
+    if not path:
+        return "/"
+    return "/" + "/".join([escape_token(t) for t in path])
+
+def path_from_pointer(pointer):
+    """
+    return the unescaped reference tokens in a JSON Pointer string as a 
+    tuple.  Both "" and "/" are taken to refer to the whole document.
+
+    :exc `PointerSyntaxError` if the pointer does not start with "/" or 
+                              contains a "~" not followed by "0" or "1"
+    """
+    if pointer in ('', '/'):
+        return ()
+    if not pointer.startswith('/'):
+        raise PointerSyntaxError(pointer, "must start with '/'")
+    tokens = pointer.split('/')[1:]
+    for token in tokens:
+        if _BADESC_RE.search(token):
+            raise PointerSyntaxError(pointer, 
+                              "bad escape in token {0}".format(repr(token)))
+    return tuple([t.replace('~1', '/').replace('~0', '~') for t in tokens])
+
+class ExtractError(LookupError):
+    """
+    an error indicating that a JSON Pointer does not refer to a value 
+    within a document
+    """
+    def __init__(self, pointer, token=None):
+        LookupError.__init__(self, pointer)
+        self.pointer = pointer
+        self.token = token
+
+    def __str__(self):
+        out = self.pointer + ": no such value in document"
+        if self.token is not None:
+            out += " (at token {0})".format(repr(self.token))
+        return out
+
+class PointerSyntaxError(ExtractError, ValueError):
+    """
+    an error indicating that a string is not a valid JSON Pointer
+    """
+    def __init__(self, pointer, problem):
+        ExtractError.__init__(self, pointer)
+        self.problem = problem
+
+    def __str__(self):
+        return "{0}: not a JSON Pointer: {1}".format(self.pointer, 
+                                                     self.problem)
+
+# a "~" that does not start one of the escapes "~0" and "~1"
+_BADESC_RE = re.compile(r"~(?![01])")
+
+_INDEX_RE = re.compile(r"(0|[1-9][0-9]*)\Z")
+
+def array_index(token):
+    """
+    return the value of a JSON Pointer reference token as an array index, 
+    or None if it cannot be one.  As required by RFC 6901, only "0" and 
+    decimal numbers without leading zeros, signs, or spaces are indexes.
+    """
+    if _INDEX_RE.match(token):
+        return int(token)
+    return None
+
+def _step(node, token, index):
+    # return the child of node referred to by a reference token; index is 
+    # the token's value as an array index (see array_index())
+    if isinstance(node, dict):
+        return node[token]
+    if isinstance(node, list) and index is not None:
+        return node[index]
+    raise KeyError(token)
+
+class CompiledPointer(object):
+    """
+    a JSON Pointer parsed for repeated use.  Instances should be obtained 
+    via compile_pointer(), which caches them.  As elsewhere in xjs, both ""
+    and "/" refer to the whole document.
+    """
+    __slots__ = ("pointer", "path", "_indexes")
+
+    def __init__(self, pointer):
+        self.pointer = pointer
+        self.path = path_from_pointer(pointer)
+        self._indexes = tuple([array_index(t) for t in self.path])
+
+    def extract(self, data):
+        """
+        return the value within the given data that this pointer refers to
+
+        :exc `ExtractError` if there is no such value
+        """
+        node = data
+        for token, index in zip(self.path, self._indexes):
+            try:
+                node = _step(node, token, index)
+            except (KeyError, IndexError):
+                raise ExtractError(self.pointer, token)
+        return node
+
+    def __repr__(self):
+        return "CompiledPointer({0})".format(repr(self.pointer))
+
+class PointerSet(object):
+    """
+    a set of JSON Pointers compiled for extracting all of their values in 
+    one descent through a document.  The pointers' paths are merged into a 
+    tree so that common prefixes are followed once.  Instances should be 
+    obtained via compile_pointers(), which caches them.
+    """
+
+    def __init__(self, pointers):
+        """
+        compile the pointers
+
+        :argument list pointers:  the JSON Pointer strings, in the order 
+                                  their values should be returned
+        """
+        self.pointers = [compile_pointer(p) for p in pointers]
+
+        # each node of the tree is a tuple of the token leading to it, the
+        # token's array index value, a dict of its child nodes (by token), 
+        # and a list of the positions of the pointers that end there
+        self._root = (None, None, {}, [])
+        for i, cp in enumerate(self.pointers):
+            node = self._root
+            for token, index in zip(cp.path, cp._indexes):
+                child = node[2].get(token)
+                if child is None:
+                    child = (token, index, {}, [])
+                    node[2][token] = child
+                node = child
+            node[3].append(i)
+
+    def extract(self, data, default=_NOTSET):
+        """
+        return a list of the values that the pointers refer to within the 
+        given data, in the order of the pointers.  
+
+        :argument default:  the value to return for any pointer that does 
+                            not refer to a value; if not given, an exception
+                            is raised instead.
+        :exc `ExtractError` if a pointer does not refer to a value and no 
+                            default is given
+        """
+        out = [default] * len(self.pointers)
+        stack = [(self._root, data)]
+        while stack:
+            (node, value) = stack.pop()
+            for i in node[3]:
+                out[i] = value
+            for child in node[2].itervalues():
+                try:
+                    stack.append((child, _step(value, child[0], child[1])))
+                except (KeyError, IndexError):
+                    if default is _NOTSET:
+                        raise ExtractError(self._first(child).pointer, 
+                                           child[0])
+        return out
+
+    def _first(self, node):
+        # return the first pointer ending at or below the given node
+        stack = [node]
+        found = []
+        while stack:
+            node = stack.pop()
+            found.extend(node[3])
+            stack.extend(node[2].itervalues())
+        return self.pointers[min(found)]
+
+    def __len__(self):
+        return len(self.pointers)
+
+_compiled = LRUCache(1024)
+_compiled_sets = LRUCache(64)
+_compiled_lock = threading.Lock()
+
+def compile_pointer(pointer):
+    """
+    return the CompiledPointer for the given JSON Pointer string.  Compiled
+    pointers are cached, so a pointer string is parsed only once.  A 
+    CompiledPointer may be given in place of the string.
+    """
+    if isinstance(pointer, CompiledPointer):
+        return pointer
+    with _compiled_lock:
+        out = _compiled.get(pointer)
+        if out is None:
+            out = CompiledPointer(pointer)
+            _compiled[pointer] = out
+    return out
+
+def compile_pointers(pointers):
+    """
+    return the PointerSet for the given list of JSON Pointer strings.  These
+    are cached as well, so that extracting the same set of pointers from 
+    many documents costs a single compilation.  
+    """
+    key = tuple([getattr(p, "pointer", p) for p in pointers])
+    with _compiled_lock:
+        out = _compiled_sets.get(key)
+    if out is None:
+        out = PointerSet(key)
+        with _compiled_lock:
+            _compiled_sets[key] = out
+    return out
+
+def walk(data):
+    """
+    iterate through the objects and arrays in the given JSON data, 
+    including data itself, in document order.  Each is returned as a tuple
+    of its path (a tuple of property names and array indexes) and the 
+    object or array.  The data is traversed without recursion, so the 
+    depth of the data is not limited by the Python stack.  
+    """
+    if not isinstance(data, (dict, list)):
+        return
+    stack = [((), data)]
+    while stack:
+        (path, node) = stack.pop()
+        yield (path, node)
+        if isinstance(node, dict):
+            children = [(path + (k,), v) for k, v in node.iteritems()
+                                         if isinstance(v, (dict, list))]
+        else:
+            children = [(path + (i,), v) for i, v in enumerate(node)
+                                         if isinstance(v, (dict, list))]
+        children.reverse()
+        stack.extend(children)
+
+class PropertyIndex(object):
+    """
+    an index of the objects within a JSON document by the names of their 
+    properties.  It is built in a single pass over the document; afterward,
+    looking up the objects having a given property costs time proportional 
+    to the number found.  
+
+    The pointers recorded are formed as by Instance.find_obj_by_prop().  The
+    index does not follow changes to the document; it must be rebuilt after 
+    the document is modified.  
+    """
+
+    def __init__(self, data):
+        """
+        build the index for the given JSON data
+        """
+        self._index = {}
+        stack = [("", data)]
+        while stack:
+            (path, node) = stack.pop()
+            if isinstance(node, dict):
+                ptr = path or "/"
+                for prop in node:
+                    self._index.setdefault(prop, []).append((ptr, node))
+                children = [("/".join([path,prop]), node[prop]) 
+                            for prop in node
+                            if isinstance(node[prop], (dict, list))]
+            elif isinstance(node, list):
+                children = [("/".join([path,str(i)]), node[i])
+                            for i in xrange(len(node))
+                            if isinstance(node[i], (dict, list))]
+            else:
+                continue
+
+            # visit the children in order (as the recursive search does)
+            children.reverse()
+            stack.extend(children)
+
+    def objects_with(self, name):
+        """
+        return a list of pointer-object tuples for the objects that contain 
+        a property with the given name, in document order.
+        """
+        return list(self._index.get(name, []))
+
+    def names(self):
+        """
+        return the property names that appear in the document
+        """
+        return self._index.keys()
+
+    def __contains__(self, name):
+        return name in self._index
+
+    def __len__(self):
+        return len(self._index)
+
 class Instance(object):
     """
     a class that helps interact with JSON instances that leverage features 
     of extended JSON schemas
     """
 
-    def __init__(self, data, srcloc=None, srcid=None, jptr="/"):
+    def __init__(self, data, srcloc=None, srcid=None, jptr="/", 
+                 indexed=False):
         """
         initialize the Instance wrapper
 
@@ -39,21 +349,28 @@ class Instance(object):
         :argument str jptr:    the JSON Pointer within the source file that 
                                   points to the given data.  If not given, it 
                                   can be assumed that the pointer is "/".  
+        :argument bool indexed: if True, the find_* methods will use a 
+                                  PropertyIndex of the data (built on first 
+                                  use) rather than searching the data each 
+                                  time; see property_index().
         """
         self.data = data
         self._srcid = srcid
         self._srcloc = srcloc
         self._ptr = jptr
+        self.indexed = indexed
+        self._index = None
 
         if isinstance(self.data, dict):
             if not self._srcid:
                 self._srcid = self.data.get('id')
 
     @classmethod
-    def from_location(cls, loc):
+    def from_location(cls, loc, indexed=False):
         """
         Open the source location (either a file or a URL) and load its
-        JSON data into an Instance instance
+        JSON data into an Instance instance.  See the constructor for the 
+        meaning of indexed.
         """
         data = None
         url = urlparse(loc)
@@ -63,23 +380,14 @@ class Instance(object):
         if not url.scheme:
             # it's a file
             with open(loc) as fd:
-                data = json.load(fd)
-        elif (
-            scheme in [u"http", u"https"] and
-            requests and
-            getattr(requests.Response, "json", None) is not None
-        ):
-            # Requests has support for detecting the correct encoding of
-            # json over http
-            if callable(requests.Response.json):
-                data = requests.get(loc).json()
-            else:
-                data = requests.get(loc).json
+                data = jsonbackend.load(fd)
+        elif url.scheme in ("http", "https"):
+            data = _remote.shared_loader().fetch(loc)
         else: 
             # Otherwise, pass off to urllib and assume utf-8
-            data = json.loads(urlopen(uri).read().decode("utf-8"))
+            data = jsonbackend.loads(urlopen(loc).read().decode("utf-8"))
 
-        return Instance(data, loc)
+        return Instance(data, loc, indexed=indexed)
 
 
 
@@ -106,6 +414,23 @@ class Instance(object):
         """
         return self._ptr
 
+    def property_index(self):
+        """
+        return the PropertyIndex for the wrapped data, building it if 
+        necessary.  
+        """
+        if self._index is None:
+            self._index = PropertyIndex(self.data)
+        return self._index
+
+    def invalidate_index(self):
+        """
+        drop the PropertyIndex for the wrapped data so that it will be 
+        rebuilt when next needed.  This should be called after the data is
+        modified.  
+        """
+        self._index = None
+
     def find_data_by_name(self, name):
         """
         return a list of pointer-value tuples that match a given name.  
@@ -118,6 +443,10 @@ class Instance(object):
         pointer of the wrapped data object.  Note that the last token in the 
         returned pointer will be the given name.  
         """
+        if self.indexed:
+            return [(((ptr != "/" and ptr) or "") + "/" + name, obj[name])
+                    for ptr, obj in self.property_index().objects_with(name)]
+
         out = []
         self._find_prop_by_name(name, self.data, out)
         return out
@@ -162,6 +491,9 @@ class Instance(object):
         itself.  The returned pointers are assumed to be relative to the 
         pointer to the set pointer of the wrapped data object.   
         """
+        if self.indexed:
+            return self.property_index().objects_with(name)
+
         out = []
         self._find_obj_by_prop(name, self.data, out)
         return out
@@ -178,9 +510,82 @@ class Instance(object):
         """
         return self.find_obj_by_prop(EXTSCHEMAS)
 
+    def iter_data_by_name(self, name, aspath=False):
+        """
+        iterate through the values of the properties with the given name, 
+        in document order.  This is a lazy version of find_data_by_name():
+        each value is returned with the JSON Pointer to it (properly 
+        escaped), and the search can be stopped early.  
+
+        :argument str name:    the property name to look for
+        :argument bool aspath: if True, return the paths to the values as 
+                               tuples of tokens rather than as pointers
+        """
+        for path, node in walk(self.data):
+            if isinstance(node, dict) and name in node:
+                path += (name,)
+                if not aspath:
+                    path = pointer_from_path(path)
+                yield (path, node[name])
+
+    def iter_obj_by_prop(self, name, aspath=False):
+        """
+        iterate through the objects that contain a property with the given
+        name, in document order.  This is a lazy version of 
+        find_obj_by_prop():  each object is returned with the JSON Pointer 
+        to it (properly escaped), and the search can be stopped early.  
+
+        :argument str name:    the property name to look for
+        :argument bool aspath: if True, return the paths to the objects as 
+                               tuples of tokens rather than as pointers
+        """
+        for path, node in walk(self.data):
+            if isinstance(node, dict) and name in node:
+                if not aspath:
+                    path = pointer_from_path(path)
+                yield (path, node)
+
+    def iter_extended_objs(self, aspath=False):
+        """
+        iterate through the objects that contain the "$extensionSchemas" 
+        property; this is a lazy version of find_extended_objs().  
+        """
+        return self.iter_obj_by_prop(EXTSCHEMAS, aspath)
+
+    def has_extensions(self):
+        """
+        return True if any object in the data contains the 
+        "$extensionSchemas" property.  The search stops at the first one 
+        found.
+        """
+        for found in self.iter_extended_objs(True):
+            return True
+        return False
+
     def extract(self, jptr):
         """
-        return the data pointed to by given JSON Pointer
+        return the data pointed to by given JSON Pointer.  The pointer may 
+        be given as a string or as a CompiledPointer; strings are compiled 
+        once and cached (see compile_pointer()).  
+
+        :exc `ExtractError` if the pointer does not refer to a value in the
+                            data
+        """
+        return compile_pointer(jptr).extract(self.data)
+
+    def extract_many(self, pointers, default=_NOTSET):
+        """
+        return a list of the data pointed to by each of the given JSON 
+        Pointers, in order.  The values are found in a single descent 
+        through the data, following the paths that the pointers share only
+        once (see PointerSet).  
+
+        :argument list pointers:  the JSON Pointers
+        :argument default:  the value to return for any pointer that does 
+                            not refer to a value; if not given, an exception
+                            is raised instead.
+        :exc `ExtractError` if a pointer does not refer to a value in the 
+                            data and no default is given
         """
-        return jsonspec.pointer.extract(self.data, jptr)
+        return compile_pointers(pointers).extract(self.data, default)
 
@@ -0,0 +1,129 @@
+"""
+a module that selects the JSON decoder used throughout xjs.
+
+The standard library's json module is used by default.  A faster decoder 
+(see PREFERENCE) can be chosen by setting the XJS_JSON_BACKEND environment
+variable to a backend name or by calling use_backend().
+
+For valid documents, all backends give the same results as the json 
+module: objects with duplicate keys keep the last value, strings are 
+decoded as unicode, integers as int or long, and other numbers as float.  
+Where a faster backend cannot guarantee this (e.g. for integers too large 
+for 64 bits, or for the NaN and Infinity extensions), it fails, and the 
+document is decoded again with the json module, which also provides the 
+error messages for invalid documents.  
+
+The backends listed in LENIENT do not check their input as strictly as the
+json module:  ujson accepts some invalid documents (e.g. numbers with 
+leading zeros or incomplete exponents, or strings containing raw control 
+characters) and drops unpaired UTF-16 surrogate escapes from strings.  Use
+them only for documents already known to be valid.
+"""
+import os, json, warnings
+
+# the name of the environment variable that selects the backend
+ENV_VAR = "XJS_JSON_BACKEND"
+
+# the supported backends, fastest first
+PREFERENCE = [ "ujson", "simplejson", "json" ]
+
+# the backend used unless another is selected
+DEFAULT = "json"
+
+# the backends that accept some invalid documents
+LENIENT = [ "ujson" ]
+
+def _ujson():
+    import ujson
+    return ujson.loads
+
+def _simplejson():
+    import simplejson
+    decoder = simplejson.JSONDecoder()
+    def loads(text):
+        # simplejson only produces unicode strings from unicode input
+        if not isinstance(text, unicode):
+            text = text.decode("utf-8")
+        return decoder.decode(text)
+    return loads
+
+def _json():
+    return json.loads
+
+_factories = { "ujson": _ujson, "simplejson": _simplejson, "json": _json }
+
+def available_backends():
+    """
+    return the names of the backends that can be used in this environment,
+    fastest first
+    """
+    out = []
+    for name in PREFERENCE:
+        try:
+            _factories[name]()
+            out.append(name)
+        except ImportError:
+            pass
+    return out
+
+_name = None
+_loads = json.loads
+
+def use_backend(name=None):
+    """
+    select the JSON backend to use.
+
+    :argument str name:  the name of the backend (one of PREFERENCE); if
+                         None, the default (DEFAULT) is selected.
+    :exc `ValueError` if the name is not a supported backend
+    :exc `ImportError` if the backend is not available
+    """
+    global _name, _loads
+    if name is None:
+        name = DEFAULT
+    if name not in _factories:
+        raise ValueError("Unsupported JSON backend: " + name)
+    _loads = _factories[name]()
+    _name = name
+
+def backend_name():
+    """
+    return the name of the JSON backend in use
+    """
+    return _name
+
+def loads(text):
+    """
+    decode a JSON document
+
+    :argument str text:  the JSON document, as a UTF-8-encoded str or as
+                         unicode
+    :exc `ValueError` if the text is not valid JSON
+    """
+    if _name == "json":
+        return json.loads(text)
+    try:
+        return _loads(text)
+    except (ValueError, OverflowError), ex:
+        return json.loads(text)
+
+def load(fd):
+    """
+    decode the JSON document read from the given file stream
+
+    :exc `ValueError` if the stream does not contain valid JSON
+    """
+    return loads(fd.read())
+
+def _init():
+    name = os.environ.get(ENV_VAR)
+    if name:
+        try:
+            use_backend(name)
+            return
+        except (ValueError, ImportError), ex:
+            warnings.warn("{0}={1}: {2}; using the default"
+                          .format(ENV_VAR, name, str(ex)))
+    use_backend()
+
+_init()
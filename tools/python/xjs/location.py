@@ -2,10 +2,21 @@
 a module for determining the location of a JSON schema based on its URI.  
 This includes the ability to make use of copies of the schema documents on 
 local disk.
+
+Besides exact URI-to-location mappings, location files may contain prefix 
+rules:  a URI ending in "*" matches any URI that starts with the part 
+before the "*".  The rest of the matched URI replaces the "*" in the 
+rule's location, or, if the location does not contain a "*", is appended 
+to it.  For example, the rule
+
+    http://mgi.nist.gov/json/*   /mirror/json/*.json
+
+maps http://mgi.nist.gov/json/res-md/v1.0 to /mirror/json/res-md/v1.0.json.
+Any fragment on the URI is ignored when a rule is applied.
 """
 from __future__ import with_statement
 import sys, os, json
-from urlparse import urlparse
+from urlparse import urlparse, urldefrag
 
 def parse_mappings_asjson(fd):
     """
@@ -128,6 +139,9 @@ class LocationReader(object):
         # turn simple file URIs into paths; turn relative paths into 
         # absolute ones
         for uri, loc in out.iteritems():
+            if is_prefix_rule(uri) and WILDCARD not in loc:
+                loc += WILDCARD
+                out[uri] = loc
             locurl = urlparse(loc, scheme='file')
             if locurl.scheme == 'file' and not locurl.netloc:
                 loc = locurl.path
@@ -158,3 +172,121 @@ def read_loc_file(locfile, fmt=None, basedir=None):
     """
     return LocationReader(basedir).read(locfile, fmt)
 
+WILDCARD = "*"
+
+def is_prefix_rule(uri):
+    """
+    return True if the given URI from a location mapping is a prefix rule 
+    (i.e. ends with "*")
+    """
+    return uri.endswith(WILDCARD)
+
+def split_rules(mappings):
+    """
+    separate the prefix rules from the exact mappings in a dictionary of 
+    URI-location mappings.
+
+    :return tuple: a 2-tuple of dictionaries containing the exact mappings 
+                   and the rules, respectively.  The keys of the latter are
+                   the URI prefixes (without the "*").
+    """
+    exact = {}
+    rules = {}
+    for uri, loc in mappings.iteritems():
+        if is_prefix_rule(uri):
+            rules[uri[:-len(WILDCARD)]] = loc
+        else:
+            exact[uri] = loc
+    return (exact, rules)
+
+def expand_template(template, rest):
+    """
+    return the location given by a prefix rule's location template for the
+    part of a URI following the rule's prefix.  
+
+    :exc `KeyError` if rest would lead outside of the location given by 
+                    the template (i.e. it contains a ".." segment)
+    """
+    if ".." in rest.split("/"):
+        raise KeyError(rest)
+    if WILDCARD not in template:
+        return template + rest
+    return template.replace(WILDCARD, rest, 1)
+
+class PrefixIndex(object):
+    """
+    an index of URI prefix rules that finds the longest prefix matching a 
+    URI in time proportional to the URI's length.
+    """
+    _VALUE = None   # the key in a trie node holding the rule's template
+
+    def __init__(self, rules=None):
+        """
+        create the index
+
+        :argument dict rules:  a mapping of URI prefixes to location 
+                               templates to load into the index
+        """
+        self._root = {}
+        self._size = 0
+        if rules:
+            for prefix, template in rules.iteritems():
+                self.add(prefix, template)
+
+    def add(self, prefix, template):
+        """
+        add a rule to the index, replacing any with the same prefix
+        """
+        node = self._root
+        for c in prefix:
+            node = node.setdefault(c, {})
+        if self._VALUE not in node:
+            self._size += 1
+        node[self._VALUE] = (prefix, template)
+
+    def longest_match(self, uri):
+        """
+        return the rule with the longest prefix matching the given URI as 
+        a 2-tuple of the prefix and template, or None if no rule matches.
+        """
+        node = self._root
+        out = node.get(self._VALUE)
+        for c in uri:
+            node = node.get(c)
+            if node is None:
+                break
+            out = node.get(self._VALUE, out)
+        return out
+
+    def locate(self, uri):
+        """
+        return the location for the given URI according to the rule with 
+        the longest matching prefix.  The URI's fragment, if any, is not 
+        included in the location.
+
+        :exc `KeyError` if no rule applies to the URI
+        """
+        uri = urldefrag(uri)[0]
+        rule = self.longest_match(uri)
+        if rule is None:
+            raise KeyError(uri)
+        return expand_template(rule[1], uri[len(rule[0]):])
+
+    def rules(self):
+        """
+        return the rules in the index as a dictionary of prefixes to 
+        templates
+        """
+        out = {}
+        stack = [self._root]
+        while stack:
+            node = stack.pop()
+            for c, child in node.iteritems():
+                if c is self._VALUE:
+                    out[child[0]] = child[1]
+                else:
+                    stack.append(child)
+        return out
+
+    def __len__(self):
+        return self._size
@@ -0,0 +1,275 @@
+"""
+a module that provides a store of schema locations kept in an SQLite
+database, for catalogs too large to read into memory from a location file
+at start-up (see the location module).
+
+A location database holds the same URI-location mappings (including prefix
+rules) as a location file, indexed by URI so that each lookup reads only the
+row it needs.  It can optionally also hold the parsed forms of the schema
+files it refers to, so that a new process need not parse them again.  A
+DBSchemaLoader uses such a database as a drop-in replacement for a
+SchemaLoader's in-memory mappings; convert_location_file() creates a
+database from a location file (see also the locdb script).
+"""
+from __future__ import with_statement
+import os, marshal, sqlite3, threading
+from urlparse import urlparse
+
+from .location import read_loc_file, split_rules
+from .schemaloader import SchemaLoader
+
+_SCHEMA = [
+    "CREATE TABLE IF NOT EXISTS locations (uri TEXT PRIMARY KEY, "
+                                          "location TEXT NOT NULL)",
+    "CREATE TABLE IF NOT EXISTS prefixes (prefix TEXT PRIMARY KEY, "
+                                         "template TEXT NOT NULL)",
+    "CREATE TABLE IF NOT EXISTS schemes (scheme TEXT PRIMARY KEY)",
+    "CREATE TABLE IF NOT EXISTS parsed (path TEXT PRIMARY KEY, "
+                      "mtime REAL NOT NULL, size INTEGER NOT NULL, "
+                      "data BLOB NOT NULL)"
+]
+
+class LocationDB(object):
+    """
+    an SQLite database of URI-location mappings and, optionally, parsed
+    schema documents.  An instance may be shared by several threads.
+    """
+
+    def __init__(self, dbfile):
+        """
+        open the database, creating it if necessary.
+
+        :argument str dbfile:  the path to the database file
+        """
+        self.path = dbfile
+        self._conn = sqlite3.connect(dbfile, check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._lock:
+            with self._conn:
+                for stmt in _SCHEMA:
+                    self._conn.execute(stmt)
+
+    def _query(self, sql, args=()):
+        with self._lock:
+            return self._conn.execute(sql, args).fetchall()
+
+    def locate(self, uri):
+        """
+        return the location mapped to the given URI (not considering prefix
+        rules)
+
+        :exc `KeyError` if the URI is not mapped
+        """
+        rows = self._query("SELECT location FROM locations WHERE uri = ?",
+                           (uri,))
+        if not rows:
+            raise KeyError(uri)
+        return rows[0][0]
+
+    def __contains__(self, uri):
+        return bool(self._query("SELECT 1 FROM locations WHERE uri = ?",
+                                (uri,)))
+
+    def __len__(self):
+        return self._query("SELECT count(*) FROM locations")[0][0]
+
+    def iterURIs(self, batch=1000):
+        """
+        return an iterator for the URIs mapped in the database.  The URIs
+        are read in batches, in sorted order.
+        """
+        last = None
+        while True:
+            if last is None:
+                rows = self._query("SELECT uri FROM locations ORDER BY uri "
+                                   "LIMIT ?", (batch,))
+            else:
+                rows = self._query("SELECT uri FROM locations WHERE uri > ? "
+                                   "ORDER BY uri LIMIT ?", (last, batch))
+            for row in rows:
+                yield row[0]
+            if len(rows) < batch:
+                return
+            last = rows[-1][0]
+
+    def prefix_rules(self):
+        """
+        return the prefix rules in the database as a dictionary mapping URI
+        prefixes to location templates (see the location module).
+        """
+        return dict(self._query("SELECT prefix, template FROM prefixes"))
+
+    def schemes(self):
+        """
+        return the set of URI schemes used by the URIs in the database
+        """
+        return set([r[0] for r in self._query("SELECT scheme FROM schemes")])
+
+    def add_locations(self, urilocs):
+        """
+        add all the URI-location mappings in the given dictionary, replacing
+        any existing mappings for the same URIs.  URIs ending in "*" are
+        added as prefix rules.
+        """
+        (exact, rules) = split_rules(urilocs)
+        schemes = set([urlparse(u).scheme for u in urilocs])
+        with self._lock:
+            with self._conn:
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO locations VALUES (?, ?)",
+                    exact.iteritems())
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO prefixes VALUES (?, ?)",
+                    rules.iteritems())
+                self._conn.executemany(
+                    "INSERT OR IGNORE INTO schemes VALUES (?)",
+                    [(s,) for s in schemes])
+
+    def load_parsed(self, path, mtime, size):
+        """
+        return the parsed schema document saved for the file at the given
+        path, or None if none is saved or the file has changed since.
+
+        :argument str path:    the absolute path to the schema file
+        :argument float mtime: the file's current modification time
+        :argument int size:    the file's current size
+        """
+        rows = self._query("SELECT mtime, size, data FROM parsed "
+                           "WHERE path = ?", (path,))
+        if not rows or (rows[0][0], rows[0][1]) != (mtime, size):
+            return None
+        try:
+            return marshal.loads(str(rows[0][2]))
+        except (ValueError, EOFError, TypeError), ex:
+            return None
+
+    def save_parsed(self, path, mtime, size, schema):
+        """
+        save the parsed schema document read from the file at the given path
+        """
+        data = sqlite3.Binary(marshal.dumps(schema))
+        with self._lock:
+            with self._conn:
+                self._conn.execute("INSERT OR REPLACE INTO parsed VALUES "
+                                   "(?, ?, ?, ?)", (path, mtime, size, data))
+
+    def clear_parsed(self):
+        """
+        remove all the saved parsed schema documents
+        """
+        with self._lock:
+            with self._conn:
+                self._conn.execute("DELETE FROM parsed")
+
+    def close(self):
+        """
+        close the database
+        """
+        with self._lock:
+            self._conn.close()
+
+class DBSchemaLoader(SchemaLoader):
+    """
+    a SchemaLoader whose URI-location mappings are kept in a LocationDB
+    rather than in memory.  Mappings added via add_location(s) are written
+    to the database.
+    """
+
+    def __init__(self, db, cache=None, remote=None, save_parsed=True):
+        """
+        create the loader
+
+        :argument db:  the LocationDB to use, or the path to its file
+        :argument ParsedSchemaCache cache:  see SchemaLoader
+        :argument RemoteLoader remote:      see SchemaLoader
+        :argument bool save_parsed:  if True, schemas parsed from local files
+                       are saved in the database, and saved ones are used
+                       in place of files that have not changed.
+        """
+        SchemaLoader.__init__(self, cache=cache, remote=remote)
+        if not isinstance(db, LocationDB):
+            db = LocationDB(db)
+        self.db = db
+        self.save_parsed = save_parsed
+        for prefix, template in db.prefix_rules().iteritems():
+            self._prefixes.add(prefix, template)
+        self._schemes = db.schemes()
+
+    def locate(self, uri):
+        """
+        return the location of the schema for the given URI.  Exact
+        mappings take precedence over prefix rules; among the rules, the one
+        with the longest matching prefix is used.
+
+        :exc `KeyError` if the location of the schema has not been set, or 
+                        if the only matching prefix rule gives a file path
+                        that does not exist
+        """
+        try:
+            return self.db.locate(uri)
+        except KeyError:
+            if not self._prefixes:
+                raise
+            return self._locate_by_rule(uri)
+
+    def iterURIs(self):
+        """
+        return an iterator for the uris mapped in the database (not
+        including those only matched by prefix rules)
+        """
+        return self.db.iterURIs()
+
+    def __len__(self):
+        return len(self.db)
+
+    def add_locations(self, urifiles):
+        """
+        add all the URI-file mappings in the given dictionary to the
+        database
+        """
+        self.db.add_locations(urifiles)
+        for prefix, template in split_rules(urifiles)[1].iteritems():
+            self._prefixes.add(prefix, template)
+        self._addschemes(urifiles)
+
+    def _load_location(self, loc):
+        if not self.save_parsed or urlparse(loc).scheme or \
+           (self._cache is not None and os.path.abspath(loc) in self._cache):
+            return SchemaLoader._load_location(self, loc)
+
+        path = os.path.abspath(loc)
+        try:
+            st = os.stat(path)
+        except OSError, ex:
+            raise IOError(ex.errno, ex.strerror, path)
+        out = self.db.load_parsed(path, st.st_mtime, st.st_size)
+        if out is None:
+            out = SchemaLoader._load_location(self, loc)
+            self.db.save_parsed(path, st.st_mtime, st.st_size, out)
+        elif self._cache is not None:
+            # share it like a document parsed from the file
+            self._cache.store(path, st.st_mtime, st.st_size, out)
+        return out
+
+def convert_location_file(locfile, dbfile, fmt=None, basedir=None):
+    """
+    add the mappings in a location file to a location database, creating
+    the database if necessary.  As when reading the location file directly,
+    relative file locations are converted to absolute paths.
+
+    :argument str locfile:  the path to the location file to convert
+    :argument str dbfile:   the path to the database file
+    :argument str fmt:      the format of the location file (see
+                            location.read_loc_file())
+    :argument str basedir:  the base directory that relative file locations
+                            are relative to; if not given, the directory
+                            containing the location file is assumed.
+    :return int:  the number of mappings added
+    """
+    locs = read_loc_file(locfile, fmt, basedir)
+    db = LocationDB(dbfile)
+    try:
+        db.add_locations(locs)
+    finally:
+        db.close()
+    return len(locs)
@@ -0,0 +1,150 @@
+"""
+a module that provides support for taking a snapshot of remote schemas so
+that they can be used without network access.
+
+mirror() starts from a set of schema URIs and/or instance documents, fetches
+the schemas they refer to, transitively, and writes them into a directory
+along with a schema location file (SCHEMA_LOCATION_FILE) and an index
+(SCHEMA_INDEX_FILE), optionally packing them into a bundle as well (see the
+bundle module).  SchemaLoader.from_directory() can then serve all of the
+schemas from that directory.
+"""
+from __future__ import with_statement
+import os, re, json
+from urlparse import urlsplit, urldefrag
+
+import jsonschema as jsch
+
+from .schemaloader import (SchemaLoader, DirectorySchemaCache,
+                           schema_dependencies, SCHEMA_LOCATION_FILE,
+                           SCHEMA_INDEX_FILE)
+from .bundle import write_bundle
+from .instance import EXTSCHEMAS
+
+_UNSAFE_RE = re.compile(r"[^\w.-]+")
+
+def schemas_for_document(doc):
+    """
+    return the URIs of the schemas that an instance document refers to via
+    "$schema" or "$extensionSchemas" (including those in its subdocuments)
+    """
+    out = []
+    if isinstance(doc.get("$schema"), basestring):
+        out.append(urldefrag(doc["$schema"])[0])
+    for dep in schema_dependencies(doc, ""):
+        if dep not in out:
+            out.append(dep)
+    return out
+
+def mirror_filename(uri):
+    """
+    return a relative file path for storing the schema with the given URI
+    in a mirror directory, made up of the URI's host name and path
+    """
+    parts = urlsplit(urldefrag(uri)[0])
+    path = parts.path
+    if not path or path.endswith('/'):
+        path += "index"
+    if parts.query:
+        path += "_" + parts.query
+    segs = [_UNSAFE_RE.sub("_", s) for s in [parts.netloc or parts.scheme] +
+                                            path.split('/')]
+    segs = [s for s in segs if s and s not in ('.', '..')]
+    out = "/".join(segs)
+    if not out.endswith(".json"):
+        out += ".json"
+    return out
+
+def _is_metaschema(uri):
+    return uri in jsch.validators.meta_schemas or \
+           uri+'#' in jsch.validators.meta_schemas
+
+def mirror(seeds, dirpath, loader=None, workers=8, bundlefile=None,
+           locfile=SCHEMA_LOCATION_FILE):
+    """
+    fetch the given schemas and those they depend on, transitively, and
+    write them into a directory.  The JSON Schema meta-schemas, which are
+    built into the validator, are not included.  Schemas already listed in
+    the directory's location file are kept.
+
+    :argument list seeds:   the URIs of schemas and/or the parsed instance
+                            documents to start from
+    :argument str dirpath:  the directory to write to; it is created if
+                            necessary.
+    :argument SchemaLoader loader:  the loader to retrieve schemas with; if
+                            None, schemas are retrieved from their URIs.
+    :argument int workers:  the maximum number of schemas to fetch at once
+    :argument str bundlefile:  if given, the path to a bundle file to write
+                            the mirrored schemas to as well
+    :argument str locfile:  the name of the location file to write in the
+                            directory
+    :return tuple: a 2-tuple of a dictionary mapping the URIs of the
+                   mirrored schemas to their paths relative to dirpath and
+                   a list of the URIs of the schemas that could not be
+                   retrieved
+    """
+    if loader is None:
+        loader = SchemaLoader(cache=False)
+
+    uris = []
+    for seed in seeds:
+        if isinstance(seed, dict):
+            uris.extend(schemas_for_document(seed))
+        else:
+            uris.append(seed)
+
+    docs = {}
+    for uri in uris:
+        if not _is_metaschema(uri) and uri.rstrip('#') not in docs:
+            for u, doc in loader.prefetch(uri, workers).iteritems():
+                docs[u.rstrip('#')] = doc
+
+    # a schema is missing if it was needed but not retrieved
+    missing = set([u.rstrip('#') for u in uris])
+    for u, doc in docs.iteritems():
+        missing.update(schema_dependencies(doc, u))
+    missing = sorted([u for u in missing
+                        if u not in docs and not _is_metaschema(u)])
+
+    if not os.path.isdir(dirpath):
+        os.makedirs(dirpath)
+    locpath = os.path.join(dirpath, locfile)
+    locs = {}
+    if os.path.exists(locpath):
+        with open(locpath) as fd:
+            locs = json.load(fd)
+
+    used = set(locs.values())
+    for uri in sorted(docs.keys()):
+        doc = docs[uri]
+        filename = locs.get(uri)
+        if filename is None:
+            filename = mirror_filename(uri)
+            (base, ext) = os.path.splitext(filename)
+            i = 1
+            while filename in used:
+                i += 1
+                filename = "%s-%d%s" % (base, i, ext)
+        used.add(filename)
+
+        path = os.path.join(dirpath, filename)
+        if not os.path.isdir(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        with open(path, "w") as fd:
+            json.dump(doc, fd, indent=2, separators=(',', ': '))
+
+        locs[uri] = filename
+        id = doc.get("id")
+        if isinstance(id, basestring) and urldefrag(id)[0] != uri:
+            locs[urldefrag(id)[0]] = filename
+
+    with open(locpath, "w") as fd:
+        json.dump(locs, fd, indent=2, separators=(',', ': '), sort_keys=True)
+
+    # build the index of the directory so that it need not be scanned again
+    DirectorySchemaCache(dirpath, SCHEMA_INDEX_FILE).locations()
+
+    if bundlefile:
+        write_bundle(bundlefile, docs)
+
+    return (dict([(u, locs[u]) for u in docs]), missing)
@@ -0,0 +1,170 @@
+"""
+a module that provides support for evaluating schema keywords in order of
+their estimated cost.
+
+jsonschema evaluates the keywords of a (sub-)schema in the order they
+appear in the schema object.  When all we want is the first error (as when
+raising a ValidationError), it pays to run cheap checks like "type" and
+"required" before expensive ones like "pattern", "oneOf", or "$ref" so that
+an invalid instance is rejected as early as possible.
+"""
+import threading
+from jsonschema.compat import iteritems
+from .cache import LRUCache, is_transient
+
+# estimated relative cost of each keyword; keywords that descend into the
+# instance or into other schemas are the most expensive.
+KEYWORD_COSTS = {
+    u"type":                  0,
+    u"enum":                  1,
+    u"required":              1,
+    u"minProperties":         1,
+    u"maxProperties":         1,
+    u"minItems":              1,
+    u"maxItems":              1,
+    u"minLength":             2,
+    u"maxLength":             2,
+    u"minimum":               2,
+    u"maximum":               2,
+    u"multipleOf":            2,
+    u"uniqueItems":           3,
+    u"dependencies":          3,
+    u"format":                4,
+    u"pattern":               5,
+    u"additionalProperties":  6,
+    u"properties":            6,
+    u"items":                 6,
+    u"additionalItems":       6,
+    u"patternProperties":     7,
+    u"not":                   8,
+    u"allOf":                 8,
+    u"anyOf":                 9,
+    u"oneOf":                 9,
+    u"$ref":                 10
+}
+
+# the cost assumed for keywords not listed in KEYWORD_COSTS
+DEFAULT_COST = 5
+
+def keyword_cost(keyword, value=None):
+    """
+    return the estimated relative cost of evaluating a schema keyword.
+
+    :argument str keyword:  the schema keyword
+    :argument value:        the keyword's value in the schema
+    """
+    out = KEYWORD_COSTS.get(keyword, DEFAULT_COST)
+    if keyword == u"enum" and isinstance(value, list) and len(value) > 16:
+        # long enumerations require a linear search
+        out += 2
+    return out
+
+def order_keywords(schema):
+    """
+    return the keyword-value pairs of a schema as a list sorted by their
+    estimated cost.  Keywords of equal cost keep their original order.
+    """
+    items = list(iteritems(schema))
+    items.sort(key=lambda kv: keyword_cost(*kv))
+    return items
+
+class KeywordOrder(object):
+    """
+    a cache of the cost-ordered keywords of the schemas seen during
+    validation.  A cache may be shared by threads.
+    """
+
+    def __init__(self, maxsize=4096):
+        """
+        create the cache
+
+        :argument int maxsize:  the maximum number of orderings to cache; the
+                                least recently used are dropped first.  If 
+                                None, the number is not limited.
+        """
+        self._cache = LRUCache(maxsize, sizeof=None, lock=threading.Lock())
+
+    def items(self, schema):
+        """
+        return the cost-ordered keyword-value pairs for the given schema.  
+        Transient schemas (see cache.TransientDict) are ordered afresh each
+        time.
+        """
+        if is_transient(schema):
+            return order_keywords(schema)
+
+        hit = self._cache.get(id(schema))
+        if hit is not None and hit[0] is schema:
+            return hit[1]
+
+        # hold on to the schema so that its id is not reused
+        out = order_keywords(schema)
+        self._cache[id(schema)] = (schema, out)
+        return out
+
+    def clear(self):
+        """
+        forget all cached orderings
+        """
+        self._cache.clear()
+
+    def stats(self):
+        """
+        return statistics describing the use of the cache (see 
+        cache.LRUCache.stats())
+        """
+        return self._cache.stats()
+
+    def __len__(self):
+        return len(self._cache)
+
+def ordered_validator(cls, order):
+    """
+    return a new validator class that extends the given jsonschema validator
+    class so that the keywords of each (sub-)schema are evaluated in order of
+    estimated cost.
+
+    :argument type cls:  the jsonschema validator class to extend
+    :argument KeywordOrder order:  the cache of orderings to use
+    """
+    class OrderedValidator(cls):
+
+        def iter_errors(self, instance, _schema=None):
+            # this follows jsonschema's iter_errors (v2.5.1), except for
+            # the ordering of the keywords
+            if _schema is None:
+                _schema = self.schema
+
+            scope = _schema.get(u"id")
+            if scope:
+                self.resolver.push_scope(scope)
+            try:
+                ref = _schema.get(u"$ref")
+                if ref is not None:
+                    validators = [(u"$ref", ref)]
+                else:
+                    validators = order.items(_schema)
+
+                for k, v in validators:
+                    validator = self.VALIDATORS.get(k)
+                    if validator is None:
+                        continue
+
+                    errors = validator(self, v, instance, _schema) or ()
+                    for error in errors:
+                        # set details if not already set by the called fn
+                        error._set(
+                            validator=k,
+                            validator_value=v,
+                            instance=instance,
+                            schema=_schema,
+                        )
+                        if k != u"$ref":
+                            error.schema_path.appendleft(k)
+                        yield error
+            finally:
+                if scope:
+                    self.resolver.pop_scope()
+
+    OrderedValidator.__name__ = "Ordered" + cls.__name__
+    return OrderedValidator
@@ -0,0 +1,328 @@
+"""
+a module for retrieving schemas from remote (http/https) locations.
+
+Fetching is done through a pooled requests.Session (when the requests
+package is available) with configurable timeouts and retries.  Retrieved
+documents can be saved in an on-disk cache; cached documents are reused
+without contacting the server while they are fresh according to the
+server's Cache-Control (or Expires) headers and are revalidated with
+conditional requests (via ETag and Last-Modified) afterward.
+"""
+from __future__ import with_statement
+import os, json, time, errno, hashlib, threading, urllib2
+from email.utils import parsedate_tz, mktime_tz
+
+from . import jsonbackend
+
+try:
+    import requests
+    from requests.adapters import HTTPAdapter
+except ImportError:
+    requests = None
+
+# responses with these status codes are retried
+RETRY_STATUSES = (500, 502, 503, 504)
+
+# responses with these status codes mean the document does not exist
+NOT_FOUND_STATUSES = (404, 410)
+
+class NotFoundError(IOError, KeyError):
+    """
+    an error indicating that the server reported that there is no document
+    at a URL.  As a KeyError, it lets schema loaders treat the document as
+    missing rather than as unavailable.
+    """
+    pass
+
+def _cache_control(value):
+    # parse a Cache-Control header into a dictionary
+    out = {}
+    for directive in (value or "").split(","):
+        directive = directive.strip().lower()
+        if not directive:
+            continue
+        if "=" in directive:
+            name, val = directive.split("=", 1)
+            out[name.strip()] = val.strip().strip('"')
+        else:
+            out[directive] = True
+    return out
+
+def freshness(headers, now):
+    """
+    return the time until which a response with the given headers may be
+    used without revalidation, or None if the response must not be cached
+    at all.
+
+    :argument dict headers:  the response headers, with lower-case names
+    :argument float now:     the time the response was received
+    """
+    cc = _cache_control(headers.get("cache-control"))
+    if "no-store" in cc:
+        return None
+    if "no-cache" in cc:
+        return now
+    if "max-age" in cc:
+        try:
+            return now + int(cc["max-age"])
+        except ValueError:
+            return now
+    if headers.get("expires"):
+        parsed = parsedate_tz(headers["expires"])
+        if parsed:
+            return mktime_tz(parsed)
+    return now
+
+class RemoteLoader(object):
+    """
+    a class for fetching JSON documents from http(s) URLs with connection
+    pooling, retries, and an optional disk cache.
+    """
+
+    def __init__(self, cachedir=None, timeout=(5.0, 30.0), retries=2,
+                 backoff=0.5, poolsize=10, clock=time.time):
+        """
+        create the loader
+
+        :argument str cachedir:  the directory in which to cache retrieved
+                                 documents; if None, nothing is cached.
+        :argument timeout:       the connect and read timeouts, in seconds,
+                                 as a 2-tuple or a single number for both
+        :argument int retries:   the number of times to retry a request
+                                 that failed to connect or returned a server
+                                 error (5xx) status
+        :argument float backoff: the number of seconds to wait before the
+                                 first retry; this doubles with each retry.
+        :argument int poolsize:  the number of connections to keep open per
+                                 host
+        :argument func clock:    the function to call to get the current time
+        """
+        self.cachedir = cachedir
+        if cachedir and not os.path.isdir(cachedir):
+            os.makedirs(cachedir)
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self._clock = clock
+        self._lock = threading.Lock()
+
+        self._session = None
+        if requests:
+            self._session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=poolsize,
+                                  pool_maxsize=poolsize)
+            self._session.mount("http://", adapter)
+            self._session.mount("https://", adapter)
+
+        self.fetched = 0
+        self.revalidated = 0
+        self.hits = 0
+        self.retried = 0
+
+    def fetch(self, url):
+        """
+        return the parsed JSON document retrieved from the given URL
+
+        :exc `NotFoundError` if the server reports that there is no such 
+                             document
+        :exc `IOError` if the document cannot be retrieved
+        :exc `ValueError` if the document does not contain valid JSON
+        """
+        return jsonbackend.loads(self.fetch_bytes(url))
+
+    def fetch_bytes(self, url):
+        """
+        return the raw contents of the document at the given URL, using the
+        cached copy when it is fresh.
+
+        :exc `NotFoundError` if the server reports that there is no such 
+                             document
+        :exc `IOError` if the document cannot be retrieved
+        """
+        meta = self._cached_meta(url)
+        now = self._clock()
+        if meta and meta.get("expires") is not None and \
+           now < meta["expires"]:
+            body = self._cached_body(url)
+            if body is not None:
+                self._count("hits")
+                return body
+
+        headers = {}
+        if meta:
+            if meta.get("etag"):
+                headers["If-None-Match"] = meta["etag"]
+            if meta.get("last-modified"):
+                headers["If-Modified-Since"] = meta["last-modified"]
+
+        (status, rheaders, body) = self._get(url, headers)
+        now = self._clock()
+        if status == 304 and meta:
+            cached = self._cached_body(url)
+            if cached is not None:
+                self._count("revalidated")
+                self._store(url, rheaders, None, now, meta)
+                return cached
+            # the cached copy disappeared; fetch it unconditionally
+            (status, rheaders, body) = self._get(url, {})
+            now = self._clock()
+
+        if status in NOT_FOUND_STATUSES:
+            self.invalidate(url)
+            raise NotFoundError(errno.ENOENT, "HTTP status %s retrieving "
+                                "document" % status, url)
+        if status != 200:
+            raise IOError(errno.EIO, "HTTP status %s retrieving document" %
+                          status, url)
+        self._count("fetched")
+        self._store(url, rheaders, body, now)
+        return body
+
+    def _count(self, stat):
+        with self._lock:
+            setattr(self, stat, getattr(self, stat) + 1)
+
+    def _get(self, url, headers):
+        # return (status, headers, body) for a GET request, retrying as
+        # configured
+        delay = self.backoff
+        attempt = 0
+        while True:
+            try:
+                (status, rheaders, body) = self._request(url, headers)
+                if status not in RETRY_STATUSES or attempt >= self.retries:
+                    return (status, rheaders, body)
+            except IOError, ex:
+                if attempt >= self.retries:
+                    raise
+            attempt += 1
+            self._count("retried")
+            if delay:
+                time.sleep(delay)
+                delay *= 2
+
+    def _request(self, url, headers):
+        if self._session is not None:
+            resp = self._session.get(url, headers=headers,
+                                     timeout=self.timeout)
+            rheaders = dict([(k.lower(), v) for k, v in resp.headers.items()])
+            return (resp.status_code, rheaders, resp.content)
+
+        # fall back to urllib2 (without connection pooling)
+        timeout = self.timeout
+        if isinstance(timeout, tuple):
+            timeout = max(timeout)
+        try:
+            resp = urllib2.urlopen(urllib2.Request(url, headers=headers),
+                                   timeout=timeout)
+        except urllib2.HTTPError, ex:
+            resp = ex
+        try:
+            rheaders = dict([(k.lower(), v) for k, v in resp.info().items()])
+            return (resp.getcode(), rheaders, resp.read())
+        finally:
+            resp.close()
+
+    def _cachepath(self, url, ext):
+        return os.path.join(self.cachedir,
+                            hashlib.sha1(url).hexdigest() + ext)
+
+    def _cached_meta(self, url):
+        if not self.cachedir:
+            return None
+        try:
+            with open(self._cachepath(url, ".meta")) as fd:
+                meta = json.load(fd)
+            if meta.get("url") != url:
+                return None
+            return meta
+        except (IOError, ValueError), ex:
+            return None
+
+    def _cached_body(self, url):
+        try:
+            with open(self._cachepath(url, ".json"), "rb") as fd:
+                return fd.read()
+        except IOError, ex:
+            return None
+
+    def _store(self, url, headers, body, now, meta=None):
+        # save the document and its caching metadata.  body=None means that
+        # the cached body is still valid.
+        if not self.cachedir:
+            return
+        expires = freshness(headers, now)
+        if expires is None:
+            self.invalidate(url)
+            return
+
+        if meta is None:
+            meta = {}
+        meta = dict(meta)
+        meta.update({ "url": url, "fetched": now, "expires": expires })
+        for name in ("etag", "last-modified"):
+            if headers.get(name):
+                meta[name] = headers[name]
+
+        if body is not None:
+            _write(self._cachepath(url, ".json"), body)
+        _write(self._cachepath(url, ".meta"), json.dumps(meta))
+
+    def invalidate(self, url=None):
+        """
+        remove the cached copy of the document at the given URL.  If url is
+        None, the whole cache is cleared.
+        """
+        if not self.cachedir:
+            return
+        if url is None:
+            paths = [os.path.join(self.cachedir, f)
+                     for f in os.listdir(self.cachedir)
+                     if f.endswith(".json") or f.endswith(".meta")]
+        else:
+            paths = [self._cachepath(url, ".json"),
+                     self._cachepath(url, ".meta")]
+        for path in paths:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def stats(self):
+        """
+        return a dictionary of statistics describing the use of this loader:
+        fetched (full retrievals), revalidated (304 responses), hits (fresh
+        cached copies used without a request), and retried (retried
+        requests)
+        """
+        return { "fetched": self.fetched, "revalidated": self.revalidated,
+                 "hits": self.hits, "retried": self.retried }
+
+    def close(self):
+        """
+        close any open connections
+        """
+        if self._session is not None:
+            self._session.close()
+
+def _write(path, data):
+    # write the data atomically
+    tmp = "%s.%d.%s.tmp" % (path, os.getpid(),
+                             threading.current_thread().ident)
+    with open(tmp, "wb") as fd:
+        fd.write(data)
+    os.rename(tmp, path)
+
+_shared = None
+_shared_lock = threading.Lock()
+
+def shared_loader():
+    """
+    return the RemoteLoader shared across the process by default.  It does
+    not use a disk cache.
+    """
+    global _shared
+    with _shared_lock:
+        if _shared is None:
+            _shared = RemoteLoader()
+        return _shared
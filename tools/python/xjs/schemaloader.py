@@ -3,21 +3,77 @@ a module that provides support for loading schemas, particularly those
 cached on local disk.  
 """
 from __future__ import with_statement
-import sys, os, json, errno
+import sys, os, re, json, errno, threading, time, hashlib
 
-from urlparse import urlparse
+from urlparse import urlparse, urljoin, urldefrag
 from urllib2 import urlopen
-from collections import Mapping
+from collections import Mapping, OrderedDict
+from multiprocessing import Pool
+from multiprocessing.pool import ThreadPool
 import jsonschema as jsch
 
-from .location import read_loc_file
-
-try:
-    import requests
-except ImportError:
-    requests = None
+from .location import read_loc_file, split_rules, PrefixIndex, WILDCARD
+from .cache import LRUCache
+from . import remote as _remote
+from . import jsonbackend
+from .instance import EXTSCHEMAS
 
 SCHEMA_LOCATION_FILE = "schemaLocation.json"
+SCHEMA_INDEX_FILE = ".schemaindex"
+
+# the number of bytes at the start of a file examined by read_header()
+HEADER_SIZE = 4096
+
+_ws = re.compile(r'[ \t\n\r]*')
+_decoder = json.JSONDecoder()
+
+def sniff_header(text):
+    """
+    extract the top-level "id" and "$schema" members from the start of a 
+    JSON object document without parsing all of it.  
+
+    :argument unicode text:  the initial portion of a JSON document
+    :return tuple: a 2-tuple containing the values of "id" and "$schema" 
+                   (either of which may be None if the document does not 
+                   contain it), or None if the given text was insufficient 
+                   to determine them.
+    """
+    found = {}
+    try:
+        idx = _ws.match(text, 0).end()
+        if text[idx] != u'{':
+            return None
+        idx = _ws.match(text, idx+1).end()
+        if text[idx] == u'}':
+            return (None, None)
+
+        while True:
+            key, idx = _decoder.raw_decode(text, idx)
+            if not isinstance(key, basestring):
+                return None
+            idx = _ws.match(text, idx).end()
+            if text[idx] != u':':
+                return None
+            idx = _ws.match(text, idx+1).end()
+            val, idx = _decoder.raw_decode(text, idx)
+            idx = _ws.match(text, idx).end()
+
+            # only accept a value once we know it was not truncated
+            if text[idx] not in u',}':
+                return None
+            if key in (u"id", u"$schema"):
+                found.setdefault(key, val)
+                if len(found) == 2:
+                    break
+            if text[idx] == u'}':
+                break
+            idx = _ws.match(text, idx+1).end()
+
+    except (ValueError, IndexError), ex:
+        # truncated (or invalid) text
+        return None
+
+    return (found.get(u"id"), found.get(u"$schema"))
 
 class BaseSchemaLoad(object):
 
@@ -40,6 +96,152 @@ class BaseSchemaLoad(object):
         """
         return self.load_schema(uri)
 
+# keywords whose values are data rather than schemas
+_DATA_KEYWORDS = ("enum", "default")
+
+def schema_dependencies(schema, base=None):
+    """
+    return the URIs of the other schema documents that a schema refers to,
+    either via "$ref" or "$extensionSchemas".  Relative references are
+    resolved against the "id"s in scope.  The URIs are returned without 
+    fragments, in the order first encountered.
+
+    :argument dict schema:  the schema document to examine
+    :argument str base:     the URI of the document; if None, the 
+                            document's "id" is used.
+    """
+    if base is None:
+        base = schema.get("id", "")
+    self = urldefrag(base)[0]
+    out = []
+    seen = set([self, ""])
+
+    def add(ref, scope):
+        doc = urldefrag(urljoin(scope, ref))[0]
+        if doc not in seen:
+            seen.add(doc)
+            out.append(doc)
+
+    stack = [(schema, base)]
+    while stack:
+        (node, scope) = stack.pop()
+        if isinstance(node, list):
+            stack.extend([(n, scope) for n in reversed(node)])
+            continue
+        if not isinstance(node, dict):
+            continue
+
+        if isinstance(node.get("id"), basestring):
+            scope = urljoin(scope, node["id"])
+        if isinstance(node.get("$ref"), basestring):
+            add(node["$ref"], scope)
+        exts = node.get(EXTSCHEMAS)
+        if isinstance(exts, basestring):
+            exts = [exts]
+        if isinstance(exts, list):
+            for ext in exts:
+                if isinstance(ext, basestring):
+                    add(ext, scope)
+
+        stack.extend([(node[k], scope) for k in sorted(node.keys(), 
+                                                       reverse=True)
+                                       if k not in _DATA_KEYWORDS])
+    return out
+
+class ParsedSchemaCache(object):
+    """
+    a cache of parsed schema files, intended to be shared by all the 
+    SchemaLoaders (and thus all the validators) in a process so that each 
+    schema file is parsed only once.  
+
+    The parsed documents returned by this cache are shared; callers must not
+    modify them.  
+    """
+
+    def __init__(self, maxsize=256, checkfresh=True):
+        """
+        create the cache
+
+        :argument int maxsize:    the maximum number of parsed files to hold;
+                                  the least recently used will be dropped 
+                                  first.  If None, the number is not limited.
+        :argument bool checkfresh: if True, the file's modification time and 
+                                  size will be checked on each lookup, and the
+                                  file re-parsed if either has changed.  
+        """
+        self.checkfresh = checkfresh
+        self._cache = LRUCache(maxsize, sizeof=lambda e: e[1])
+        self._lock = threading.RLock()
+
+    def load(self, path):
+        """
+        return the parsed contents of the JSON file at the given path
+
+        :exc `IOError` if the file cannot be read
+        :exc `ValueError` if the file does not contain valid JSON
+        """
+        path = os.path.abspath(path)
+        with self._lock:
+            entry = self._cache.get(path)
+        if entry:
+            if not self.checkfresh:
+                return entry[2]
+            try:
+                st = os.stat(path)
+                if (st.st_mtime, st.st_size) == entry[:2]:
+                    return entry[2]
+            except OSError:
+                # fall through to report the problem as an IOError
+                pass
+
+        with open(path) as fd:
+            st = os.fstat(fd.fileno())
+            schema = jsonbackend.load(fd)
+        with self._lock:
+            self._cache[path] = (st.st_mtime, st.st_size, schema)
+        return schema
+
+    def store(self, path, mtime, size, schema):
+        """
+        add a document parsed elsewhere (e.g. restored from a LocationDB) 
+        for the file at the given path.  
+
+        :argument float mtime: the file's modification time when it was 
+                               parsed
+        :argument int size:    the file's size when it was parsed
+        """
+        with self._lock:
+            self._cache[os.path.abspath(path)] = (mtime, size, schema)
+
+    def invalidate(self, path=None):
+        """
+        drop the cached document parsed from the given file, forcing it to 
+        be re-read on next access.  If path is None, the whole cache is 
+        cleared.  
+        """
+        with self._lock:
+            if path is None:
+                self._cache.clear()
+            else:
+                self._cache.pop(os.path.abspath(path), None)
+
+    def __contains__(self, path):
+        return os.path.abspath(path) in self._cache
+
+    def __len__(self):
+        return len(self._cache)
+
+    def stats(self):
+        """
+        return a dictionary of statistics describing the use of this cache
+        (see cache.LRUCache.stats()); the bytes reported are the sizes of 
+        the cached files.
+        """
+        return self._cache.stats()
+
+# the cache shared by SchemaLoaders by default
+schema_cache = ParsedSchemaCache()
+
 class SchemaLoader(BaseSchemaLoad):
     """
     A class that can be configured to load schemas from particular locations.
@@ -51,14 +253,30 @@ class SchemaLoader(BaseSchemaLoad):
     jsonschema.RefResolver instance; see SchemaHandler.
     """
 
-    def __init__(self, urilocs={}):
+    def __init__(self, urilocs={}, cache=None, remote=None):
         """
         initialize the handler
 
         :argument dict urilocs:  a dictionary mapping URIs to local file paths
                                  that define the schema identified by the URI.
+        :argument ParsedSchemaCache cache:  the cache of parsed schema files 
+                                 to use; if None, the cache shared across the
+                                 process (schema_cache) is used.  If False, 
+                                 files are parsed on every load.  
+        :argument RemoteLoader remote:  the loader to use to retrieve schemas
+                                 located at http(s) URLs; if None, the loader
+                                 shared across the process is used (see 
+                                 remote.shared_loader()).
         """
-        self._map = dict(urilocs)
+        (self._map, rules) = split_rules(urilocs)
+        self._prefixes = PrefixIndex(rules)
+        self._remote = remote
+        self._prefetched = {}
+        if cache is None:
+            cache = schema_cache
+        elif cache is False:
+            cache = None
+        self._cache = cache
 
         # the following are used to support SchemaHandler; may be removed if 
         # SchemaHandler is not required for RefResolver
@@ -67,27 +285,35 @@ class SchemaLoader(BaseSchemaLoad):
 
     @classmethod
     def from_directory(cls, dirpath, ensure_locfile=False, 
-                       locfile=SCHEMA_LOCATION_FILE):
+                       locfile=SCHEMA_LOCATION_FILE, 
+                       indexfile=None, workers=1, remote=None):
         """
         create a schemaLoader for schemas stored as files under a given 
         directory.  This factory method will attempt to load schema file 
         names from a file called locfile (defaults to "schemaLocation.json").
         If the file is not found, all the JSON files under that directory
         (including subdirectories) will be examined and those recognized as 
-        JSON schemas will be loaded.  
+        JSON schemas will be loaded.  In this case, if indexfile is given 
+        (e.g. SCHEMA_INDEX_FILE, ".schemaindex"), the results of the 
+        examination are saved to that file so that later calls need only 
+        examine new or changed files; by default, nothing is written to 
+        the directory.  workers sets the number of files
+        examined in parallel (see DirectorySchemaCache).  remote sets the 
+        RemoteLoader used to retrieve schemas at http(s) locations (see 
+        the constructor).
         """
         if not os.path.exists(dirpath):
             raise IOError((errno.ENOENT, "directory not found", dirpath)) 
         if not os.path.isdir(dirpath):
             raise RuntimeError(dirpath + ": not a directory")
 
-        out = SchemaLoader()
+        out = SchemaLoader(remote=remote)
 
         locpath = os.path.join(dirpath, locfile)
         if os.path.exists(locpath):
             out.load_locations(locpath, dirpath)
         else:
-            dc = DirectorySchemaCache(dirpath)
+            dc = DirectorySchemaCache(dirpath, indexfile, workers)
             out.add_locations(dc.locations())
             if ensure_locfile:
                 dc.save_locations(locfile)
@@ -95,7 +321,7 @@ class SchemaLoader(BaseSchemaLoad):
         return out
 
     @classmethod
-    def from_location_file(cls, locpath, basedir=None):
+    def from_location_file(cls, locpath, basedir=None, remote=None):
         """
         create a schemaLoader for schemas listed in a schema location file.
 
@@ -103,81 +329,182 @@ class SchemaLoader(BaseSchemaLoad):
                                 assumed to be relative to.  If not given, any
                                 relative paths will be assumed to be relative
                                 to the directory containing the location file. 
+        :argument RemoteLoader remote:  the loader to use to retrieve schemas
+                                located at http(s) URLs (see the 
+                                constructor)
         """
-        out = SchemaLoader()
+        out = SchemaLoader(remote=remote)
         out.load_locations(locpath, basedir)
         return out
 
     def _addschemes(self, map):
         # used to support SchemaHandler
-        for loc in self._map:
-            self._schemes.add(urlparse(loc).scheme)
+        for uri in map:
+            self._schemes.add(urlparse(uri).scheme)
 
     def locate(self, uri):
         """
         return the file path location of the schema for the given URI or None
-        if the schema is not known to be available locally.
+        if the schema is not known to be available locally.  Exact mappings
+        take precedence over prefix rules; among the rules, the one with the
+        longest matching prefix is used.  
 
-        :exc `KeyError` if the location of the schema has not been set
+        :exc `KeyError` if the location of the schema has not been set, or 
+                        if the only matching prefix rule gives a file path
+                        that does not exist
         """
-        return self._map[uri]
+        try:
+            return self._map[uri]
+        except KeyError:
+            if not self._prefixes:
+                raise
+            return self._locate_by_rule(uri)
+
+    def _locate_by_rule(self, uri):
+        # a rule only covers the schema files that actually exist under it;
+        # a URI that maps to a missing file is treated as unknown.
+        loc = self._prefixes.locate(uri)
+        if not urlparse(loc).scheme and not os.path.isfile(loc):
+            raise KeyError(uri)
+        return loc
 
     def iterURIs(self):
         """
-        return an iterator for the uris mapped in this instance
+        return an iterator for the uris mapped in this instance (not 
+        including those only matched by prefix rules)
         """
         return self._map.iterkeys()
 
+    def prefix_rules(self):
+        """
+        return the prefix rules set in this instance as a dictionary mapping 
+        URI prefixes to location templates (see the location module).
+        """
+        return self._prefixes.rules()
+
     def __len__(self):
         return len(self._map)
 
+    def __nonzero__(self):
+        # a loader with only prefix rules is still a usable loader
+        return len(self) > 0 or len(self._prefixes) > 0
+
     def add_location(self, uri, path):
         """
-        set the location of the schema file corresponding to the given URI
+        set the location of the schema file corresponding to the given URI.
+        If the URI ends with "*", a prefix rule is set (see the location 
+        module).
         """
-        self._map[uri] = path
-        self._schemes.add(urlparse(uri).scheme)
+        self.add_locations({ uri: path })
 
     def add_locations(self, urifiles):
         """
         add all the URI-file mappings in the given dictionary
         """
-        self._map.update(urifiles)
+        (exact, rules) = split_rules(urifiles)
+        self._map.update(exact)
+        for prefix, template in rules.iteritems():
+            self._prefixes.add(prefix, template)
         self._addschemes(urifiles)
 
     def load_schema(self, uri):
         """
-        return the parsed json schema document for a given URI.
+        return the parsed json schema document for a given URI.  Documents 
+        loaded from files may be shared with other loaders (see 
+        ParsedSchemaCache) and should not be modified.
 
         :exc `KeyError` if the location of the schema has not been set
         :exc `IOError` if an error occurs while trying to read from the 
                        registered location.  This includes if the file is
                        not found or reading causes a syntax error.  
         """
-        loc = self.locate(uri)
+        if self._prefetched:
+            out = self._prefetched.get(uri.rstrip('#'))
+            if out is not None:
+                return out
+        return self._load_location(self.locate(uri))
+
+    def _load_location(self, loc):
         url = urlparse(loc)
 
-        # Note: this part adapted from jsonschema.RefResolver.resolve_remote()
-        # (v2.5.1)
         if not url.scheme:
+            if self._cache is not None:
+                return self._cache.load(loc)
             with open(loc) as fd:
-                return json.load(fd)
-        elif (
-            scheme in [u"http", u"https"] and
-            requests and
-            getattr(requests.Response, "json", None) is not None
-        ):
-            # Requests has support for detecting the correct encoding of
-            # json over http
-            if callable(requests.Response.json):
-                result = requests.get(loc).json()
-            else:
-                result = requests.get(loc).json
+                return jsonbackend.load(fd)
+        elif url.scheme in ("http", "https"):
+            remote = self._remote
+            if remote is None:
+                remote = _remote.shared_loader()
+            return remote.fetch(loc)
         else: 
             # Otherwise, pass off to urllib and assume utf-8
-            result = json.loads(urlopen(uri).read().decode("utf-8"))
+            return jsonbackend.loads(urlopen(loc).read().decode("utf-8"))
+
+    def prefetch(self, uri, workers=8):
+        """
+        load the schema with the given URI along with all the schemas it 
+        depends on, transitively, via "$ref" or "$extensionSchemas" (see 
+        schema_dependencies()).  Schemas are fetched concurrently, and 
+        those not retrieved from local files are held by this loader so 
+        that later calls to load_schema() will not need to fetch them 
+        again.  Schemas that are not mapped to a location but have an 
+        http(s) URI are fetched from that URI.  Schemas that cannot be 
+        retrieved are skipped; the errors will be reported when they are
+        needed during validation.
 
-        return result
+        :argument str uri:     the URI of the schema to start from
+        :argument int workers: the maximum number of schemas to fetch at 
+                               once
+        :return dict:  a mapping of the URIs of the schemas retrieved to 
+                       the parsed documents
+        """
+        out = {}
+        seen = set([uri])
+        frontier = [uri]
+        pool = ThreadPool(workers)
+        try:
+            while frontier:
+                docs = pool.map(self._prefetch_one, frontier)
+                next = []
+                for u, doc in zip(frontier, docs):
+                    if doc is None:
+                        continue
+                    out[u] = doc[0]
+                    if doc[1]:
+                        self._prefetched[u.rstrip('#')] = doc[0]
+                    for dep in schema_dependencies(doc[0], u):
+                        if dep not in seen and \
+                           dep+'#' not in jsch.validators.meta_schemas and \
+                           dep not in jsch.validators.meta_schemas:
+                            seen.add(dep)
+                            next.append(dep)
+                frontier = next
+        finally:
+            pool.close()
+            pool.join()
+
+        return out
+
+    def _prefetch_one(self, uri):
+        # return the schema with the given URI and whether it came from a 
+        # remote location, or None if it is not available
+        if uri.rstrip('#') in self._prefetched:
+            return (self._prefetched[uri.rstrip('#')], False)
+        for u in (uri, uri+'#', uri.rstrip('#')):
+            try:
+                loc = self.locate(u)
+                break
+            except KeyError:
+                pass
+        else:
+            if urlparse(uri).scheme not in ("http", "https"):
+                return None
+            loc = uri
+        try:
+            return (self._load_location(loc), bool(urlparse(loc).scheme))
+        except (IOError, ValueError), ex:
+            return None
 
     def load_locations(self, filename, basedir=None):
         """
@@ -190,6 +517,358 @@ class SchemaLoader(BaseSchemaLoad):
         """
         self.add_locations(read_loc_file(filename, basedir=basedir))
 
+class MemorySchemaLoader(BaseSchemaLoad):
+    """
+    a schema loader that holds parsed schemas in memory.  It is intended 
+    as the first tier of a TieredSchemaLoader, which fills it with the 
+    schemas retrieved from slower tiers.
+    """
+
+    def __init__(self, schemas=None, maxsize=None):
+        """
+        create the loader
+
+        :argument dict schemas:  a mapping of URIs to parsed schemas to 
+                                 start with
+        :argument int maxsize:   the maximum number of schemas to hold; the
+                                 least recently used ones are dropped as 
+                                 needed.  If None, the number is not limited.
+        """
+        self._store = LRUCache(maxsize, normalize=lambda u: u.rstrip('#'))
+        self._lock = threading.Lock()
+        if schemas:
+            for uri, schema in schemas.iteritems():
+                self.store_schema(uri, schema)
+
+    def load_schema(self, uri):
+        """
+        return the parsed json schema document for a given URI.
+
+        :exc `KeyError` if the schema is not held by this loader
+        """
+        with self._lock:
+            return self._store[uri]
+
+    def store_schema(self, uri, schema):
+        """
+        hold the given schema document under the given URI
+        """
+        with self._lock:
+            self._store[uri] = schema
+
+    def iterURIs(self):
+        """
+        return an iterator for the uris of the schemas held by this loader
+        """
+        return iter(self._store.keys())
+
+    def __len__(self):
+        return len(self._store)
+
+    def __contains__(self, uri):
+        return uri in self._store
+
+    @property
+    def _schemes(self):
+        # used to support SchemaHandler
+        return set([urlparse(u).scheme for u in self._store.keys()])
+
+class DirectorySchemaLoader(SchemaLoader):
+    """
+    a SchemaLoader for the schemas stored under a directory that can also 
+    save schemas retrieved from elsewhere into that directory (see 
+    store_schema()).  Saved schemas are written to the FETCHED_DIR 
+    subdirectory along with a location file listing them so that later 
+    instances find them as well.
+    """
+
+    FETCHED_DIR = "fetched"
+
+    def __init__(self, dirpath, cache=None, remote=None, workers=1):
+        """
+        create the loader.
+
+        :argument str dirpath:  the directory containing the schemas; it is
+                                examined as by SchemaLoader.from_directory().
+        :argument ParsedSchemaCache cache:  see SchemaLoader
+        :argument RemoteLoader remote:      see SchemaLoader
+        :argument int workers:  the number of files to examine in parallel
+        """
+        SchemaLoader.__init__(self, cache=cache, remote=remote)
+        self.dirpath = dirpath
+        base = SchemaLoader.from_directory(dirpath, workers=workers)
+        self.add_locations(dict([(u, self._abspath(l)) for u, l 
+                                 in base._map.iteritems()]))
+        self.add_locations(dict([(p+WILDCARD, t) for p, t 
+                                 in base.prefix_rules().iteritems()]))
+
+        self._lock = threading.Lock()
+        self._fetched = {}
+        locfile = self._fetched_locfile()
+        if os.path.exists(locfile):
+            with open(locfile) as fd:
+                self._fetched = json.load(fd)
+            self.load_locations(locfile)
+
+    def _abspath(self, loc):
+        # from_directory() gives locations found by examining the files
+        # relative to the directory
+        if urlparse(loc).scheme or os.path.isabs(loc):
+            return loc
+        return os.path.join(self.dirpath, loc)
+
+    def _fetched_locfile(self):
+        return os.path.join(self.dirpath, self.FETCHED_DIR, 
+                            SCHEMA_LOCATION_FILE)
+
+    def store_schema(self, uri, schema):
+        """
+        save the given schema document into the directory and map the given
+        URI to it.
+
+        :exc `IOError` if the schema cannot be written
+        """
+        fdir = os.path.join(self.dirpath, self.FETCHED_DIR)
+        filename = hashlib.sha1(uri.rstrip('#').encode("utf-8")).hexdigest() \
+                   + ".json"
+        with self._lock:
+            try:
+                if not os.path.isdir(fdir):
+                    os.makedirs(fdir)
+                _remote._write(os.path.join(fdir, filename), 
+                               json.dumps(schema, indent=2))
+                self._fetched[uri] = filename
+                _remote._write(self._fetched_locfile(), 
+                               json.dumps(self._fetched, indent=2, 
+                                          sort_keys=True))
+            except OSError, ex:
+                raise IOError(ex.errno, ex.strerror, ex.filename)
+            self.add_location(uri, os.path.join(fdir, filename))
+
+class RemoteSchemaLoader(BaseSchemaLoad):
+    """
+    a schema loader that retrieves schemas with http(s) URIs from those 
+    URIs.  It is intended as the last tier of a TieredSchemaLoader.
+    """
+
+    _schemes = set(["http", "https"])
+
+    def __init__(self, remote=None):
+        """
+        create the loader
+
+        :argument RemoteLoader remote:  the loader to retrieve documents 
+                                 with; if None, the loader shared across the
+                                 process is used (see remote.shared_loader()).
+        """
+        self._remote = remote
+
+    def locate(self, uri):
+        """
+        return the URL that the schema with the given URI is retrieved from
+
+        :exc `KeyError` if the URI is not an http(s) URI
+        """
+        if urlparse(uri).scheme not in self._schemes:
+            raise KeyError(uri)
+        return urldefrag(uri)[0]
+
+    def load_schema(self, uri):
+        """
+        return the parsed json schema document for a given URI.
+
+        :exc `KeyError` if the URI is not an http(s) URI or the server 
+                        reports that there is no such document (see 
+                        remote.NotFoundError)
+        :exc `IOError` if the document cannot be retrieved
+        :exc `ValueError` if the document does not contain valid JSON
+        """
+        url = self.locate(uri)
+        remote = self._remote
+        if remote is None:
+            remote = _remote.shared_loader()
+        return remote.fetch(url)
+
+class TieredSchemaLoader(BaseSchemaLoad):
+    """
+    a schema loader that consults an ordered chain of other loaders (tiers),
+    fastest first, returning the schema from the first one that provides 
+    it.  A schema retrieved from a slower tier is written back into the 
+    faster tiers that can store schemas (i.e. those with a store_schema() 
+    method), so that, typically, nearly all lookups are served from the 
+    first tier while new schemas are still found.  
+
+    Statistics for each tier are available via stats().
+    """
+
+    def __init__(self, tiers, writeback=True, clock=time.time):
+        """
+        create the loader
+
+        :argument list tiers:  the loaders to consult, in order; each may be
+                               given as a (name, loader) tuple to name the 
+                               tier in the statistics.  
+        :argument bool writeback:  if False, schemas will not be written 
+                               into faster tiers.
+        :argument func clock:  the function that provides the current time
+                               in seconds
+        """
+        self._tiers = []
+        for tier in tiers:
+            if not isinstance(tier, tuple):
+                tier = (type(tier).__name__, tier)
+            self._tiers.append(tier)
+        self.writeback = writeback
+        self._clock = clock
+        self._stats = [dict(hits=0, misses=0, errors=0, stored=0, time=0.0)
+                       for t in self._tiers]
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_sources(cls, dirpath=None, bundlefile=None, remote=True, 
+                     maxsize=None):
+        """
+        create a loader with the standard chain of tiers:  an in-memory 
+        store, a directory of schema files, a schema bundle, and remote 
+        retrieval.  
+
+        :argument str dirpath:     the directory of schemas to use; if None,
+                                   this tier is not included.  Schemas 
+                                   retrieved remotely are saved here.
+        :argument str bundlefile:  the schema bundle to use; if None, this 
+                                   tier is not included.
+        :argument remote:  the RemoteLoader to retrieve schemas with, True 
+                           to use the loader shared across the process, or 
+                           False to not retrieve schemas remotely
+        :argument int maxsize:     the maximum number of schemas to hold in 
+                                   memory; if None, it is not limited.
+        """
+        tiers = [("memory", MemorySchemaLoader(maxsize=maxsize))]
+        if dirpath:
+            tiers.append(("directory", DirectorySchemaLoader(dirpath)))
+        if bundlefile:
+            from .bundle import BundleLoader
+            tiers.append(("bundle", BundleLoader(bundlefile)))
+        if remote:
+            if remote is True:
+                remote = None
+            tiers.append(("remote", RemoteSchemaLoader(remote)))
+        return cls(tiers)
+
+    def tiers(self):
+        """
+        return the (name, loader) tuples for the tiers, in order
+        """
+        return list(self._tiers)
+
+    def _count(self, i, stat, value=1):
+        with self._lock:
+            self._stats[i][stat] += value
+
+    def load_schema(self, uri):
+        """
+        return the parsed json schema document for a given URI from the 
+        first tier that provides it.
+
+        :exc `KeyError` if none of the tiers provide the schema
+        :exc `IOError` if the schema is not provided by any tier and a tier
+                       failed while trying to retrieve it
+        """
+        err = None
+        for i, (name, tier) in enumerate(self._tiers):
+            start = self._clock()
+            try:
+                out = tier.load_schema(uri)
+            except KeyError, ex:
+                self._count(i, "misses")
+                continue
+            except (IOError, ValueError), ex:
+                self._count(i, "errors")
+                if err is None:
+                    err = ex
+                continue
+            finally:
+                self._count(i, "time", self._clock() - start)
+
+            self._count(i, "hits")
+            if self.writeback:
+                self._write_back(i, uri, out)
+            return out
+
+        if err is not None:
+            raise err
+        raise KeyError(uri)
+
+    def _write_back(self, i, uri, schema):
+        for j, (name, tier) in enumerate(self._tiers[:i]):
+            store = getattr(tier, "store_schema", None)
+            if store is None:
+                continue
+            try:
+                store(uri, schema)
+                self._count(j, "stored")
+            except (IOError, OSError), ex:
+                # the schema will be retrieved again next time
+                pass
+
+    def locate(self, uri):
+        """
+        return the location of the schema with the given URI according to 
+        the first tier that knows it (tiers that do not record locations 
+        are skipped)
+
+        :exc `KeyError` if the location is not known
+        """
+        for name, tier in self._tiers:
+            if hasattr(tier, "locate"):
+                try:
+                    return tier.locate(uri)
+                except KeyError:
+                    pass
+        raise KeyError(uri)
+
+    def iterURIs(self):
+        """
+        return an iterator for the uris known to any of the tiers
+        """
+        out = set()
+        for name, tier in self._tiers:
+            if hasattr(tier, "iterURIs"):
+                out.update(tier.iterURIs())
+        return iter(out)
+
+    def __len__(self):
+        return len(set(self.iterURIs()))
+
+    def __nonzero__(self):
+        # tiers like remote retrieval can provide schemas without listing 
+        # them
+        return len(self._tiers) > 0
+
+    @property
+    def _schemes(self):
+        # used to support SchemaHandler
+        out = set()
+        for name, tier in self._tiers:
+            out.update(getattr(tier, "_schemes", []))
+        return out
+
+    def stats(self):
+        """
+        return the statistics for each tier as an ordered dictionary, keyed
+        by tier name, of dictionaries giving the number of hits, misses, 
+        errors, and schemas stored (written back), the total time (in 
+        seconds) spent consulting the tier, and the mean time per lookup.
+        """
+        out = OrderedDict()
+        with self._lock:
+            for (name, tier), st in zip(self._tiers, self._stats):
+                st = dict(st)
+                n = st["hits"] + st["misses"] + st["errors"]
+                st["mean"] = (n and st["time"] / n) or 0.0
+                out[name] = st
+        return out
+
 class SchemaHandler(Mapping):
     """
     A wrapper class to use a SchemaLoader as a JSON Schema URI handler to a 
@@ -261,9 +940,36 @@ class DirectorySchemaCache(object):
                 out += ": " + why
             return out
 
-    def __init__(self, dirpath):
+    def __init__(self, dirpath, indexfile=None, workers=1, processes=False):
+        """
+        create the cache
+
+        :argument str dirpath:    the directory containing the schema files
+        :argument str indexfile:  the name of a file in which to record the 
+                                  id and $schema of each file examined 
+                                  along with its size and modification time.
+                                  Later scans will only read files that are 
+                                  new or have changed.  A relative path is 
+                                  interpreted as relative to dirpath.  If 
+                                  None, the index is only kept in memory, 
+                                  for later scans by this instance.  
+        :argument int workers:    the number of files to examine in parallel
+                                  when scanning the directory; this helps 
+                                  most when file access latency is high 
+                                  (e.g. over NFS).  If 1 (default), files are
+                                  examined one at a time.
+        :argument bool processes: if True, scan with a pool of worker 
+                                  processes rather than threads; this can 
+                                  help when many files need a full parse.
+        """
         self._dir = dirpath
         self._checkdir()
+        self.workers = workers
+        self.processes = processes
+        self._indexfile = None
+        if indexfile:
+            self._indexfile = os.path.join(self._dir, indexfile)
+        self._index = {}
 
     def _checkdir(self):
         if not os.path.exists(self._dir):
@@ -272,7 +978,7 @@ class DirectorySchemaCache(object):
             raise RuntimeError(self._dir + ": not a directory")
 
     def _read_id(self, fd):
-        schema = json.load(fd)
+        schema = jsonbackend.load(fd)
         if not hasattr(schema, "get") or not hasattr(schema,"__getitem__"):
             raise self.NotASchemaError("Does not contain a JSON object")
         try:
@@ -284,6 +990,35 @@ class DirectorySchemaCache(object):
 
         return (schema.get("id"), schema)
 
+    def read_header(self, filename):
+        """
+        return the id and $schema of the schema in the file in the cache 
+        directory with the given filename.  Unlike open_file(), this will 
+        avoid parsing the entire file when these members appear near the 
+        beginning of the document.  The returned id will be None if the 
+        schema does not specify one.
+
+        :exc NotASchemaError  if the file does not contain a JSON Schema
+        """
+        filepath = os.path.join(self._dir, filename)
+        with open(filepath) as fd:
+            head = fd.read(HEADER_SIZE)
+        found = sniff_header(head.decode("utf-8", "ignore"))
+
+        if found is None:
+            # inconclusive; parse the whole thing
+            (id, schema) = self.open_file(filename)
+            return (schema.get("id"), schema["$schema"])
+
+        if found[1] is None:
+            raise self.NotASchemaError(
+                "JSON object does not contain a $schema property", filename)
+        if not isinstance(found[1], basestring) or \
+           found[1] not in jsch.validators.meta_schemas:
+            raise self.NotASchemaError("Unrecognized JSON-Schema $schema", 
+                                       filename)
+        return found
+
     def open_file(self, filename):
         """
         read the file in the cache directory with the given filename and 
@@ -303,18 +1038,120 @@ class DirectorySchemaCache(object):
             return (id, schema)
 
     def _iterfiles(self, recurse=True):
+        # yield (file, id) for each schema file, where file is relative to 
+        # the cache directory.  If an index file is in use, only new or 
+        # changed files are read (otherwise, only those that are new or have
+        # changed since this instance last scanned the directory).  Files 
+        # are visited in sorted order so that
+        # the last of several files with the same id consistently wins.
+        index = self._load_index()
+        walked = set()
+
+        files = []
         for dir, dirnames, filenames in os.walk(self._dir):
+            dirnames.sort()
             dir = dir[len(self._dir)+1:]
-            for file in map(lambda p: os.path.join(dir, p), 
-                            filter(lambda f: f.endswith(".json"), filenames)):
-                try:
-                    (id, schema) = self.open_file(file)
-                    yield file, id, schema
-                except self.NotASchemaError, ex:
-                    continue
+            walked.add(dir)
+            files.extend([os.path.join(dir, f) for f in sorted(filenames)
+                                               if f.endswith(".json")])
             if not recurse:
                 break
 
+        updated = {}
+        for file, entry in zip(files, self._scan(files, index)):
+            if entry is None:
+                continue
+            updated[file] = entry
+            if entry['$schema'] is not None:
+                id = entry['id']
+                if not id:
+                    id = "file://" + os.path.join(self._dir, file)
+                yield file, id
+
+        # keep the entries for the subdirectories skipped because we were 
+        # not recursing, as long as they still exist; a full walk visits 
+        # every directory, so anything else it missed has been deleted
+        if not recurse:
+            for file, entry in index.iteritems():
+                dir = os.path.dirname(file)
+                if dir not in walked and \
+                   os.path.isdir(os.path.join(self._dir, dir)):
+                    updated[file] = entry
+        self._index = updated
+        if self._indexfile and updated != index:
+            self._save_index(updated)
+
+    def _scan(self, files, index):
+        # return the up-to-date index entries for the given files, in order
+        if self.workers is None or self.workers > 1:
+            if self.processes:
+                pool = Pool(self.workers)
+                args = [(self._dir, f, index.get(f)) for f in files]
+                func = _scan_file
+            else:
+                pool = ThreadPool(self.workers)
+                args = files
+                func = lambda f: self._index_entry(f, index.get(f))
+            try:
+                return pool.map(func, args)
+            finally:
+                pool.close()
+                pool.join()
+
+        return [self._index_entry(f, index.get(f)) for f in files]
+
+    def _index_entry(self, file, entry):
+        # return an up-to-date index entry for the given file, reusing the
+        # given entry if the file has not changed.  None is returned if the
+        # file cannot be read.
+        try:
+            st = os.stat(os.path.join(self._dir, file))
+        except OSError:
+            return None
+        if entry and entry.get('size') == st.st_size and \
+           entry.get('mtime') == st.st_mtime:
+            return entry
+
+        entry = { "size": st.st_size, "mtime": st.st_mtime, 
+                  "id": None, "$schema": None }
+        try:
+            (entry['id'], entry['$schema']) = self.read_header(file)
+        except self.NotASchemaError, ex:
+            pass
+        except (IOError, ValueError), ex:
+            return None
+        return entry
+
+    def _load_index(self):
+        if not self._indexfile:
+            return self._index
+        if not os.path.exists(self._indexfile):
+            return {}
+        try:
+            with open(self._indexfile) as fd:
+                data = json.load(fd)
+            if data.get("version") != 1:
+                return {}
+            return data["files"]
+        except (IOError, ValueError, KeyError, AttributeError), ex:
+            # an unusable index just means we rescan everything
+            return {}
+
+    def _save_index(self, files):
+        tmpfile = self._indexfile + ".tmp"
+        try:
+            with open(tmpfile, "w") as fd:
+                json.dump({ "version": 1, "files": files }, fd)
+            os.rename(tmpfile, self._indexfile)
+        except (IOError, OSError), ex:
+            # the index is only an optimization (and the directory may be 
+            # read-only), so failing to save it is not an error
+            if os.path.exists(tmpfile):
+                try:
+                    os.remove(tmpfile)
+                except OSError:
+                    pass
+
     def locations(self, absolute=False, recursive=True):
         """
         return a dictionary that maps schema URIs to their file paths.  
@@ -326,25 +1163,28 @@ class DirectorySchemaCache(object):
                                   schemas from subdirectories
         """
         out = {}
-        for file, id, schema in self._iterfiles(recursive):
+        for file, id in self._iterfiles(recursive):
             if absolute:
                 file = os.path.join(self._dir, file)
             out[id] = file
 
         return out
 
-    def schemas(self, recursive=True):
+    def schemas(self, recursive=True, maxsize=64):
         """
-        return a dictionary of mappings of URIs to parsed schemas
+        return a Mapping of URIs to parsed schemas.  The ids of all the 
+        schemas are determined up front, but each schema is only parsed 
+        when it is first accessed.  
 
         :argument bool recursive: if True (default), this list will include
                                   schemas from subdirectories
+        :argument int maxsize:    the maximum number of parsed schemas to 
+                                  hold in memory at once; the least recently
+                                  used are dropped first and re-read if 
+                                  needed again.  If None, all accessed 
+                                  schemas are kept.  
         """
-        out = {}
-        for file, id, schema in self._iterfiles(recursive):
-            out[id] = schema
-
-        return out
+        return LazySchemaMap(self, self.locations(False, recursive), maxsize)
 
     def save_locations(self, outfile=SCHEMA_LOCATION_FILE, 
                        absolute=False, recursive=True):
@@ -369,3 +1209,61 @@ class DirectorySchemaCache(object):
 
         with open(outfile, "w") as fd:
             json.dump(locs, fd, separators=(",", ": "), indent=4)
+
+class LazySchemaMap(Mapping):
+    """
+    a read-only mapping of schema URIs to parsed schemas, each loaded from 
+    a DirectorySchemaCache on first access.  Parsed schemas are held in a 
+    bounded cache.
+    """
+
+    def __init__(self, dircache, locations, maxsize=64):
+        """
+        create the mapping
+
+        :argument DirectorySchemaCache dircache:  the cache to read from
+        :argument dict locations:  a mapping of URIs to file paths 
+                                   relative to the cache directory
+        :argument int maxsize:     the maximum number of parsed schemas to
+                                   hold; if None, the number is not limited.
+        """
+        self._dircache = dircache
+        self._locs = dict(locations)
+        self._parsed = LRUCache(maxsize, sizeof=lambda s: 0)
+
+    def __getitem__(self, uri):
+        try:
+            return self._parsed[uri]
+        except KeyError:
+            pass
+        schema = self._dircache.open_file(self._locs[uri])[1]
+        self._parsed[uri] = schema
+        return schema
+
+    def __iter__(self):
+        return iter(self._locs)
+
+    def __len__(self):
+        return len(self._locs)
+
+    def __contains__(self, uri):
+        return uri in self._locs
+
+    def locate(self, uri):
+        """
+        return the path (relative to the cache directory) to the file 
+        containing the schema with the given URI
+        """
+        return self._locs[uri]
+
+    def stats(self):
+        """
+        return the statistics of the cache of parsed schemas (see 
+        cache.LRUCache.stats())
+        """
+        return self._parsed.stats()
+
+def _scan_file(args):
+    # compute a DirectorySchemaCache index entry in a worker process
+    (dirpath, file, entry) = args
+    return DirectorySchemaCache(dirpath)._index_entry(file, entry)
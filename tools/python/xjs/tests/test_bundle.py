@@ -0,0 +1,81 @@
+# import pytest
+from __future__ import with_statement
+import json, os, pytest
+
+from . import Tempfiles
+import xjs.bundle as bundle
+import xjs.validate as val
+
+schemadir = os.path.join(
+   os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(__file__))))),
+                        "schemas", "json")
+exdir = os.path.join(
+   os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(__file__))))),
+                        "examples", "json")
+ipr_ex = os.path.join(exdir, "ipr.json")
+
+@pytest.fixture(scope="module")
+def tmpfiles(request):
+    tf = Tempfiles()
+    request.addfinalizer(tf.clean)
+    return tf
+
+@pytest.fixture(scope="module")
+def bundlefile(tmpfiles):
+    out = os.path.join(tmpfiles.parent, "schemas.bundle")
+    tmpfiles.track("schemas.bundle")
+    titles = { "urn:goober": "Goober", "urn:gurn": u"Gurn\u00e9" }
+    n = bundle.write_directory_bundle(schemadir, out, { "titles": titles })
+    assert n == 7
+    return out
+
+def test_write(bundlefile):
+    with open(bundlefile, "rb") as fd:
+        assert fd.read(len(bundle.MAGIC)) == bundle.MAGIC
+
+class TestBundleLoader(object):
+
+    def test_load(self, bundlefile):
+        ldr = bundle.BundleLoader(bundlefile)
+        try:
+            assert len(ldr) == 7
+            assert "http://mgi.nist.gov/mgi-json-schema/v0.1" in ldr
+            assert ldr.decoded() == 0
+
+            schema = ldr.load_schema("http://mgi.nist.gov/mgi-json-schema/v0.1")
+            with open(os.path.join(schemadir, "mgi-json-schema.json")) as fd:
+                assert schema == json.load(fd)
+            assert ldr.decoded() == 1
+            assert ldr("http://mgi.nist.gov/mgi-json-schema/v0.1") is schema
+            assert ldr.decoded() == 1
+            assert ldr.locate("http://mgi.nist.gov/mgi-json-schema/v0.1") \
+                      .startswith(bundlefile + "#")
+
+            with pytest.raises(KeyError):
+                ldr.load_schema("urn:goober")
+        finally:
+            ldr.close()
+
+    def test_artifacts(self, bundlefile):
+        ldr = bundle.BundleLoader(bundlefile)
+        try:
+            assert ldr.artifact_names() == [ "titles" ]
+            assert ldr.load_artifact("titles", "urn:gurn") == u"Gurn\u00e9"
+            assert "urn:gurn" not in ldr
+            with pytest.raises(KeyError):
+                ldr.load_artifact("titles", 
+                                  "http://mgi.nist.gov/mgi-json-schema/v0.1")
+        finally:
+            ldr.close()
+
+    def test_notabundle(self):
+        with pytest.raises(bundle.BundleFormatError):
+            bundle.BundleLoader(os.path.join(schemadir, "schemaLocation.json"))
+
+    def test_validate(self, bundlefile):
+        ldr = bundle.BundleLoader(bundlefile)
+        try:
+            validator = val.ExtValidator(ldr)
+            validator.validate_file(ipr_ex, False, False)
+        finally:
+            ldr.close()
@@ -0,0 +1,179 @@
+# import pytest
+from __future__ import with_statement
+import pytest, threading
+
+import xjs.cache as cache
+
+def test_estimate_size():
+    small = cache.estimate_size({ "a": 1 })
+    assert small > 0
+    assert cache.estimate_size({ "a": [ "b" * 1000 ] }) > small + 1000
+
+    shared = "c" * 1000
+    assert cache.estimate_size([shared, shared]) < 2000
+
+class TestLRUCache(object):
+
+    def test_dict(self):
+        c = cache.LRUCache()
+        assert len(c) == 0
+        c["a"] = 1
+        c["b"] = 2
+        assert c["a"] == 1
+        assert "b" in c
+        assert "c" not in c
+        assert c.get("c") is None
+        assert set(c.keys()) == set(["a", "b"])
+        del c["a"]
+        assert "a" not in c
+        assert len(c) == 1
+
+    def test_maxsize(self):
+        evicted = []
+        c = cache.LRUCache(2, on_evict=lambda k, v: evicted.append(k))
+        c["a"] = 1
+        c["b"] = 2
+        assert c["a"] == 1     # now b is the least recently used
+        c["c"] = 3
+        assert "b" not in c
+        assert "a" in c and "c" in c
+        assert evicted == ["b"]
+        assert c.evictions == 1
+
+    def test_maxbytes(self):
+        c = cache.LRUCache(maxbytes=100, sizeof=lambda v: v)
+        c["a"] = 40
+        c["b"] = 40
+        assert c.bytes == 80
+        c["c"] = 50
+        assert "a" not in c
+        assert c.bytes == 90
+        c["d"] = 100
+        assert len(c) == 1
+        assert c.bytes == 100
+
+    def test_lock(self):
+        lock = threading.Lock()
+        free = []
+        def evicted(k, v):
+            # the lock is released before eviction is reported
+            free.append(lock.acquire(False))
+            lock.release()
+        c = cache.LRUCache(1, on_evict=evicted, lock=lock)
+        c["a"] = 1
+        c["b"] = 2
+        assert free == [ True ]
+        assert c.pop("b") == 2
+        assert c.pop("b", None) is None
+        with pytest.raises(KeyError):
+            c.pop("b")
+        assert not lock.locked()
+
+    def test_nosize(self):
+        c = cache.LRUCache(2, maxbytes=1, sizeof=None)
+        c["a"] = "x" * 100
+        c["b"] = "y" * 100
+        assert len(c) == 2
+        assert c.bytes is None
+        assert c.stats()["bytes"] is None
+
+    def test_pin(self):
+        c = cache.LRUCache(2)
+        c.pin("a")
+        assert c.is_pinned("a")
+        c["a"] = 1
+        c["b"] = 2
+        c["c"] = 3
+        c["d"] = 4
+        assert "a" in c
+        assert "b" not in c
+        assert len(c) == 2
+
+        c["e"] = 5
+        c.pin("e")
+        c["f"] = 6
+        assert "f" not in c   # the only one that could go
+        assert len(c) == 2
+
+        c.maxsize = 1
+        c.unpin("e")
+        c["f"] = 6
+        assert len(c) == 1
+        assert "a" in c
+
+    def test_normalize(self):
+        c = cache.LRUCache(normalize=lambda k: k.rstrip('#'))
+        c["urn:a#"] = 1
+        assert c["urn:a"] == 1
+        assert "urn:a#" in c
+
+    def test_stats(self):
+        c = cache.LRUCache(1, sizeof=lambda v: 10)
+        c["a"] = 1
+        c.get("a")
+        c.get("b")
+        assert "a" in c     # does not count
+        assert c.peek("a") == 1
+        c["b"] = 2
+
+        stats = c.stats()
+        assert stats["entries"] == 1
+        assert stats["bytes"] == 10
+        assert stats["hits"] == 1
+        assert stats["misses"] == 1
+        assert stats["evictions"] == 1
+        assert stats["maxsize"] == 1
+
+class FakeClock(object):
+    def __init__(self):
+        self.now = 1000.0
+    def __call__(self):
+        return self.now
+
+class TestNegativeCache(object):
+
+    def test_ttl(self):
+        clock = FakeClock()
+        c = cache.NegativeCache(10, clock=clock)
+        assert "urn:a" not in c
+        c.add("urn:a")
+        assert "urn:a" in c
+        assert len(c) == 1
+
+        clock.now += 9
+        assert "urn:a" in c
+        clock.now += 1
+        assert "urn:a" not in c
+        assert len(c) == 0
+        assert c.stats()["hits"] == 2
+
+    def test_nottl(self):
+        clock = FakeClock()
+        c = cache.NegativeCache(None, clock=clock)
+        c.add("urn:a")
+        clock.now += 1e9
+        assert "urn:a" in c
+
+        c = cache.NegativeCache(0, clock=clock)
+        c.add("urn:a")
+        assert "urn:a" not in c
+
+    def test_invalidate(self):
+        c = cache.NegativeCache()
+        c.add("urn:a")
+        c.add("urn:b")
+        c.discard("urn:a")
+        c.discard("urn:c")
+        assert "urn:a" not in c
+        assert "urn:b" in c
+        c.clear()
+        assert len(c) == 0
+
+    def test_maxsize(self):
+        c = cache.NegativeCache(maxsize=2)
+        c.add("urn:a")
+        c.add("urn:b")
+        c.add("urn:c")
+        assert "urn:a" not in c
+        assert "urn:b" in c and "urn:c" in c
+        assert c.stats()["evictions"] == 1
@@ -0,0 +1,81 @@
+# import pytest
+from __future__ import with_statement
+import json, os, pytest
+
+import xjs.schemaloader as loader
+import xjs.depgraph as depgraph
+
+schemadir = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(
+                            os.path.dirname(os.path.dirname(__file__))))),
+                         'schemas','json')
+
+def graph(edges):
+    out = depgraph.SchemaGraph()
+    for uri, deps in edges.iteritems():
+        out.add_node(uri, deps)
+    return out
+
+class TestSchemaGraph(object):
+
+    def test_from_loader(self):
+        ldr = loader.SchemaLoader.from_directory(schemadir)
+        g = depgraph.SchemaGraph.from_loader(ldr, workers=2)
+        assert len(g) == len(ldr)
+        assert not g.errors
+
+        trans = "http://mgi.nist.gov/mgi-json-trans/v0.1"
+        xform = "http://mgi.nist.gov/jsont-xml-transf/v0.1"
+        mgi = "http://mgi.nist.gov/mgi-json-schema/v0.1"
+        assert trans in g.dependencies(xform)
+        assert xform in g.dependents(trans)
+        assert xform in g.dependents(mgi, True)
+        assert g.uri_for("http://json-schema.org/draft-04/schema") == \
+            "http://json-schema.org/draft-04/schema#"
+
+        order = g.topological_order()
+        assert len(order) == len(g)
+        for u in order:
+            for dep in g.dependencies(u):
+                if dep in g and dep not in g.dependents(u, True):
+                    assert order.index(dep) < order.index(u)
+
+    def test_errors(self):
+        ldr = loader.SchemaLoader({ "urn:goob": "/no/such/goob.json" })
+        g = depgraph.SchemaGraph.from_loader(ldr)
+        assert len(g) == 0
+        assert isinstance(g.errors["urn:goob"], IOError)
+
+    def test_cycles(self):
+        g = graph({ "urn:a": ["urn:b#/definitions/x"], 
+                    "urn:b": ["urn:c", "urn:z"], 
+                    "urn:c": ["urn:a"],
+                    "urn:d": ["urn:d", "urn:a"],
+                    "urn:e": [] })
+        assert g.cycles() == [["urn:a", "urn:b", "urn:c"], ["urn:d"]]
+        assert g.missing() == ["urn:z"]
+        order = g.topological_order()
+        assert set(order[:3]) == set(["urn:a", "urn:b", "urn:c"])
+        assert order.index("urn:d") > 2
+        with pytest.raises(depgraph.DependencyCycleError):
+            g.topological_order(True)
+
+        assert g.dependents("urn:a") == ["urn:c", "urn:d"]
+        assert g.dependents("urn:a", True) == ["urn:b", "urn:c", "urn:d"]
+        
+        g.add_node("urn:c", [])
+        assert g.cycles() == [["urn:d"]]
+        assert g.dependents("urn:a") == ["urn:d"]
+        g.remove_node("urn:d")
+        assert g.cycles() == []
+        assert g.topological_order(True) == \
+            ["urn:c", "urn:b", "urn:a", "urn:e"]
+
+    def test_levels(self):
+        g = graph({ "urn:a": ["urn:b", "urn:c"], 
+                    "urn:b": ["urn:c"], 
+                    "urn:c": [],
+                    "urn:d": ["urn:c", "urn:e"],
+                    "urn:e": ["urn:d"] })
+        assert g.levels() == [["urn:c"], ["urn:b", "urn:d", "urn:e"], 
+                              ["urn:a"]]
+        assert depgraph.SchemaGraph().levels() == []
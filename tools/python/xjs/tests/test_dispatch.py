@@ -0,0 +1,151 @@
+# import pytest
+from __future__ import with_statement
+import json, os, pytest
+import jsonschema.validators as jsch
+
+import xjs.dispatch as dispatch
+import xjs.cache as cache
+import xjs.validate as val
+import xjs.schemaloader as loader
+
+schemadir = os.path.join(
+   os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(__file__))))),
+                        "schemas", "json")
+trans = "http://mgi.nist.gov/mgi-json-trans/v0.1"
+
+anytransform = {
+    "$schema": "http://json-schema.org/draft-04/schema#",
+    "id": "urn:anytransform",
+    "oneOf": [
+        { "$ref": trans + "#/definitions/LiteralTransform" },
+        { "$ref": trans + "#/definitions/NativeTransform" },
+        { "$ref": trans + "#/definitions/ExtractTransform" }
+    ]
+}
+
+inline = [
+    { "type": "object",
+      "properties": { "kind": { "enum": [ "a" ] }, "a": { "type": "string" } },
+      "required": [ "kind", "a" ] },
+    { "type": "object",
+      "properties": { "kind": { "enum": [ "b" ] }, "b": { "type": "integer" } },
+      "required": [ "kind", "b" ] }
+]
+
+@pytest.fixture(scope="module")
+def validator(request):
+    out = val.ExtValidator.with_schema_dir(schemadir)
+    out.load_schema(anytransform)
+    out.load_schema({ "id": "urn:inline", "anyOf": inline })
+    return out
+
+def test_find_discriminator():
+    resolver = jsch.RefResolver("", {})
+    disc = dispatch.find_discriminator(inline, resolver)
+    assert disc == ("kind", { "a": 0, "b": 1 })
+
+    # not required
+    branches = json.loads(json.dumps(inline))
+    branches[1]['required'] = [ "b" ]
+    assert dispatch.find_discriminator(branches, resolver) is None
+
+    # not distinct
+    branches = json.loads(json.dumps(inline))
+    branches[1]['properties']['kind']['enum'] = [ "a" ]
+    assert dispatch.find_discriminator(branches, resolver) is None
+
+    # not constant
+    branches = json.loads(json.dumps(inline))
+    branches[1]['properties']['kind']['enum'] = [ "b", "c" ]
+    assert dispatch.find_discriminator(branches, resolver) is None
+
+    assert dispatch.find_discriminator(inline[:1], resolver) is None
+
+def test_find_discriminator_refs(validator):
+    # this will also load the transform schema into the store
+    validator.validate_against({ "$type": "literal", "value": 1 },
+                               "urn:anytransform")
+    resolver = jsch.RefResolver("urn:anytransform", anytransform,
+                                validator._schemaStore)
+
+    disc = dispatch.find_discriminator(anytransform['oneOf'], resolver)
+    assert disc == ("$type", { "literal": 0, "native": 1, "extract": 2 })
+
+def test_index():
+    resolver = jsch.RefResolver("", {})
+    index = dispatch.DiscriminatorIndex()
+    assert len(index) == 0
+
+    assert index.lookup(inline, resolver)[0] == "kind"
+    assert len(index) == 1
+    assert index.lookup(inline, resolver)[0] == "kind"
+    assert len(index) == 1
+
+    index.clear()
+    assert len(index) == 0
+
+    # transient branch lists are not cached
+    assert index.lookup(cache.TransientList(inline), resolver)[0] == "kind"
+    assert len(index) == 0
+
+    index = dispatch.DiscriminatorIndex(1)
+    index.lookup(inline, resolver)
+    index.lookup(list(inline), resolver)
+    assert len(index) == 1
+    assert index.stats()["evictions"] == 1
+
+class TestDispatch(object):
+
+    def test_valid(self, validator):
+        validator.validate_against({ "$type": "literal", "value": [1, 2] },
+                                   "urn:anytransform")
+        validator.validate_against({ "$type": "extract", "select": "/a/b" },
+                                   "urn:anytransform")
+        validator.validate_against({ "kind": "b", "b": 3 }, "urn:inline")
+
+    def test_errors_from_branch(self, validator):
+        with pytest.raises(val.ValidationError) as ex:
+            validator.validate_against({ "$type": "extract", "select": 3 },
+                                       "urn:anytransform")
+        assert ex.value.validator == "oneOf"
+        assert len(ex.value.context) == 1
+        assert list(ex.value.context[0].schema_path)[0] == 2
+
+        with pytest.raises(val.ValidationError) as ex:
+            validator.validate_against({ "kind": "a", "a": 3 }, "urn:inline")
+        assert ex.value.validator == "anyOf"
+        assert len(ex.value.context) == 1
+        assert list(ex.value.context[0].schema_path)[0] == 0
+
+    def test_nomatch(self, validator):
+        with pytest.raises(val.ValidationError) as ex:
+            validator.validate_against({ "$type": "goober", "value": 1 },
+                                       "urn:anytransform")
+        assert len(ex.value.context) == 1
+        assert list(ex.value.context[0].path) == [ "$type" ]
+
+        with pytest.raises(val.ValidationError) as ex:
+            validator.validate_against({ "kind": [ "a" ], "a": "a" },
+                                       "urn:inline")
+        assert len(ex.value.context) == 1
+
+    def test_fallback(self, validator):
+        # no discriminator value: all branches get tried
+        with pytest.raises(val.ValidationError) as ex:
+            validator.validate_against({ "a": "a" }, "urn:inline")
+        assert len(ex.value.context) == 3
+
+        with pytest.raises(val.ValidationError):
+            validator.validate_against("literal", "urn:anytransform")
+
+    def test_nodispatch(self):
+        validator = val.ExtValidator(
+            loader.SchemaLoader.from_directory(schemadir), dispatch=False)
+        validator.load_schema(anytransform)
+
+        validator.validate_against({ "$type": "literal", "value": [1, 2] },
+                                   "urn:anytransform")
+        with pytest.raises(val.ValidationError) as ex:
+            validator.validate_against({ "$type": "extract", "select": 3 },
+                                       "urn:anytransform")
+        assert len(ex.value.context) > 1
@@ -123,3 +123,162 @@ class TestInstance(object):
         assert inst.extract("/applicability/0/materialType/0") == \
             "non-specific"
 
+
+class TestPropertyIndex(object):
+
+    def names(self, data, out=None):
+        if out is None:
+            out = set()
+        if isinstance(data, dict):
+            out.update(data.keys())
+            data = data.values()
+        if isinstance(data, list):
+            for v in data:
+                self.names(v, out)
+        return out
+
+    def test_same_results(self):
+        inst = instance.Instance.from_location(exfile)
+        indexed = instance.Instance.from_location(exfile, indexed=True)
+        names = self.names(inst.data)
+        assert len(indexed.property_index()) == len(names)
+
+        for name in names | set(["goober"]):
+            assert indexed.find_obj_by_prop(name) == \
+                inst.find_obj_by_prop(name)
+            assert indexed.find_data_by_name(name) == \
+                inst.find_data_by_name(name)
+        assert indexed.find_extended_objs() == inst.find_extended_objs()
+
+    def test_index(self):
+        data = { "a": 1, "b": [ { "a": 2 }, 3, [ { "c": { "a": 4 } } ] ] }
+        idx = instance.PropertyIndex(data)
+        assert sorted(idx.names()) == ["a", "b", "c"]
+        assert "c" in idx
+        assert "d" not in idx
+        assert [p for p, o in idx.objects_with("a")] == \
+            ["/", "/b/0", "/b/2/0/c"]
+        assert idx.objects_with("d") == []
+
+    def test_invalidate(self):
+        inst = instance.Instance({ "a": { "b": 1 } }, indexed=True)
+        assert inst.find_data_by_name("b") == [("/a/b", 1)]
+        inst.data["c"] = { "b": 2 }
+        assert inst.find_data_by_name("b") == [("/a/b", 1)]
+        inst.invalidate_index()
+        assert sorted(inst.find_data_by_name("b")) == \
+            [("/a/b", 1), ("/c/b", 2)]
+
+def test_pointer_from_path():
+    assert instance.pointer_from_path(()) == "/"
+    assert instance.pointer_from_path(("a", 0, "b")) == "/a/0/b"
+    assert instance.pointer_from_path(("a/b", "m~n", "")) == "/a~1b/m~0n/"
+    assert instance.path_from_pointer("/a~1b/m~0n/") == ("a/b", "m~n", "")
+    assert instance.path_from_pointer("/") == ()
+    assert instance.path_from_pointer("") == ()
+    assert instance.path_from_pointer("/~01") == ("~1",)
+
+    for ptr in ("a", "a/b", "~1", "/a~", "/a/~2b", "/~/c"):
+        with pytest.raises(instance.PointerSyntaxError):
+            instance.path_from_pointer(ptr)
+
+def test_array_index():
+    assert instance.array_index("0") == 0
+    assert instance.array_index("12") == 12
+    for token in ("-1", "01", " 1", "1 ", "+1", "1\n", "-", "", "a"):
+        assert instance.array_index(token) is None
+
+def test_walk():
+    data = { "a": [ { "b": 1 }, 2 ], "c": "d" }
+    assert [p for p, n in instance.walk(data)] == [(), ("a",), ("a", 0)]
+    assert list(instance.walk(3)) == []
+
+    # deeper than the recursion limit
+    deep = {}
+    node = deep
+    for i in xrange(5000):
+        node["x"] = {}
+        node = node["x"]
+    node[instance.EXTSCHEMAS] = [ "urn:ext" ]
+    inst = instance.Instance(deep)
+    found = list(inst.iter_extended_objs(True))
+    assert len(found) == 1
+    assert found[0][0] == ("x",) * 5000
+    assert inst.has_extensions()
+
+class TestIterFind(object):
+
+    def test_same_results(self):
+        inst = instance.Instance.from_location(exfile)
+        for name in ("subject", "name", instance.EXTSCHEMAS, "goober"):
+            assert list(inst.iter_obj_by_prop(name)) == \
+                inst.find_obj_by_prop(name)
+            assert list(inst.iter_data_by_name(name)) == \
+                inst.find_data_by_name(name)
+        assert list(inst.iter_extended_objs()) == inst.find_extended_objs()
+
+    def test_escaping(self):
+        inst = instance.Instance({ "a/b": [ { "m~n": { "t": 1 } } ] })
+        assert list(inst.iter_data_by_name("t")) == [("/a~1b/0/m~0n/t", 1)]
+        assert list(inst.iter_obj_by_prop("t", True)) == \
+            [(("a/b", 0, "m~n"), { "t": 1 })]
+
+    def test_early_stop(self):
+        inst = instance.Instance.from_location(exfile)
+        assert inst.has_extensions()
+        found = inst.iter_extended_objs()
+        assert next(found)[0] == "/"
+        assert not instance.Instance({ "a": [ 1 ] }).has_extensions()
+
+class TestCompiledPointer(object):
+
+    data = { "a": { "b": [ 10, { "c": "x", "d/e": 1, "f~g": 2 } ] }, 
+             "": 3, "h": None }
+
+    def test_extract(self):
+        cp = instance.compile_pointer("/a/b/1/c")
+        assert cp.path == ("a", "b", "1", "c")
+        assert cp.extract(self.data) == "x"
+        assert instance.compile_pointer("/a/b/1/c") is cp
+        assert instance.compile_pointer(cp) is cp
+
+        assert instance.compile_pointer("/").extract(self.data) is self.data
+        assert instance.compile_pointer("").extract(self.data) is self.data
+        assert instance.compile_pointer("/a/b/1/d~1e").extract(self.data) == 1
+        assert instance.compile_pointer("/a/b/1/f~0g").extract(self.data) == 2
+        assert instance.compile_pointer("/h").extract(self.data) is None
+
+        for ptr in ("/a/c", "/a/b/2", "/a/b/01", "/a/b/-", "/a/b/0/x",
+                    "/a/b/-1"):
+            with pytest.raises(instance.ExtractError):
+                instance.compile_pointer(ptr).extract(self.data)
+        with pytest.raises(LookupError):
+            instance.compile_pointer("/x").extract(self.data)
+        with pytest.raises(ValueError):
+            instance.compile_pointer("a").extract(self.data)
+        with pytest.raises(instance.ExtractError):
+            instance.compile_pointer("a/b").extract(self.data)
+
+    def test_pointer_set(self):
+        ptrs = ["/a/b/1/c", "/a/b/0", "/", "/a/b/1/d~1e", "/a/b/1/c"]
+        ps = instance.compile_pointers(ptrs)
+        assert len(ps) == 5
+        assert instance.compile_pointers(ptrs) is ps
+        assert ps.extract(self.data) == ["x", 10, self.data, 1, "x"]
+
+        ps = instance.compile_pointers(["/a/b/0", "/a/x/y", "/a/b/5"])
+        assert ps.extract(self.data, None) == [10, None, None]
+        with pytest.raises(instance.ExtractError) as exc:
+            ps.extract(self.data)
+        assert exc.value.pointer in ("/a/x/y", "/a/b/5")
+
+    def test_extract_many(self):
+        inst = instance.Instance.from_location(exfile)
+        ptrs = ["/content/subject", "/curation/contact/name", 
+                "/applicability/0/materialType/0", "/goober"]
+        vals = inst.extract_many(ptrs, "missing")
+        assert vals[1] == "Zachary Trautt"
+        assert vals[2] == "non-specific"
+        assert vals[3] == "missing"
+        for ptr, val in zip(ptrs[:3], vals):
+            assert inst.extract(ptr) == val
@@ -0,0 +1,82 @@
+# import pytest
+from __future__ import with_statement
+import json, os, pytest
+
+import xjs.jsonbackend as jb
+
+schemadir = os.path.join(
+   os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(__file__))))),
+                        "schemas", "json")
+exdir = os.path.join(
+   os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(__file__))))),
+                        "examples", "json")
+
+@pytest.fixture
+def restore(request):
+    name = jb.backend_name()
+    request.addfinalizer(lambda: jb.use_backend(name))
+
+def same(a, b):
+    # equal, with the same types throughout
+    if type(a) is not type(b):
+        return False
+    if isinstance(a, dict):
+        return sorted(a.keys()) == sorted(b.keys()) and \
+               all([same(a[k], b[k]) for k in a])
+    if isinstance(a, list):
+        return len(a) == len(b) and all([same(*p) for p in zip(a, b)])
+    if isinstance(a, float):
+        # also handles NaN
+        return repr(a) == repr(b)
+    return a == b
+
+def test_default(restore):
+    assert "json" in jb.available_backends()
+    if not os.environ.get(jb.ENV_VAR):
+        assert jb.backend_name() == "json"
+    jb.use_backend()
+    assert jb.backend_name() == jb.DEFAULT == "json"
+
+def test_use_backend(restore):
+    jb.use_backend("json")
+    assert jb.backend_name() == "json"
+    with pytest.raises(ValueError):
+        jb.use_backend("goober")
+    assert jb.backend_name() == "json"
+
+@pytest.mark.parametrize("name", jb.PREFERENCE)
+def test_consistency(name, restore):
+    if name not in jb.available_backends():
+        pytest.skip(name + " not installed")
+    jb.use_backend(name)
+
+    docs = [ '{"a": 1, "a": 2}', '{"k": "v", "u": "\\u00e9"}',
+             '[1, 1.0, 0.1, 1e400, -0, 1.7976931348623157e308]',
+             '[123456789012345678901234567890, -9223372036854775809]',
+             '[NaN, Infinity]' ]
+    for d in docs:
+        assert same(jb.loads(d), json.loads(d))
+        assert same(jb.loads(d.decode("utf-8")), json.loads(d))
+
+    for dir in (schemadir, exdir):
+        for f in os.listdir(dir):
+            if f.endswith(".json"):
+                with open(os.path.join(dir, f)) as fd:
+                    data = fd.read()
+                assert same(jb.loads(data), json.loads(data))
+
+    with pytest.raises(ValueError):
+        jb.loads('{"a": ')
+
+    # invalid documents and unpaired surrogates; the lenient backends are
+    # known to differ here.
+    if name in jb.LENIENT:
+        return
+    for d in [ '[01]', '[1.5e]', '["a\x01b"]', '["a\nb"]' ]:
+        with pytest.raises(ValueError):
+            jb.loads(d)
+        with pytest.raises(ValueError):
+            jb.loads(d.decode("utf-8"))
+
+    for d in [ '["\\ud800"]', '["\\udc00x"]', '["\\ud800\\udc00"]' ]:
+        assert same(jb.loads(d), json.loads(d))
@@ -2,6 +2,7 @@
 from __future__ import with_statement
 import json, os, pytest
 from cStringIO import StringIO
+from . import Tempfiles
 import xjs.location as location
 
 jsonloc = """
@@ -196,3 +197,60 @@ def test_read_loc_file():
         assert data.get("uri:nist.gov/goober") == "http://www.ivoa.net/xml/goober"
         assert data.get("http://mgi.nist.gov/goof") == \
             os.path.join(os.getcwd(),"goof.xml")
+
+def test_read_prefix_rules(request):
+    tf = Tempfiles()
+    request.addfinalizer(tf.clean)
+    locfile = os.path.join(tf.parent, "rules.txt")
+    tf.track("rules.txt")
+    with open(locfile, "w") as fd:
+        fd.write("http://mgi.nist.gov/json/* json/\n"
+                 "http://mgi.nist.gov/ext/* ext/*.json\n"
+                 "http://mgi.nist.gov/remote/* http://example.com/mirror/\n")
+
+    data = location.read_loc_file(locfile, basedir=datadir)
+    assert data["http://mgi.nist.gov/json/*"] == \
+        os.path.join(datadir, "json", "*")
+    assert data["http://mgi.nist.gov/ext/*"] == \
+        os.path.join(datadir, "ext", "*.json")
+    assert data["http://mgi.nist.gov/remote/*"] == \
+        "http://example.com/mirror/*"
+
+def test_split_rules():
+    (exact, rules) = location.split_rules({ "uri:a": "a.json", 
+                                            "uri:b/*": "b/*" })
+    assert exact == { "uri:a": "a.json" }
+    assert rules == { "uri:b/": "b/*" }
+
+def test_expand_template():
+    assert location.expand_template("/m/*.json", "a/b") == "/m/a/b.json"
+    assert location.expand_template("/m/", "a/b") == "/m/a/b"
+    with pytest.raises(KeyError):
+        location.expand_template("/m/*", "../b")
+
+class TestPrefixIndex(object):
+
+    def test_longest_match(self):
+        idx = location.PrefixIndex({ "http://a.org/": "/a/*",
+                                     "http://a.org/b/": "/b/*" })
+        assert len(idx) == 2
+        assert idx.longest_match("http://a.org/c") == ("http://a.org/", "/a/*")
+        assert idx.longest_match("http://a.org/b/c") == \
+            ("http://a.org/b/", "/b/*")
+        assert idx.longest_match("http://a.org/b") == ("http://a.org/", "/a/*")
+        assert idx.longest_match("http://b.org/") is None
+
+        idx.add("http://a.org/", "/A/*")
+        assert len(idx) == 2
+        assert idx.rules() == { "http://a.org/": "/A/*",
+                                "http://a.org/b/": "/b/*" }
+
+    def test_locate(self):
+        idx = location.PrefixIndex()
+        assert not idx
+        with pytest.raises(KeyError):
+            idx.locate("http://a.org/c")
+        idx.add("http://a.org/", "/a/*.json")
+        assert idx.locate("http://a.org/c") == "/a/c.json"
+        assert idx.locate("http://a.org/c#") == "/a/c.json"
+        assert idx.locate("http://a.org/c#/definitions/d") == "/a/c.json"
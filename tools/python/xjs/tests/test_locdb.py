@@ -0,0 +1,126 @@
+# import pytest
+from __future__ import with_statement
+import json, os, pytest
+
+from . import Tempfiles
+import xjs.locdb as locdb
+import xjs.schemaloader as loader
+
+schemadir = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(
+                            os.path.dirname(os.path.dirname(__file__))))),
+                         'schemas','json')
+locfile = os.path.join(schemadir, "schemaLocation.json")
+datadir = os.path.join(os.path.dirname(__file__), "data")
+
+@pytest.fixture
+def dbfile(request):
+    tf = Tempfiles()
+    request.addfinalizer(tf.clean)
+    tf.track("locs.db")
+    return os.path.join(tf.parent, "locs.db")
+
+class TestLocationDB(object):
+
+    def test_locations(self, dbfile):
+        db = locdb.LocationDB(dbfile)
+        assert len(db) == 0
+        db.add_locations({ "urn:a": "/a.json", "urn:b": "/b.json",
+                           "http://ex.com/s/*": "/s/*.json" })
+        assert len(db) == 2
+        assert db.locate("urn:a") == "/a.json"
+        assert "urn:b" in db
+        assert "urn:c" not in db
+        with pytest.raises(KeyError):
+            db.locate("urn:c")
+        assert db.prefix_rules() == { "http://ex.com/s/": "/s/*.json" }
+        assert db.schemes() == set(["urn", "http"])
+
+        db.add_locations({ "urn:a": "/A.json" })
+        assert db.locate("urn:a") == "/A.json"
+        db.close()
+
+        db = locdb.LocationDB(dbfile)
+        assert len(db) == 2
+        assert list(db.iterURIs(batch=1)) == ["urn:a", "urn:b"]
+        db.close()
+
+    def test_parsed(self, dbfile):
+        db = locdb.LocationDB(dbfile)
+        doc = { u"id": u"urn:a", u"n": [1, 2.5, None, True, { u"x": u"y" }] }
+        assert db.load_parsed("/a.json", 10.5, 100) is None
+        db.save_parsed("/a.json", 10.5, 100, doc)
+        assert db.load_parsed("/a.json", 10.5, 100) == doc
+        assert db.load_parsed("/a.json", 11.0, 100) is None
+        db.clear_parsed()
+        assert db.load_parsed("/a.json", 10.5, 100) is None
+        db.close()
+
+def test_convert_location_file(dbfile):
+    assert locdb.convert_location_file(locfile, dbfile) == 7
+    db = locdb.LocationDB(dbfile)
+    assert db.locate("http://mgi.nist.gov/mgi-json-schema/v0.1") == \
+        os.path.join(schemadir, "mgi-json-schema.json")
+    db.close()
+
+class TestDBSchemaLoader(object):
+
+    def test_load_schema(self, dbfile):
+        locdb.convert_location_file(locfile, dbfile)
+        ldr = locdb.DBSchemaLoader(dbfile, cache=False)
+        assert len(ldr) == 7
+        assert "http" in ldr._schemes
+        uri = "http://mgi.nist.gov/mgi-json-schema/v0.1"
+        assert uri in list(ldr.iterURIs())
+
+        schema = ldr.load_schema(uri)
+        assert schema['id'] == uri
+        path = os.path.join(schemadir, "mgi-json-schema.json")
+        st = os.stat(path)
+        assert ldr.db.load_parsed(path, st.st_mtime, st.st_size) == schema
+
+        # a new loader uses the saved form
+        ldr = locdb.DBSchemaLoader(dbfile, cache=False)
+        ldr.db.save_parsed(path, st.st_mtime, st.st_size, { "id": "goob" })
+        assert ldr.load_schema(uri) == { "id": "goob" }
+        ldr = locdb.DBSchemaLoader(dbfile, cache=False, save_parsed=False)
+        assert ldr.load_schema(uri)['id'] == uri
+
+        with pytest.raises(KeyError):
+            ldr.load_schema("urn:goob")
+
+    def test_add_locations(self, dbfile):
+        ldr = locdb.DBSchemaLoader(dbfile)
+        rule = os.path.join(datadir, "*.json")
+        ldr.add_locations({ "urn:a": "a.json", "urn:p/*": rule })
+        assert ldr.locate("urn:a") == "a.json"
+        assert ldr.locate("urn:p/loc") == os.path.join(datadir, "loc.json")
+        assert "urn" in ldr._schemes
+        with pytest.raises(KeyError):
+            ldr.locate("urn:p/q")
+
+        ldr = locdb.DBSchemaLoader(dbfile)
+        assert ldr.locate("urn:p/loc") == os.path.join(datadir, "loc.json")
+        assert ldr.prefix_rules() == { "urn:p/": rule }
+
+    def test_shared(self, dbfile):
+        locdb.convert_location_file(locfile, dbfile)
+        ldr = locdb.DBSchemaLoader(dbfile, cache=False)
+        uri = "http://mgi.nist.gov/mgi-json-schema/v0.1"
+        ldr.load_schema(uri)
+
+        # documents restored from the database are shared via the cache
+        cache = loader.ParsedSchemaCache()
+        ldr = locdb.DBSchemaLoader(dbfile, cache=cache)
+        reads = []
+        load_parsed = ldr.db.load_parsed
+        def counting(*args):
+            reads.append(args[0])
+            return load_parsed(*args)
+        ldr.db.load_parsed = counting
+
+        schema = ldr.load_schema(uri)
+        assert ldr.load_schema(uri) is schema
+        assert locdb.DBSchemaLoader(ldr.db, cache=cache).load_schema(uri) \
+            is schema
+        assert len(reads) == 1
+        assert os.path.join(schemadir, "mgi-json-schema.json") in cache
@@ -0,0 +1,24 @@
+# import pytest
+from __future__ import with_statement
+import json, os, pytest
+
+import xjs.mirror as mirror
+
+def test_mirror_filename():
+    assert mirror.mirror_filename("http://mgi.nist.gov/json/res-md/v1.0wd#") \
+        == "mgi.nist.gov/json/res-md/v1.0wd.json"
+    assert mirror.mirror_filename("http://example.com/a/schema.json") == \
+        "example.com/a/schema.json"
+    assert mirror.mirror_filename("http://example.com/") == \
+        "example.com/index.json"
+    assert mirror.mirror_filename("http://example.com/../x y?v=1") == \
+        "example.com/x_y_v_1.json"
+    assert mirror.mirror_filename("urn:goob") == "urn/goob.json"
+
+def test_schemas_for_document():
+    doc = { "$schema": "http://example.com/base#",
+            "$extensionSchemas": [ "http://example.com/ext#/definitions/A" ],
+            "sub": { "$extensionSchemas": [ "ext2", 
+                                            "http://example.com/base" ] } }
+    assert mirror.schemas_for_document(doc) == \
+        [ "http://example.com/base", "http://example.com/ext", "ext2" ]
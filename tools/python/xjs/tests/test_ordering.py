@@ -0,0 +1,95 @@
+# import pytest
+from __future__ import with_statement
+import json, os, pytest
+import jsonschema.validators as jsch
+
+import xjs.ordering as ordering
+import xjs.cache as cache
+import xjs.validate as val
+import xjs.schemaloader as loader
+
+schemadir = os.path.join(
+   os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(__file__))))),
+                        "schemas", "json")
+exdir = os.path.join(
+   os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(__file__))))),
+                        "examples", "json")
+ipr_ex = os.path.join(exdir, "ipr.json")
+
+schema = {
+    "id": "http://example.com/ordered",
+    "oneOf": [ { "type": "string" }, { "type": "integer" } ],
+    "pattern": "^a+$",
+    "required": [ "name" ],
+    "type": "object",
+    "properties": { "name": { "type": "string" } }
+}
+
+def test_keyword_cost():
+    assert ordering.keyword_cost("type") < ordering.keyword_cost("required")
+    assert ordering.keyword_cost("required") < ordering.keyword_cost("pattern")
+    assert ordering.keyword_cost("pattern") < ordering.keyword_cost("oneOf")
+    assert ordering.keyword_cost("oneOf") < ordering.keyword_cost("$ref")
+    assert ordering.keyword_cost("goober") == ordering.DEFAULT_COST
+    assert ordering.keyword_cost("enum", range(100)) > \
+           ordering.keyword_cost("enum", [1])
+
+def test_order_keywords():
+    keys = [k for k, v in ordering.order_keywords(schema)]
+    assert keys[0] == "type"
+    assert keys[1] in ("required", "id")
+    assert keys.index("required") < keys.index("pattern")
+    assert keys.index("pattern") < keys.index("properties")
+    assert keys[-1] == "oneOf"
+    assert set(keys) == set(schema.keys())
+
+def test_keyword_order():
+    order = ordering.KeywordOrder()
+    assert len(order) == 0
+    items = order.items(schema)
+    assert order.items(schema) is items
+    assert len(order) == 1
+    order.clear()
+    assert len(order) == 0
+
+    # transient schemas are not cached
+    order.items(cache.TransientDict(schema))
+    assert len(order) == 0
+
+    order = ordering.KeywordOrder(2)
+    for i in range(5):
+        order.items({ "minimum": i })
+    assert len(order) == 2
+    assert order.stats()["evictions"] == 3
+
+def test_ordered_validator():
+    order = ordering.KeywordOrder()
+    cls = ordering.ordered_validator(jsch.Draft4Validator, order)
+    assert issubclass(cls, jsch.Draft4Validator)
+
+    # the type check comes first
+    err = next(cls(schema).iter_errors([]))
+    assert err.validator == "type"
+    assert list(err.schema_path) == [ "type" ]
+
+    err = next(cls(schema).iter_errors({}))
+    assert err.validator == "required"
+
+    assert cls(schema).is_valid({ "name": "Bob" }) is False  # fails oneOf
+    assert len(list(cls(schema).iter_errors({ "name": 3 }))) == 2
+
+class TestFailFast(object):
+
+    def test_failfast(self):
+        validator = val.ExtValidator(
+            loader.SchemaLoader.from_directory(schemadir), failfast=True)
+        validator.validate_file(ipr_ex)
+
+        validator.load_schema(schema)
+        with pytest.raises(val.ValidationError) as ex:
+            validator.validate_against([], schema['id'])
+        assert ex.value.validator == "type"
+
+        with pytest.raises(val.ValidationError) as ex:
+            validator.validate_against({ "name": 3 }, schema['id'])
+        assert list(ex.value.schema_path) == [ "properties", "name", "type" ]
@@ -0,0 +1,365 @@
+# import pytest
+from __future__ import with_statement
+import json, os, pytest, threading, hashlib, shutil
+from BaseHTTPServer import HTTPServer, BaseHTTPRequestHandler
+from SocketServer import ThreadingMixIn
+
+from . import Tempfiles
+import xjs.remote as remote
+import xjs.schemaloader as loader
+
+schemadir = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(
+                            os.path.dirname(os.path.dirname(__file__))))),
+                         'schemas','json')
+
+class SchemaRequestHandler(BaseHTTPRequestHandler):
+    """
+    serve the files in schemadir, supporting ETag-based conditional requests
+    """
+    # Cache-Control header value to send
+    cache_control = None
+
+    # the number of times requests under /flaky/ should fail before
+    # succeeding
+    failures = 0
+
+    # the request paths received and the response status codes
+    log = []
+
+    def do_GET(self):
+        path = self.path
+        if path.startswith("/flaky/"):
+            if SchemaRequestHandler.failures > 0:
+                SchemaRequestHandler.failures -= 1
+                return self._respond(503, "try again")
+            path = path[len("/flaky"):]
+
+        filepath = os.path.join(schemadir, path.lstrip("/"))
+        if not os.path.isfile(filepath):
+            return self._respond(404, "not found")
+        with open(filepath) as fd:
+            body = fd.read()
+
+        etag = '"%s"' % hashlib.md5(body).hexdigest()
+        if self.headers.get("If-None-Match") == etag:
+            return self._respond(304, None, etag)
+        self._respond(200, body, etag)
+
+    def _respond(self, status, body, etag=None):
+        SchemaRequestHandler.log.append((self.path, status))
+        self.send_response(status)
+        if etag:
+            self.send_header("ETag", etag)
+        if self.cache_control:
+            self.send_header("Cache-Control", self.cache_control)
+        if body is not None:
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        if body is not None:
+            self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+class SchemaServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+@pytest.fixture(scope="module")
+def server(request):
+    srv = SchemaServer(("127.0.0.1", 0), SchemaRequestHandler)
+    thread = threading.Thread(target=srv.serve_forever)
+    thread.daemon = True
+    thread.start()
+    def fin():
+        srv.shutdown()
+        srv.server_close()
+    request.addfinalizer(fin)
+    return "http://127.0.0.1:%d/" % srv.server_address[1]
+
+@pytest.fixture
+def handler(request):
+    SchemaRequestHandler.cache_control = None
+    SchemaRequestHandler.failures = 0
+    del SchemaRequestHandler.log[:]
+    return SchemaRequestHandler
+
+@pytest.fixture
+def cachedir(request):
+    tf = Tempfiles()
+    out = tf.mkdir("remotecache")
+    request.addfinalizer(tf.clean)
+    return out
+
+class FakeClock(object):
+    def __init__(self):
+        self.now = 1000.0
+    def __call__(self):
+        return self.now
+
+def test_freshness():
+    assert remote.freshness({}, 10.0) == 10.0
+    assert remote.freshness({"cache-control": "max-age=60"}, 10.0) == 70.0
+    assert remote.freshness({"cache-control": "public, max-age=\"60\""},
+                            10.0) == 70.0
+    assert remote.freshness({"cache-control": "no-cache, max-age=60"},
+                            10.0) == 10.0
+    assert remote.freshness({"cache-control": "no-store"}, 10.0) is None
+    assert remote.freshness({"expires": "Thu, 01 Jan 1970 00:01:00 GMT"},
+                            10.0) == 60
+
+class TestRemoteLoader(object):
+
+    def test_fetch(self, server, handler):
+        rl = remote.RemoteLoader(backoff=0)
+        schema = rl.fetch(server + "mgi-json-schema.json")
+        assert schema['id'] == "http://mgi.nist.gov/mgi-json-schema/v0.1"
+        assert rl.stats()['fetched'] == 1
+
+        with pytest.raises(remote.NotFoundError) as exc:
+            rl.fetch(server + "goober.json")
+        assert isinstance(exc.value, KeyError)
+        assert isinstance(exc.value, IOError)
+        rl.close()
+
+    def test_retry(self, server, handler):
+        rl = remote.RemoteLoader(backoff=0, retries=2)
+        handler.failures = 2
+        schema = rl.fetch(server + "flaky/mgi-json-schema.json")
+        assert schema['id'] == "http://mgi.nist.gov/mgi-json-schema/v0.1"
+        assert rl.stats()['retried'] == 2
+
+        handler.failures = 3
+        with pytest.raises(IOError):
+            rl.fetch(server + "flaky/mgi-json-schema.json")
+
+    def test_revalidate(self, server, handler, cachedir):
+        rl = remote.RemoteLoader(cachedir, backoff=0)
+        url = server + "mgi-json-schema.json"
+        schema = rl.fetch(url)
+        assert handler.log == [ ("/mgi-json-schema.json", 200) ]
+
+        # no max-age: revalidate every time
+        assert rl.fetch(url) == schema
+        assert handler.log[-1] == ("/mgi-json-schema.json", 304)
+        assert rl.stats()['revalidated'] == 1
+
+        # a new loader will use the same cache
+        rl = remote.RemoteLoader(cachedir, backoff=0)
+        assert rl.fetch(url) == schema
+        assert handler.log[-1] == ("/mgi-json-schema.json", 304)
+
+        rl.invalidate(url)
+        assert rl.fetch(url) == schema
+        assert handler.log[-1] == ("/mgi-json-schema.json", 200)
+
+    def test_maxage(self, server, handler, cachedir):
+        clock = FakeClock()
+        rl = remote.RemoteLoader(cachedir, backoff=0, clock=clock)
+        url = server + "mgi-json-trans.json"
+        handler.cache_control = "max-age=60"
+
+        schema = rl.fetch(url)
+        assert len(handler.log) == 1
+        clock.now += 30
+        assert rl.fetch(url) == schema
+        assert len(handler.log) == 1
+        assert rl.stats()['hits'] == 1
+
+        clock.now += 31
+        assert rl.fetch(url) == schema
+        assert handler.log[-1] == ("/mgi-json-trans.json", 304)
+
+    def test_nostore(self, server, handler, cachedir):
+        rl = remote.RemoteLoader(cachedir, backoff=0)
+        handler.cache_control = "no-store"
+        rl.fetch(server + "mgi-json-trans.json")
+        rl.fetch(server + "mgi-json-trans.json")
+        assert handler.log[-1] == ("/mgi-json-trans.json", 200)
+        assert len(os.listdir(cachedir)) == 0
+
+class TestSchemaLoaderRemote(object):
+
+    def test_load_schema(self, server, handler, cachedir):
+        rl = remote.RemoteLoader(cachedir, backoff=0)
+        ldr = loader.SchemaLoader(
+            { "http://mgi.nist.gov/mgi-json-schema/v0.1":
+                                         server + "mgi-json-schema.json" },
+            remote=rl)
+        schema = ldr.load_schema("http://mgi.nist.gov/mgi-json-schema/v0.1")
+        assert schema['id'] == "http://mgi.nist.gov/mgi-json-schema/v0.1"
+        assert rl.stats()['fetched'] == 1
+
+    def test_factories(self, request, server, handler):
+        tf = Tempfiles()
+        request.addfinalizer(tf.clean)
+        sdir = tf.mkdir("remotelocs")
+        locfile = os.path.join(sdir, loader.SCHEMA_LOCATION_FILE)
+        with open(locfile, "w") as fd:
+            json.dump({ "http://mgi.nist.gov/mgi-json-schema/v0.1":
+                                        server + "mgi-json-schema.json" }, fd)
+
+        rl = remote.RemoteLoader(backoff=0)
+        for ldr in (loader.SchemaLoader.from_location_file(locfile, 
+                                                           remote=rl),
+                    loader.SchemaLoader.from_directory(sdir, remote=rl)):
+            schema = ldr.load_schema("http://mgi.nist.gov/mgi-json-schema/v0.1")
+            assert schema['id'] == "http://mgi.nist.gov/mgi-json-schema/v0.1"
+        assert rl.stats()['fetched'] == 2
+
+    def test_shared(self, server, handler):
+        ldr = loader.SchemaLoader(
+            { "http://mgi.nist.gov/mgi-json-schema/v0.1":
+                                         server + "mgi-json-schema.json" })
+        schema = ldr.load_schema("http://mgi.nist.gov/mgi-json-schema/v0.1")
+        assert schema['id'] == "http://mgi.nist.gov/mgi-json-schema/v0.1"
+        assert remote.shared_loader() is remote.shared_loader()
+
+class TestPrefetch(object):
+
+    def locations(self, server):
+        with open(os.path.join(schemadir, "schemaLocation.json")) as fd:
+            locs = json.load(fd)
+        return dict([(u, server + f) for u, f in locs.iteritems()])
+
+    def test_prefetch(self, server, handler):
+        rl = remote.RemoteLoader(backoff=0)
+        ldr = loader.SchemaLoader(self.locations(server), remote=rl)
+
+        docs = ldr.prefetch("http://mgi.nist.gov/jsont-xml-transf/v0.1")
+        assert sorted(docs.keys()) == [
+            "http://mgi.nist.gov/jsont-xml-transf/v0.1",
+            "http://mgi.nist.gov/mgi-json-schema/v0.1",
+            "http://mgi.nist.gov/mgi-json-trans/v0.1"
+        ]
+        assert len(handler.log) == 3
+
+        # all are now available without another request
+        schema = ldr.load_schema("http://mgi.nist.gov/mgi-json-trans/v0.1")
+        assert schema['id'] == "http://mgi.nist.gov/mgi-json-trans/v0.1"
+        assert ldr.load_schema("http://mgi.nist.gov/mgi-json-schema/v0.1#")
+        assert len(handler.log) == 3
+
+        ldr.prefetch("http://mgi.nist.gov/jsont-xml-transf/v0.1")
+        assert len(handler.log) == 3
+
+    def test_missing(self, server, handler):
+        locs = self.locations(server)
+        locs["http://mgi.nist.gov/mgi-json-trans/v0.1"] = server + "goob.json"
+        ldr = loader.SchemaLoader(locs, remote=remote.RemoteLoader(backoff=0))
+
+        docs = ldr.prefetch("http://mgi.nist.gov/jsont-xml-transf/v0.1", 2)
+        assert sorted(docs.keys()) == [
+            "http://mgi.nist.gov/jsont-xml-transf/v0.1",
+            "http://mgi.nist.gov/mgi-json-schema/v0.1"
+        ]
+        with pytest.raises(IOError):
+            ldr.load_schema("http://mgi.nist.gov/mgi-json-trans/v0.1")
+
+class TestTieredSchemaLoader(object):
+
+    def tiered(self, tf, remote_loader):
+        from xjs.bundle import write_bundle
+        sdir = tf.mkdir("tiered")
+        shutil.copy(os.path.join(schemadir, "mgi-json-schema.json"), sdir)
+        with open(os.path.join(schemadir, "res-md_schema.json")) as fd:
+            resmd = json.load(fd)
+        bfile = os.path.join(tf.parent, "tiered.bndl")
+        tf.track("tiered.bndl")
+        write_bundle(bfile, { resmd["id"]: resmd })
+
+        return loader.TieredSchemaLoader.from_sources(sdir, bfile, 
+                                                      remote_loader)
+
+    def test_load_schema(self, request, server, handler):
+        tf = Tempfiles()
+        request.addfinalizer(tf.clean)
+        ldr = self.tiered(tf, remote.RemoteLoader(backoff=0))
+        assert [t[0] for t in ldr.tiers()] == \
+            ["memory", "directory", "bundle", "remote"]
+        assert "http" in ldr._schemes
+
+        mgi = "http://mgi.nist.gov/mgi-json-schema/v0.1"
+        resmd = "http://mgi.nist.gov/json/res-md/v1.0wd"
+        trans = server + "mgi-json-trans.json"
+
+        assert ldr.load_schema(mgi)['id'] == mgi
+        assert ldr.load_schema(resmd)['id'] == resmd
+        assert ldr.load_schema(trans)['id'] == \
+            "http://mgi.nist.gov/mgi-json-trans/v0.1"
+        assert len(handler.log) == 1
+        stats = ldr.stats()
+        assert stats["memory"]["misses"] == 3
+        assert stats["memory"]["stored"] == 3
+        assert stats["directory"]["hits"] == 1
+        assert stats["directory"]["stored"] == 2
+        assert stats["bundle"]["hits"] == 1
+        assert stats["remote"]["hits"] == 1
+
+        # now all served from memory
+        for uri in (mgi, resmd, trans):
+            assert ldr.load_schema(uri)
+        stats = ldr.stats()
+        assert stats["memory"]["hits"] == 3
+        assert stats["directory"]["hits"] == 1
+        assert stats["memory"]["mean"] >= 0.0
+        assert len(handler.log) == 1
+
+        with pytest.raises(KeyError):
+            ldr.load_schema("urn:goob")
+        with pytest.raises(KeyError):
+            ldr.load_schema(server + "goob.json")
+        assert ldr.stats()["remote"]["misses"] == 2
+        handler.failures = 3
+        with pytest.raises(IOError):
+            ldr.load_schema(server + "flaky/goob.json")
+        assert ldr.stats()["remote"]["errors"] == 1
+
+        # the remote schema was saved to the directory
+        ldr = self.tiered(tf, False)
+        assert ldr.locate(trans).startswith(os.path.join(tf.parent, "tiered"))
+        assert ldr.load_schema(trans)['id'] == \
+            "http://mgi.nist.gov/mgi-json-trans/v0.1"
+        assert ldr.stats()["directory"]["hits"] == 1
+        ldr.tiers()[2][1].close()
+
+    def test_no_writeback(self, server, handler):
+        ldr = loader.TieredSchemaLoader(
+            [loader.MemorySchemaLoader(), 
+             loader.RemoteSchemaLoader(remote.RemoteLoader(backoff=0))],
+            writeback=False)
+        uri = server + "mgi-json-trans.json"
+        assert ldr.load_schema(uri)
+        assert ldr.load_schema(uri)
+        stats = ldr.stats()
+        assert stats.keys() == ["MemorySchemaLoader", "RemoteSchemaLoader"]
+        assert stats["MemorySchemaLoader"]["hits"] == 0
+        assert stats["RemoteSchemaLoader"]["hits"] == 2
+
+    def test_validator(self, server, handler):
+        from xjs.validate import ExtValidator, ValidationError, SchemaError
+        ldr = loader.TieredSchemaLoader.from_sources(
+            remote=remote.RemoteLoader(backoff=0))
+        assert len(ldr) == 0
+        assert ldr
+
+        validator = ExtValidator(ldr)
+        assert validator._loader is ldr
+        trans = server + "mgi-json-trans.json"
+        validator.validate_against("string", trans+"#/definitions/JSONType")
+        with pytest.raises(ValidationError):
+            validator.validate_against("goob", trans+"#/definitions/JSONType")
+        assert ldr.stats()["remote"]["hits"] == 1
+
+        # a schema the server does not have is remembered as missing
+        goob = server + "goob.json"
+        del handler.log[:]
+        validator.validate_against("goob", [goob])
+        assert handler.log and \
+               all([r == ("/goob.json", 404) for r in handler.log])
+        requests = len(handler.log)
+        validator.validate_against("goob", [goob])
+        assert len(handler.log) == requests
+        assert ldr.stats()["remote"]["errors"] == 0
+        with pytest.raises(SchemaError):
+            validator.validate_against("goob", [goob], True)
@@ -57,6 +57,50 @@ class TestSchemaLoader(object):
         assert ldr.locate("http://mgi.nist.gov/goof") == \
             "http://www.ivoa.net/xml/goober"
 
+    def test_prefix_rules(self):
+        ldr = loader.SchemaLoader(locs)
+        ldr.add_locations({ "http://mgi.nist.gov/json/*": 
+                                os.path.join(schemadir, "*"),
+                            "http://mgi.nist.gov/json/ext/*":
+                                os.path.join(schemadir, "extern", "*.json") })
+        ldr.add_location("http://mgi.nist.gov/*", "http://mirror.org/")
+        assert len(ldr) == 2
+        assert len(ldr.prefix_rules()) == 3
+        assert "http" in ldr._schemes
+
+        assert ldr.locate("http://mgi.nist.gov/goof") == "goof.xml"
+        assert ldr.locate("http://mgi.nist.gov/json/res-md_schema.json") == \
+            os.path.join(schemadir, "res-md_schema.json")
+        assert ldr.locate("http://mgi.nist.gov/json/ext/json-schema") == \
+            os.path.join(schemadir, "extern", "json-schema.json")
+        assert ldr.locate("http://mgi.nist.gov/other") == \
+            "http://mirror.org/other"
+        with pytest.raises(KeyError):
+            ldr.locate("http://mgi.nist.gov/json/../../etc/passwd")
+        with pytest.raises(KeyError):
+            ldr.locate("ivo://ivoa.net/rofr")
+
+        # the fragment is not part of the location
+        assert ldr.locate("http://mgi.nist.gov/json/ext/json-schema#") == \
+            os.path.join(schemadir, "extern", "json-schema.json")
+
+        # a rule does not cover files that do not exist
+        with pytest.raises(KeyError):
+            ldr.locate("http://mgi.nist.gov/json/ext/goob")
+        with pytest.raises(KeyError):
+            ldr.load_schema("http://mgi.nist.gov/json/ext/goob#")
+        assert ldr.load_schema("http://mgi.nist.gov/json/ext/json-schema#")
+
+        # an exact mapping takes precedence
+        ldr.add_location("http://mgi.nist.gov/json/res-md", "res-md.json")
+        assert ldr.locate("http://mgi.nist.gov/json/res-md") == "res-md.json"
+
+        # a loader with only rules is not empty
+        ldr = loader.SchemaLoader({ "http://mgi.nist.gov/*": "/mirror/" })
+        assert len(ldr) == 0
+        assert ldr
+        assert not loader.SchemaLoader()
+
     def test_load_schema(self):
         ldr = loader.SchemaLoader()
         ldr.add_location("uri:nist.gov/goober", schemafile)
@@ -94,6 +138,15 @@ class TestSchemaLoader(object):
                 "json-schema.json"
             assert not os.path.exists(locfile)
 
+            # the directory is left alone unless an index is requested
+            idxfile = os.path.join(sdir, loader.SCHEMA_INDEX_FILE)
+            assert not os.path.exists(idxfile)
+            ldr = loader.SchemaLoader.from_directory(sdir, 
+                                          indexfile=loader.SCHEMA_INDEX_FILE)
+            assert len(ldr) == 2
+            assert os.path.exists(idxfile)
+            os.remove(idxfile)
+
             ldr = loader.SchemaLoader.from_directory(sdir, True)
             assert len(ldr) == 2
             assert ldr.locate("http://json-schema.org/draft-04/schema#") == \
@@ -186,6 +239,67 @@ def schemafiles(request):
     request.addfinalizer(fin)
     return tf
 
+class TestParsedSchemaCache(object):
+
+    def test_load(self, schemafiles):
+        sfile = os.path.join(schemafiles.parent, "cached.json")
+        schemafiles.track("cached.json")
+        with open(sfile, 'w') as fd:
+            json.dump({ "id": "urn:cached" }, fd)
+
+        cache = loader.ParsedSchemaCache()
+        assert len(cache) == 0
+        schema = cache.load(sfile)
+        assert schema == { "id": "urn:cached" }
+        assert sfile in cache
+        assert cache.load(sfile) is schema
+        assert cache.stats()['hits'] == 1
+
+        # a change in size triggers a re-read
+        with open(sfile, 'w') as fd:
+            json.dump({ "id": "urn:cached", "type": "object" }, fd)
+        schema2 = cache.load(sfile)
+        assert schema2 is not schema
+        assert schema2['type'] == "object"
+
+        cache.invalidate(sfile)
+        assert sfile not in cache
+        assert cache.load(sfile) == schema2
+        cache.invalidate()
+        assert len(cache) == 0
+
+    def test_nocheck(self, schemafiles):
+        sfile = os.path.join(schemafiles.parent, "cached.json")
+        schemafiles.track("cached.json")
+        with open(sfile, 'w') as fd:
+            json.dump({ "id": "urn:cached" }, fd)
+
+        cache = loader.ParsedSchemaCache(checkfresh=False)
+        schema = cache.load(sfile)
+        with open(sfile, 'w') as fd:
+            json.dump({ "id": "urn:cached", "type": "object" }, fd)
+        assert cache.load(sfile) is schema
+
+    def test_bounded(self):
+        cache = loader.ParsedSchemaCache(maxsize=1)
+        cache.load(schemafile)
+        cache.load(os.path.join(schemadir, "schemaLocation.json"))
+        assert len(cache) == 1
+        assert schemafile not in cache
+
+    def test_shared(self):
+        ldr1 = loader.SchemaLoader({"uri:nist.gov/goober": schemafile})
+        ldr2 = loader.SchemaLoader({"uri:nist.gov/goober": schemafile})
+        assert ldr1.load_schema("uri:nist.gov/goober") is \
+               ldr2.load_schema("uri:nist.gov/goober")
+        assert schemafile in loader.schema_cache
+
+        ldr3 = loader.SchemaLoader({"uri:nist.gov/goober": schemafile},
+                                   cache=False)
+        schema = ldr3.load_schema("uri:nist.gov/goober")
+        assert schema == ldr1.load_schema("uri:nist.gov/goober")
+        assert schema is not ldr1.load_schema("uri:nist.gov/goober")
+
 class TestDirectorySchemaCache(object):
 
     def test_openfile(self, schemafiles):
@@ -226,6 +340,38 @@ class TestDirectorySchemaCache(object):
         assert loc['http://mgi.nist.gov/json/registry-resource/v0.1']['id'] == \
             "http://mgi.nist.gov/json/registry-resource/v0.1"
 
+    def test_schemas_lazy(self):
+        cache = loader.DirectorySchemaCache(schemadir)
+        reads = []
+        def open_file(filename):
+            reads.append(filename)
+            return loader.DirectorySchemaCache.open_file(cache, filename)
+        cache.open_file = open_file
+
+        schemas = cache.schemas(maxsize=2)
+        assert len(schemas) == 7
+        assert len(reads) == 0
+        assert "http://json-schema.org/draft-04/schema#" in schemas
+        assert schemas.locate("http://mgi.nist.gov/mgi-json-schema/v0.1") == \
+            "mgi-json-schema.json"
+
+        uris = sorted(schemas.keys())
+        first = schemas[uris[0]]
+        assert first['id'] == uris[0]
+        assert schemas[uris[0]] is first
+        assert len(reads) == 1
+
+        # push the first one out
+        schemas[uris[1]]
+        schemas[uris[2]]
+        assert len(reads) == 3
+        assert schemas.stats()['entries'] == 2
+        assert schemas[uris[0]] == first
+        assert len(reads) == 4
+
+        with pytest.raises(KeyError):
+            schemas["urn:goober"]
+
     def test_openfile_fileid(self):
         cache = loader.DirectorySchemaCache(datadir)
         (id, schema) = cache.open_file("noid_schema.json")
@@ -288,3 +434,201 @@ class TestDirectorySchemaCache(object):
 
         locs = cache.locations(recursive=False)
         assert len(locs) == 6
+
+    def test_index(self, schemafiles):
+        sdir = schemafiles.mkdir("indexed")
+        shutil.copy(os.path.join(schemadir,"registry-resource_schema.json"), 
+                    sdir)
+        shutil.copy(os.path.join(datadir,"noid_schema.json"), sdir)
+        shutil.copy(os.path.join(datadir,"loc.json"), sdir)
+        idxfile = os.path.join(sdir, loader.SCHEMA_INDEX_FILE)
+
+        cache = loader.DirectorySchemaCache(sdir, loader.SCHEMA_INDEX_FILE)
+        reads = []
+        def read_header(filename):
+            reads.append(filename)
+            return loader.DirectorySchemaCache.read_header(cache, filename)
+        cache.read_header = read_header
+
+        locs = cache.locations()
+        assert len(locs) == 2
+        assert len(reads) == 3
+        assert os.path.exists(idxfile)
+        with open(idxfile) as fd:
+            index = json.load(fd)['files']
+        assert len(index) == 3
+        assert index['loc.json']['$schema'] is None
+        assert index['registry-resource_schema.json']['id'] == \
+            "http://mgi.nist.gov/json/registry-resource/v0.1"
+
+        # nothing changed: nothing re-read
+        del reads[:]
+        assert cache.locations() == locs
+        assert len(reads) == 0
+
+        # a new index is used by a new cache
+        cache = loader.DirectorySchemaCache(sdir, loader.SCHEMA_INDEX_FILE)
+        cache.read_header = read_header
+        assert cache.locations() == locs
+        assert len(reads) == 0
+
+        # only new and changed files are read; deleted ones are dropped
+        shutil.copy(os.path.join(schemadir,"extern","json-schema.json"), sdir)
+        with open(os.path.join(sdir, "loc.json"), "a") as fd:
+            fd.write("\n")
+        os.remove(os.path.join(sdir, "noid_schema.json"))
+        locs = cache.locations()
+        assert sorted(reads) == [ "json-schema.json", "loc.json" ]
+        assert len(locs) == 2
+        assert "http://json-schema.org/draft-04/schema#" in locs
+        with open(idxfile) as fd:
+            index = json.load(fd)['files']
+        assert sorted(index.keys()) == [ "json-schema.json", "loc.json",
+                                         "registry-resource_schema.json" ]
+
+    def test_memory_index(self, schemafiles):
+        sdir = schemafiles.mkdir("memindexed")
+        shutil.copy(os.path.join(schemadir,"registry-resource_schema.json"), 
+                    sdir)
+        shutil.copy(os.path.join(datadir,"noid_schema.json"), sdir)
+
+        cache = loader.DirectorySchemaCache(sdir)
+        reads = []
+        def read_header(filename):
+            reads.append(filename)
+            return loader.DirectorySchemaCache.read_header(cache, filename)
+        cache.read_header = read_header
+
+        locs = cache.locations()
+        assert len(locs) == 2
+        assert len(reads) == 2
+        assert sorted(os.listdir(sdir)) == [ "noid_schema.json", 
+                                             "registry-resource_schema.json" ]
+
+        # a later scan by the same instance only reads what changed
+        del reads[:]
+        shutil.copy(os.path.join(schemadir,"extern","json-schema.json"), sdir)
+        assert len(cache.locations()) == 3
+        assert reads == [ "json-schema.json" ]
+
+    def test_deleted_subdir(self, schemafiles):
+        sdir = schemafiles.mkdir("subindexed")
+        subdir = os.path.join(sdir, "sub")
+        os.mkdir(subdir)
+        shutil.copy(os.path.join(datadir,"noid_schema.json"), sdir)
+        shutil.copy(os.path.join(schemadir,"registry-resource_schema.json"), 
+                    subdir)
+        indexfile = os.path.join(sdir, "index")
+
+        cache = loader.DirectorySchemaCache(sdir, indexfile)
+        assert len(cache.locations()) == 2
+        def indexed():
+            with open(indexfile) as fd:
+                return sorted(json.load(fd)['files'].keys())
+        assert indexed() == [ "noid_schema.json", 
+                              os.path.join("sub", 
+                                           "registry-resource_schema.json") ]
+
+        # entries for a subdirectory skipped by a shallow scan are kept...
+        assert len(cache.locations(recursive=False)) == 1
+        assert len(indexed()) == 2
+
+        # ...but not once the subdirectory is gone
+        shutil.rmtree(subdir)
+        assert len(cache.locations(recursive=False)) == 1
+        assert indexed() == [ "noid_schema.json" ]
+        assert len(cache.locations()) == 1
+
+    def test_bad_index(self, schemafiles):
+        sdir = schemafiles.mkdir("badindex")
+        shutil.copy(os.path.join(datadir,"noid_schema.json"), sdir)
+        with open(os.path.join(sdir, "index"), "w") as fd:
+            fd.write("goob")
+
+        cache = loader.DirectorySchemaCache(sdir, "index")
+        assert len(cache.locations()) == 1
+        with open(os.path.join(sdir, "index")) as fd:
+            assert len(json.load(fd)['files']) == 1
+
+    def test_read_header(self):
+        cache = loader.DirectorySchemaCache(datadir)
+        assert cache.read_header("noid_schema.json") == \
+            (None, "http://json-schema.org/draft-04/schema")
+        with pytest.raises(loader.DirectorySchemaCache.NotASchemaError):
+            cache.read_header("loc.json")
+
+        cache = loader.DirectorySchemaCache(schemadir)
+        assert cache.read_header("mgi-json-schema.json") == \
+            (cache.open_file("mgi-json-schema.json")[0],
+             "http://json-schema.org/draft-04/schema#")
+
+def test_sniff_header():
+    doc = json.dumps({ "id": "urn:goob", "type": "object", 
+                       "$schema": "http://json-schema.org/draft-04/schema#",
+                       "properties": { "a": { "id": "urn:a" } } }, 
+                     sort_keys=True)
+    found = ("urn:goob", "http://json-schema.org/draft-04/schema#")
+    assert loader.sniff_header(doc) == found
+
+    # enough to find both members
+    assert loader.sniff_header(doc[:doc.index('"properties"')]) == found
+
+    # too little to be sure
+    assert loader.sniff_header(doc[:doc.index('"id"')]) is None
+    assert loader.sniff_header(doc[:doc.index('urn:goob')+3]) is None
+
+    # the end of the object is conclusive
+    assert loader.sniff_header(' { "a": [1, {"id": 2}], "id": "urn:x" } ') \
+        == ("urn:x", None)
+    assert loader.sniff_header('{}') == (None, None)
+    assert loader.sniff_header('{"id": "urn:x", "a": 12') is None
+    assert loader.sniff_header('["id", "urn:x"]') is None
+
+class TestParallelScan(object):
+
+    def test_threads(self):
+        expected = loader.DirectorySchemaCache(schemadir).locations()
+        cache = loader.DirectorySchemaCache(schemadir, workers=4)
+        assert cache.locations() == expected
+        assert sorted(cache.schemas().keys()) == sorted(expected.keys())
+
+    def test_processes(self):
+        expected = loader.DirectorySchemaCache(schemadir).locations()
+        cache = loader.DirectorySchemaCache(schemadir, workers=2, 
+                                            processes=True)
+        assert cache.locations() == expected
+
+    def test_duplicates(self, schemafiles):
+        sdir = schemafiles.mkdir("dups")
+        for name in "cbad":
+            with open(os.path.join(sdir, name+".json"), "w") as fd:
+                json.dump({ "id": "urn:dup", "title": name, 
+                            "$schema": "http://json-schema.org/draft-04/schema#"},
+                          fd)
+
+        for workers in (1, 3):
+            cache = loader.DirectorySchemaCache(sdir, workers=workers)
+            assert cache.locations() == { "urn:dup": "d.json" }
+            assert cache.schemas()["urn:dup"]["title"] == "d"
+
+def test_schema_dependencies():
+    schema = {
+        "id": "http://example.com/a/main",
+        "$extensionSchemas": [ "http://example.com/ext#" ],
+        "definitions": {
+            "local": { "$ref": "#/definitions/other" },
+            "rel": { "$ref": "sub#/definitions/x" },
+            "scoped": { "id": "http://example.com/b/", 
+                        "items": { "$ref": "c" } },
+            "again": { "$ref": "http://example.com/a/sub" }
+        },
+        "enum": [ { "$ref": "urn:notaref" } ],
+        "properties": { "$ref": { "type": "string" },
+                        "id": { "type": "string" } }
+    }
+    assert loader.schema_dependencies(schema) == [
+        "http://example.com/ext",
+        "http://example.com/a/sub",
+        "http://example.com/b/c"
+    ]
+    assert loader.schema_dependencies({ "$ref": "#/a" }, "urn:x") == []
@@ -1,6 +1,6 @@
 # import pytest
 from __future__ import with_statement
-import json, os, pytest, shutil
+import json, os, pytest, shutil, threading
 from cStringIO import StringIO
 
 from . import Tempfiles
@@ -128,3 +128,505 @@ class TestExtValidator(object):
         inst["name"] = "bob"
         validator.load_schema(schema)
         validator.validate_against(inst, [schema['id']])
+
+    def test_composite(self, validator):
+        name = {
+            "type": "object",
+            "properties": { "name": { "type": "string" } },
+            "id": "urn:name"
+        }
+        age = {
+            "type": "object",
+            "properties": { "age": { "type": "integer" } },
+            "required": [ "age" ],
+            "id": "urn:age"
+        }
+        validator.load_schema(name)
+        validator.load_schema(age)
+        uris = [ "urn:name", "urn:age" ]
+
+        inst = { "name": "Bob", "age": 3 }
+        validator.validate_against(inst, uris)
+        assert tuple(uris) in validator._validators
+        comp = validator._validators[tuple(uris)]
+        assert isinstance(comp, val.CompositeValidator)
+        assert comp.is_valid(inst)
+
+        inst["age"] = "3"
+        with pytest.raises(val.ValidationError) as ex:
+            validator.validate_against(inst, uris)
+        assert ex.value.schema_uri == "urn:age"
+        assert list(ex.value.schema_path) == [ "properties", "age", "type" ]
+
+        inst = { "name": 3 }
+        errs = list(comp.iter_errors(inst))
+        assert len(errs) == 2
+        assert errs[0].schema_uri == "urn:name"
+        assert errs[1].schema_uri == "urn:age"
+
+        # unresolvable schemas are dropped from the composite
+        validator.validate_against({ "age": 3 }, uris + ["urn:unresolvable"])
+        assert tuple(uris) in validator._validators
+
+        # reloading a schema forgets its validators
+        validator.load_schema(age)
+        assert tuple(uris) not in validator._validators
+
+    def test_composite_drafts(self, validator):
+        base = {
+            "$schema": "http://json-schema.org/draft-04/schema#",
+            "type": "object",
+            "properties": { "name": { "type": "string" } },
+            "required": [ "name" ],
+            "id": "urn:base04"
+        }
+        ext = {
+            "$schema": "http://json-schema.org/draft-03/schema#",
+            "type": "object",
+            "properties": { "age": { "type": "integer", "required": True } },
+            "id": "urn:ext03"
+        }
+        validator.load_schema(base)
+        validator.load_schema(ext)
+        uris = [ "urn:base04", "urn:ext03" ]
+
+        validator.validate_against({ "name": "Bob", "age": 3 }, uris)
+
+        # each schema is applied with the rules of its own draft
+        with pytest.raises(val.ValidationError) as ex:
+            validator.validate_against({ "name": "Bob" }, uris)
+        assert ex.value.schema_uri == "urn:ext03"
+        assert list(ex.value.schema_path) == [ "properties", "age", 
+                                               "required" ]
+
+        comp = validator._validators[tuple(uris)]
+        errs = list(comp.iter_errors({ "age": "3" }))
+        assert [e.schema_uri for e in errs] == uris
+        assert list(errs[0].schema_path) == [ "required" ]
+        assert list(errs[1].schema_path) == [ "properties", "age", "type" ]
+
+    def test_shared_resolver(self, validator):
+        resmd = "http://mgi.nist.gov/json/res-md/v1.0wd"
+        validator.validate_against("public", resmd+"#/definitions/Rights")
+        validator.validate_against({ "issued": "2016-01-01" }, 
+                                   resmd+"#/definitions/RelevantDate")
+        with pytest.raises(val.ValidationError):
+            validator.validate_against("free", resmd+"#/definitions/Rights")
+
+        # one resolver serves all fragments of the document
+        assert resmd in validator._resolvers
+        res = validator._resolvers[resmd]
+        assert res.store is validator._schemaStore
+        for uri in [resmd+"#/definitions/Rights", 
+                    resmd+"#/definitions/RelevantDate"]:
+            assert validator._validators[(uri,)].resolver is res
+            assert uri in validator._fragments
+
+subtreeschema = {
+    "$schema": "http://json-schema.org/draft-04/schema#",
+    "id": "http://example.com/subtree",
+    "type": "object",
+    "properties": {
+        "$schema": { "type": "string" },
+        "people": { "type": "array", "items": { "$ref": "#/definitions/Person" } },
+        "pets": { 
+            "type": "array", 
+            "items": {
+                "oneOf": [ { "$ref": "#/definitions/Cat" },
+                           { "$ref": "#/definitions/Dog" } ]
+            }
+        }
+    },
+    "patternProperties": { "^x-": { "type": "string" } },
+    "additionalProperties": False,
+    "definitions": {
+        "Person": {
+            "type": "object",
+            "properties": { "name": { "type": "string" } },
+            "allOf": [ { "properties": { "age": { "type": "integer" } } } ]
+        },
+        "Cat": {
+            "properties": { "kind": { "enum": [ "cat" ] }, 
+                            "lives": { "type": "integer" } },
+            "required": [ "kind" ]
+        },
+        "Dog": {
+            "properties": { "kind": { "enum": [ "dog" ] },
+                            "lives": { "type": "string" } },
+            "required": [ "kind" ]
+        }
+    }
+}
+
+extschema = {
+    "id": "http://example.com/subtree-ext",
+    "properties": { "nickname": { "type": "string" } }
+}
+
+class TestValidateSubtree(object):
+
+    @pytest.fixture
+    def doc(self, validator):
+        validator.load_schema(subtreeschema)
+        validator.load_schema(extschema)
+        return {
+            "$schema": "http://example.com/subtree",
+            "people": [
+                { "name": "Bob", "age": 30, 
+                  "$extensionSchemas": [ "http://example.com/subtree-ext" ], 
+                  "nickname": "Bobby" }
+            ],
+            "pets": [ { "kind": "cat", "lives": 9 }, 
+                      { "kind": "dog", "lives": "one" } ],
+            "x-note": "hey"
+        }
+
+    def test_valid(self, validator, doc):
+        validator.validate(doc)
+        for ptr in [ "/", "/people", "/people/0", "/people/0/age", 
+                     "/pets/1/lives", "/x-note" ]:
+            validator.validate_subtree(doc, ptr)
+
+    def test_invalid(self, validator, doc):
+        doc['people'][0]['age'] = "30"
+        with pytest.raises(val.ValidationError) as ex:
+            validator.validate_subtree(doc, "/people/0")
+        assert list(ex.value.path) == [ "people", "0", "age" ]
+        with pytest.raises(val.ValidationError):
+            validator.validate_subtree(doc, "/people/0/age")
+        validator.validate_subtree(doc, "/people/0/name")
+
+        # dispatched via the discriminator
+        doc['pets'][1]['lives'] = 1
+        with pytest.raises(val.ValidationError):
+            validator.validate_subtree(doc, "/pets/1/lives")
+        validator.validate_subtree(doc, "/pets/0/lives")
+
+        doc['x-note'] = 1
+        with pytest.raises(val.ValidationError):
+            validator.validate_subtree(doc, "/x-note")
+
+        doc['goober'] = 1
+        with pytest.raises(val.ValidationError):
+            validator.validate_subtree(doc, "/goober")
+
+    def test_constructed_not_cached(self, doc):
+        validator = val.ExtValidator(loader.SchemaLoader.from_directory(
+                                                                  schemadir),
+                                     failfast=True)
+        validator.load_schema(subtreeschema)
+        validator.load_schema(extschema)
+        validator.load_schema({
+            "$schema": "http://json-schema.org/draft-04/schema#",
+            "id": "urn:subtree-any",
+            "properties": {
+                "v": { "anyOf": [
+                    { "properties": { "a": { "type": "integer" } } },
+                    { "properties": { "a": { "type": "string" } } }
+                ] }
+            }
+        })
+        anydoc = { "$schema": "urn:subtree-any", "v": { "a": 1 } }
+
+        def validate_all():
+            validator.validate_subtree(anydoc, "/v/a")
+            for ptr in [ "/people/0", "/people/0/nickname", "/pets/1" ]:
+                validator.validate_subtree(doc, ptr)
+        validate_all()
+        ndisc = len(validator._discriminators)
+        norder = len(validator._order)
+
+        # the schemas built for each call are not held on to
+        for i in range(50):
+            validate_all()
+        assert len(validator._discriminators) == ndisc
+        assert len(validator._order) == norder
+
+    def test_extensions(self, validator, doc):
+        doc['people'][0]['nickname'] = 3
+        with pytest.raises(val.ValidationError):
+            validator.validate_subtree(doc, "/people/0")
+        with pytest.raises(val.ValidationError):
+            validator.validate_subtree(doc, "/people/0/nickname")
+        validator.validate_subtree(doc, "/people/0", minimally=True)
+        validator.validate_subtree(doc, "/pets")
+
+    def test_notfound(self, validator, doc):
+        with pytest.raises(KeyError):
+            validator.validate_subtree(doc, "/people/3")
+        with pytest.raises(KeyError):
+            validator.validate_subtree(doc, "/pets/0/goober")
+
+        # only strict JSON Pointer array indexes are accepted
+        for ptr in [ "/pets/-1", "/pets/01", "/pets/ 1", "/pets/+1", 
+                     "/pets/1 ", "/pets/1\n", "/pets/-" ]:
+            with pytest.raises(KeyError):
+                validator.validate_subtree(doc, ptr)
+
+        # a pointer must start with "/" and use only ~0 and ~1 escapes
+        for ptr in [ "pets", "people/0", "/pe~ople" ]:
+            with pytest.raises(ValueError):
+                validator.validate_subtree(doc, ptr)
+
+    def test_ipr(self, validator):
+        with open(ipr_ex) as fd:
+            doc = json.load(fd)
+        validator.validate_subtree(doc, "/identity")
+
+        doc['identity']['title'] = 3
+        with pytest.raises(val.ValidationError):
+            validator.validate_subtree(doc, "/identity")
+        validator.validate_subtree(doc, "/curation")
+
+class TestPrefixRules(object):
+
+    @pytest.fixture
+    def ruledir(self, request):
+        tf = Tempfiles()
+        sdir = tf.mkdir("rules")
+        request.addfinalizer(tf.clean)
+        with open(os.path.join(sdir, "str.json"), "w") as fd:
+            json.dump({ "type": "string" }, fd)
+        return sdir
+
+    def test_rules_only(self, ruledir):
+        ldr = loader.SchemaLoader({ "urn:rules/*": 
+                                        os.path.join(ruledir, "*.json") })
+        validator = val.ExtValidator(ldr)
+        assert validator._loader is ldr
+
+        validator.validate_against("yes", "urn:rules/str")
+        validator.validate_against("yes", "urn:rules/str#")
+        with pytest.raises(val.ValidationError):
+            validator.validate_against(3, "urn:rules/str")
+
+        # a rule that gives no file is like an unknown URI
+        validator.validate_against(3, "urn:rules/goob")
+        validator.validate_against(3, "urn:rules/goob#")
+        with pytest.raises(val.SchemaError):
+            validator.validate_against(3, "urn:rules/goob", True)
+        assert validator.cache_stats()["missing"]["entries"] == 1
+
+class TestCacheLimits(object):
+
+    def test_bounded(self):
+        validator = val.ExtValidator(
+            loader.SchemaLoader.from_directory(schemadir), 
+            maxvalidators=2, maxschemas=2, maxfragments=3)
+        resmd = "http://mgi.nist.gov/json/res-md/v1.0wd"
+        trans = "http://mgi.nist.gov/mgi-json-trans/v0.1"
+        validator.validate_file(ipr_ex)
+        validator.validate_against("public", resmd+"#/definitions/Rights")
+        validator.validate_against("string", trans+"#/definitions/JSONType")
+
+        stats = validator.cache_stats()
+        assert stats["validators"]["entries"] <= 2
+        assert stats["validators"]["bytes"] is None
+        assert stats["prepared"]["entries"] <= 2
+        assert stats["resolvers"]["entries"] <= 2
+        assert stats["fragments"]["entries"] <= 3
+        assert stats["fragments"]["evictions"] > 0
+        assert stats["schemas"]["evictions"] > 0
+        assert stats["schemas"]["bytes"] > 0
+        assert len(validator._schemaStore) <= 2 + stats["schemas"]["pinned"]
+        assert set(stats.keys()) == set([ "schemas", "validators", "prepared",
+                                          "resolvers", "fragments", "dispatch",
+                                          "ordering", "missing" ])
+
+        # evicted things get reloaded
+        validator.validate_file(ipr_ex)
+        with pytest.raises(val.ValidationError):
+            validator.validate_against("free", resmd+"#/definitions/Rights")
+
+    def test_fragment_ids(self):
+        # ids ending in '#', as in the draft-04 meta-schema
+        ldr = loader.MemorySchemaLoader({ 
+            "urn:a#": { "id": "urn:a#", "type": "string", 
+                        "definitions": { "s": { "type": "string" } } },
+            "urn:b#": { "id": "urn:b#", "type": "integer" } })
+        validator = val.ExtValidator(ldr, maxschemas=1)
+
+        def held(urib):
+            keys = list(validator._resolvers) + list(validator._prepared) + \
+                   list(validator._fragments)
+            for uris in validator._validators.keys():
+                keys.extend(uris)
+            return [k for k in keys if k.startswith(urib)]
+
+        validator.validate_against("yes", "urn:a#")
+        validator.validate_against("yes", "urn:a#/definitions/s")
+        assert held("urn:a")
+        validator.validate_against(1, "urn:b#")
+        assert "urn:a#" not in validator._schemaStore
+        assert held("urn:a") == []
+        assert held("urn:b")
+
+        # evicted things get reloaded
+        with pytest.raises(val.ValidationError):
+            validator.validate_against(1, "urn:a#")
+
+    def test_pinned(self):
+        validator = val.ExtValidator(
+            loader.SchemaLoader.from_directory(schemadir), maxschemas=1)
+        validator.validate_file(mgi_json_schema)
+        assert validator._schemaStore.is_pinned(val.EXTSCHEMA_URIS[0])
+        assert val.EXTSCHEMA_URIS[0] in validator._schemaStore
+
+        schema = { "id": "urn:pinned", "type": "string" }
+        validator.load_schema(schema)
+        validator.validate_file(ipr_ex)
+        assert "urn:pinned" in validator._schemaStore
+        validator.validate_against("yes", "urn:pinned")
+
+class CountingLoader(loader.BaseSchemaLoad):
+    def __init__(self, ldr):
+        self.ldr = ldr
+        self.calls = []
+        self._schemes = ldr._schemes    # for SchemaHandler
+    def load_schema(self, uri):
+        self.calls.append(uri)
+        return self.ldr.load_schema(uri)
+
+class TestMissingSchemas(object):
+
+    def test_negative_cache(self):
+        ldr = CountingLoader(loader.SchemaLoader.from_directory(schemadir))
+        validator = val.ExtValidator(ldr)
+        with open(os.path.join(datadir, "unresolvableref.json")) as fd:
+            inst = json.load(fd)
+
+        validator.validate_against(inst, "urn:unresolvable.json")
+        n = len(ldr.calls)
+        assert n > 0
+        for i in range(3):
+            validator.validate_against(inst, "urn:unresolvable.json")
+        assert len(ldr.calls) == n
+        assert validator.cache_stats()["missing"]["hits"] == 3
+
+        with pytest.raises(val.SchemaError):
+            validator.validate_against(inst, "urn:unresolvable.json", True)
+        assert len(ldr.calls) == n
+
+        validator.forget_missing("urn:unresolvable.json")
+        validator.validate_against(inst, "urn:unresolvable.json")
+        assert len(ldr.calls) > n
+
+        n = len(ldr.calls)
+        validator.forget_missing()
+        validator.validate_against(inst, "urn:unresolvable.json")
+        assert len(ldr.calls) > n
+
+        # loading the schema makes it available
+        validator.load_schema({ "type": "object" }, "urn:unresolvable.json")
+        validator.validate_against(inst, "urn:unresolvable.json", True)
+
+    def test_nocache(self):
+        ldr = CountingLoader(loader.SchemaLoader.from_directory(schemadir))
+        validator = val.ExtValidator(ldr, missingttl=0)
+        validator.validate_against({}, "urn:unresolvable.json")
+        n = len(ldr.calls)
+        validator.validate_against({}, "urn:unresolvable.json")
+        assert len(ldr.calls) == 2 * n
+
+class TestPrecompile(object):
+
+    def test_precompile(self):
+        ldr = CountingLoader(loader.SchemaLoader.from_directory(schemadir))
+        ldr.iterURIs = ldr.ldr.iterURIs
+        validator = val.ExtValidator(ldr)
+
+        graph = validator.precompile(workers=2)
+        assert len(graph) == len(ldr.ldr)
+        assert not graph.errors
+        n = validator.cache_stats()["validators"]["entries"]
+        assert n == len(graph)
+
+        # validation needs no further loading of these schemas (only of
+        # the unavailable extensions the example refers to)
+        calls = len(ldr.calls)
+        validator.validate_file(ipr_ex)
+        assert not [u for u in ldr.calls[calls:] if u in graph]
+        assert validator.cache_stats()["validators"]["entries"] >= n
+
+    def test_strict(self):
+        ldr = loader.SchemaLoader({ "urn:goob": "/no/such/goob.json" })
+        validator = val.ExtValidator(ldr)
+        graph = validator.precompile()
+        assert "urn:goob" in graph.errors
+        with pytest.raises(val.SchemaError):
+            validator.precompile(strict=True)
+
+class BlockingLoader(loader.MemorySchemaLoader):
+    # a loader that waits to be released before providing urn:slow
+    def __init__(self, schemas):
+        loader.MemorySchemaLoader.__init__(self, schemas)
+        self.entered = threading.Event()
+        self.release = threading.Event()
+    def load_schema(self, uri):
+        if uri.startswith("urn:slow"):
+            self.entered.set()
+            self.release.wait(10)
+        return loader.MemorySchemaLoader.load_schema(self, uri)
+
+class TestThreads(object):
+
+    def test_not_serialized(self):
+        ldr = BlockingLoader({
+            "urn:slow": { "type": "string" },
+            "urn:uses-slow": { "properties": { "a": { "$ref": "urn:slow" } } },
+            "urn:fast": { "type": "integer" } })
+        validator = val.ExtValidator(ldr)
+        validator.validate_against(1, "urn:fast")
+
+        errors = []
+        def slow():
+            try:
+                validator.validate_against({ "a": "x" }, "urn:uses-slow")
+            except Exception, ex:
+                errors.append(ex)
+        t = threading.Thread(target=slow)
+        t.start()
+        try:
+            # another validation proceeds while the first waits on the loader
+            assert ldr.entered.wait(10)
+            validator.validate_against(2, "urn:fast")
+            with pytest.raises(val.ValidationError):
+                validator.validate_against("2", "urn:fast")
+            assert t.is_alive()
+        finally:
+            ldr.release.set()
+            t.join()
+        assert errors == []
+
+    def test_shared_resolver(self):
+        validator = val.ExtValidator.with_schema_dir(schemadir)
+        with open(ipr_ex) as fd:
+            doc = json.load(fd)
+        validator.validate(doc)
+        res = validator._resolvers.peek(doc["$schema"].rstrip('#')) or \
+              validator._resolvers.peek(doc["$schema"])
+        assert res is not None
+
+        errors = []
+        def serve():
+            try:
+                for i in range(50):
+                    validator.validate(doc)
+            except Exception, ex:
+                errors.append(ex)
+        threads = [threading.Thread(target=serve) for i in range(4)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        assert errors == []
+
+        # each thread has its own resolution scope
+        assert res.resolution_scope == res.base_uri
+        res.push_scope("urn:elsewhere")
+        scopes = []
+        t = threading.Thread(target=lambda: scopes.append(res.resolution_scope))
+        t.start()
+        t.join()
+        res.pop_scope()
+        assert scopes == [ res.base_uri ]
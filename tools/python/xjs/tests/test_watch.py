@@ -0,0 +1,149 @@
+# import pytest
+from __future__ import with_statement
+import json, os, pytest, time, threading
+
+from . import Tempfiles
+import xjs.validate as val
+import xjs.schemaloader as loader
+import xjs.watch as watch
+
+base = "http://example.com/watch/"
+draft4 = "http://json-schema.org/draft-04/schema#"
+
+def write(path, data):
+    with open(path, "w") as fd:
+        json.dump(data, fd)
+
+@pytest.fixture
+def schemas(request):
+    tf = Tempfiles()
+    sdir = tf.mkdir("watched")
+    request.addfinalizer(tf.clean)
+
+    write(os.path.join(sdir, "a.json"), 
+          { "id": base+"a", "$schema": draft4, "type": "object",
+            "properties": { "x": { "$ref": "b#/definitions/thing" } } })
+    write(os.path.join(sdir, "b.json"), 
+          { "id": base+"b", "$schema": draft4, 
+            "definitions": { "thing": { "type": "string" } } })
+    write(os.path.join(sdir, "c.json"), 
+          { "id": base+"c", "$schema": draft4, "type": "object" })
+    write(os.path.join(sdir, "schemaLocation.json"),
+          { base+"a": "a.json", base+"b": "b.json", base+"c": "c.json" })
+    return sdir
+
+def setup(sdir):
+    locfile = os.path.join(sdir, "schemaLocation.json")
+    ldr = loader.SchemaLoader.from_location_file(locfile)
+    validator = val.ExtValidator(ldr)
+    validator.validate_against({ "x": "s" }, base+"a")
+    validator.validate_against({ }, base+"c")
+    watcher = watch.SchemaWatcher(ldr, [validator], locfile=locfile, 
+                                  inotify=False)
+    return (ldr, validator, watcher)
+
+class TestSchemaWatcher(object):
+
+    def test_nochange(self, schemas):
+        (ldr, validator, watcher) = setup(schemas)
+        assert watcher.check() == []
+        assert len(validator._validators) == 2
+
+    def test_targeted(self, schemas):
+        (ldr, validator, watcher) = setup(schemas)
+        write(os.path.join(schemas, "b.json"), 
+              { "id": base+"b", "$schema": draft4, 
+                "definitions": { "thing": { "type": "integer" } } })
+
+        assert watcher.check() == [ base+"b" ]
+
+        # only the validator depending on b is gone
+        assert validator._validators.keys() == [ (base+"c",) ]
+        with pytest.raises(val.ValidationError):
+            validator.validate_against({ "x": "s" }, base+"a")
+        validator.validate_against({ "x": 1 }, base+"a")
+        assert watcher.check() == []
+
+    def test_new_and_removed(self, schemas):
+        (ldr, validator, watcher) = setup(schemas)
+        write(os.path.join(schemas, "d.json"), 
+              { "id": base+"d", "$schema": draft4, "type": "array" })
+        write(os.path.join(schemas, "schemaLocation.json"),
+              { base+"a": "a.json", base+"b": "b.json", base+"c": "c.json",
+                base+"d": "d.json" })
+
+        assert watcher.check() == [ base+"d" ]
+        validator.validate_against([], base+"d")
+
+        os.remove(os.path.join(schemas, "c.json"))
+        assert watcher.check() == [ base+"c" ]
+        assert (base+"c",) not in validator._validators
+        with pytest.raises(IOError):
+            validator.validate_against({}, base+"c")
+
+    def test_poll(self, schemas):
+        (ldr, validator, watcher) = setup(schemas)
+        watcher.interval = 0.05
+        watcher.start()
+        try:
+            write(os.path.join(schemas, "c.json"), 
+                  { "id": base+"c", "$schema": draft4, "type": "array" })
+            for i in range(100):
+                if (base+"c",) not in validator._validators:
+                    break
+                time.sleep(0.05)
+            validator.validate_against([], base+"c")
+        finally:
+            watcher.stop()
+
+    def test_poll_errors(self, schemas):
+        (ldr, validator, watcher) = setup(schemas)
+        locfile = os.path.join(schemas, "schemaLocation.json")
+        with open(locfile, "w") as fd:
+            fd.write('{ "http://example.com/watch/a": ')
+        with pytest.raises(ValueError):
+            watcher.check()
+
+        # the background thread keeps going
+        watcher.interval = 0.05
+        watcher.start()
+        try:
+            for i in range(100):
+                if watcher.last_error is not None:
+                    break
+                time.sleep(0.05)
+            assert isinstance(watcher.last_error, ValueError)
+            assert watcher._thread.is_alive()
+
+            write(os.path.join(schemas, "d.json"), 
+                  { "id": base+"d", "$schema": draft4, "type": "array" })
+            write(locfile, { base+"a": "a.json", base+"b": "b.json", 
+                             base+"c": "c.json", base+"d": "d.json" })
+            for i in range(100):
+                if base+"d" in validator._schemaStore:
+                    break
+                time.sleep(0.05)
+            validator.validate_against([], base+"d", True)
+        finally:
+            watcher.stop()
+
+    def test_concurrent(self, schemas):
+        (ldr, validator, watcher) = setup(schemas)
+        errors = []
+        def serve():
+            try:
+                for i in range(200):
+                    validator.validate_against({ "x": "s" }, base+"a")
+                    validator.validate_against({ }, base+"c")
+            except Exception, ex:
+                errors.append(ex)
+
+        threads = [threading.Thread(target=serve) for i in range(4)]
+        for t in threads:
+            t.start()
+        for i in range(100):
+            validator.reload_schema(base+"b")
+            validator.discard_schema(base+"c")
+        for t in threads:
+            t.join()
+        assert errors == []
@@ -3,33 +3,243 @@ a module that provides support for validating schemas that support
 extended json-schema tags.
 """
 from __future__ import with_statement
-import sys, os, types, json, urlparse
+import sys, os, re, types, json, urlparse, threading
+from functools import wraps
 import jsonschema
 import jsonschema.validators as jsch
+from jsonschema.compat import lru_cache, urljoin, urlsplit
 from jsonschema.exceptions import (ValidationError, SchemaError, 
                                    RefResolutionError)
 
 from . import schemaloader as loader
-from .instance import Instance, EXTSCHEMAS
+from . import dispatch as _dispatch
+from . import ordering
+from . import depgraph
+from .cache import LRUCache, NegativeCache, TransientDict, TransientList
+from . import jsonbackend
+from .instance import (Instance, EXTSCHEMAS, array_index, path_from_pointer,
+                       pointer_from_path)
 
 # These are URIs that identify versions of the JSON Enhanced Schema schem
 EXTSCHEMA_URIS = [ "http://mgi.nist.gov/mgi-json-schema/v0.1" ]
 
+# used only for its (stateless) resolve_fragment()
+_fragment_resolver = jsch.RefResolver("", {})
+
+def _normuri(uri):
+    # normalize a URI for use as a key, as jsonschema's URIDict does
+    return urlsplit(uri).geturl()
+
+def _subloc(url, *tokens):
+    # return the URL of a subschema below the one at the given URL
+    (base, frag) = urlparse.urldefrag(url)
+    return base + '#' + frag.rstrip('/') + \
+        pointer_from_path(tokens).replace('%', '%25')
+
+def _ref(url):
+    # return a transient schema that refers to the given URL
+    return TransientDict({ "$ref": url })
+
+class _SharedResolver(jsch.RefResolver):
+    # a RefResolver that tracks the resolution scope separately for each 
+    # thread so that it can be shared by concurrent validations
+
+    def __init__(self, *args, **kw):
+        self._local = threading.local()
+        jsch.RefResolver.__init__(self, *args, **kw)
+
+    @property
+    def _scopes_stack(self):
+        try:
+            return self._local.stack
+        except AttributeError:
+            self._local.stack = [ self._base_scope ]
+            return self._local.stack
+
+    @_scopes_stack.setter
+    def _scopes_stack(self, stack):
+        self._base_scope = stack[0]
+        self._local.stack = stack
+
+def _synchronized(meth):
+    # run the method while holding the instance's lock
+    @wraps(meth)
+    def wrapper(self, *args, **kw):
+        with self._lock:
+            return meth(self, *args, **kw)
+    return wrapper
+
+class CompositeValidator(object):
+    """
+    a validator that validates an instance against several schemas in a 
+    single pass.  The schemas, identified by URI, are combined as the members
+    of an allOf; errors are attributed back to the schema they came from
+    via a schema_uri attribute set on the error.  Schemas that need 
+    different validator classes (i.e. that follow different drafts) are 
+    combined into one allOf per class.
+    """
+
+    def __init__(self, uris, cls, resolver):
+        """
+        create the validator
+
+        :argument list uris:   the URIs of the schemas to validate against
+        :argument cls:         the jsonschema validator class to use, or a 
+                               list giving the class for each URI
+        :argument resolver:    the jsonschema.RefResolver that can resolve 
+                               each of the URIs
+        """
+        self.uris = tuple(uris)
+        self.schema = { "allOf": [ { "$ref": u } for u in self.uris ] }
+        if isinstance(cls, type):
+            cls = [ cls ] * len(self.uris)
+
+        # group the URIs by class, keeping the order of first appearance
+        groups = []
+        for uri, c in zip(self.uris, cls):
+            for group in groups:
+                if group[0] is c:
+                    group[1].append(uri)
+                    break
+            else:
+                groups.append((c, [ uri ]))
+
+        self._validators = []
+        for c, guris in groups:
+            # drafts before 4 combine schemas with extends instead of allOf
+            combine = "allOf" if "allOf" in c.VALIDATORS else "extends"
+            schema = { combine: [ { "$ref": u } for u in guris ] }
+            self._validators.append((c(schema, resolver=resolver), 
+                                     tuple(guris)))
+
+    @property
+    def resolver(self):
+        """
+        the jsonschema.RefResolver used by this validator
+        """
+        return self._validators[0][0].resolver
+
+    def iter_errors(self, instance):
+        """
+        iterate through the validation errors found in the given instance.
+        The schema_path of each error will be relative to the schema named
+        by the error's schema_uri attribute.
+        """
+        for validator, uris in self._validators:
+            for error in validator.iter_errors(instance):
+                # strip off the allOf (or extends) wrapper
+                error.schema_path.popleft()
+                error.schema_uri = uris[error.schema_path.popleft()]
+                yield error
+
+    def validate(self, instance):
+        """
+        raise the first validation error found in the given instance
+        """
+        for error in self.iter_errors(instance):
+            raise error
+
+    def is_valid(self, instance):
+        """
+        return True if the instance is valid against all the schemas
+        """
+        return next(self.iter_errors(instance), None) is None
+
 class ExtValidator(object):
     """
-    A validator that can validate an instance against multiple schemas
+    A validator that can validate an instance against multiple schemas.
+
+    An instance may be shared by several threads (e.g. those serving 
+    requests and a watch.SchemaWatcher's), and validations through it run
+    concurrently.  Each cache guards its own entries; a lock is held only
+    briefly while several caches must change together (as when a schema is
+    loaded, replaced, or evicted), never while loading schemas or 
+    validating.
     """
 
-    def __init__(self, schemaLoader=None):
+    def __init__(self, schemaLoader=None, dispatch=True, failfast=False,
+                 maxvalidators=None, maxschemas=None, maxbytes=None, 
+                 pinned=EXTSCHEMA_URIS, missingttl=300.0, 
+                 maxfragments=10000):
         """
         initialize the validator for a set of expected schemas
+
+        :argument schemaLoader:  the SchemaLoader to use to find schemas
+        :argument bool dispatch: if True (default), oneOf and anyOf 
+                                 combinations whose branches are each 
+                                 distinguished by a required constant property
+                                 (like "$type") will be validated by jumping 
+                                 directly to the matching branch; errors will
+                                 only be reported from that branch.
+        :argument bool failfast: if True, the keywords of each (sub-)schema
+                                 will be evaluated in order of estimated 
+                                 cost so that invalid instances are rejected 
+                                 as early as possible.  Which error gets 
+                                 reported first may differ from the default 
+                                 (schema) order.  
+        :argument int maxvalidators:  the maximum number of compiled 
+                                 validators to cache; the least recently used 
+                                 will be evicted when the limit is exceeded.  
+                                 This also limits the number of schema URIs 
+                                 whose validator classes are remembered.  If 
+                                 None, the number is not limited.
+        :argument int maxschemas:  the maximum number of schema documents to 
+                                 cache (and of RefResolvers, one per 
+                                 document); evicted schemas are reloaded from
+                                 the loader as needed.  If None, the number is
+                                 not limited.
+        :argument int maxbytes:  the maximum (estimated) number of bytes of 
+                                 schema documents to cache.  If None, the size 
+                                 is not limited.
+        :argument list pinned:   the URIs of schemas that should never be 
+                                 evicted.  Schemas added via load_schema() are
+                                 always pinned.
+        :argument float missingttl:  the number of seconds to remember that 
+                                 a schema URI could not be resolved by the 
+                                 loader; during that time, lookups of the URI
+                                 fail without consulting the loader.  If None,
+                                 failures are remembered until forgotten via
+                                 forget_missing(); if 0, they are not 
+                                 remembered.
+        :argument int maxfragments:  the maximum number of resolved subschema
+                                 URLs (i.e. $ref targets) to remember.  If 
+                                 None, the number is not limited.
         """
-        if not schemaLoader:
+        if schemaLoader is None:
             schemaLoader = loader.SchemaLoader()
         self._loader = schemaLoader
         self._handler = loader.SchemaHandler(schemaLoader)
-        self._schemaStore = {}
-        self._validators = {}
+        self._validators = LRUCache(maxvalidators, sizeof=None, 
+                                    lock=threading.Lock())
+        self._prepared = LRUCache(maxvalidators, sizeof=None, 
+                                  lock=threading.Lock())
+
+        # these are shared by all of the RefResolvers (one per base schema
+        # document)
+        self._schemaStore = LRUCache(maxschemas, maxbytes, 
+                                     normalize=_normuri, 
+                                     on_evict=self._evicted,
+                                     lock=threading.Lock())
+        for uri in pinned or []:
+            self._schemaStore.pin(uri)
+        self._missing = NegativeCache(missingttl, lock=threading.Lock())
+        self._resolvers = LRUCache(maxschemas, sizeof=None, 
+                                   lock=threading.Lock())
+        self._fragments = LRUCache(maxfragments, sizeof=None, 
+                                   lock=threading.Lock())
+        self._urljoin = lru_cache(1024)(urljoin)
+        self._dispatch = dispatch
+        self._discriminators = _dispatch.DiscriminatorIndex()
+        self._failfast = failfast
+        self._order = ordering.KeywordOrder()
+        self._vclasses = {}
+
+        # held while updating several caches together.  The generation 
+        # counts the times that schemas have been replaced; things built 
+        # from the schemas are only cached if none were replaced meanwhile
+        # (see _remember()).
+        self._lock = threading.RLock()
+        self._generation = 0
 
     @classmethod
     def with_schema_dir(self, dirpath):
@@ -50,6 +260,7 @@ class ExtValidator(object):
         """
         return ExtValidator(loader.SchemaLoader.from_directory(dirpath))
 
+    @_synchronized
     def load_schema(self, schema, uri=None):
         """
         load a pre-parsed schema into the validator.  The schema will be checked 
@@ -70,8 +281,157 @@ class ExtValidator(object):
         vcls = jsch.validator_for(schema)
         vcls.check_schema(schema)
 
-        # now add it
+        # now add it, forgetting anything built from a previous version; 
+        # we can't get it back if it gets evicted, so pin it.
+        self._schemaStore.pin(uri)
         self._schemaStore[uri] = schema
+        self._missing.discard(_normuri(uri))
+        self._generation += 1
+        self._forget(uri)
+
+    @_synchronized
+    def pin_schema(self, uri):
+        """
+        prevent the schema with the given URI from being evicted from this
+        validator's cache of schemas.  
+        """
+        self._schemaStore.pin(uri)
+
+    @_synchronized
+    def forget_missing(self, uri=None):
+        """
+        forget that the schema with the given URI could not be found so that 
+        the next lookup will consult the loader again.  
+
+        :argument str uri:  the schema URI to forget; if None, all recorded 
+                            failures are forgotten.
+        """
+        if uri is None:
+            self._missing.clear()
+        else:
+            self._missing.discard(_normuri(self._spliturifrag(uri)[0]))
+
+    @_synchronized
+    def cache_stats(self):
+        """
+        return statistics describing the use of this validator's caches.  The
+        returned dictionary has a member for each cache--"schemas", 
+        "validators", "prepared", "resolvers", "fragments", "dispatch", and
+        "ordering"--each a dictionary including the number of entries and 
+        the numbers of hits, misses, and evictions (see LRUCache.stats()).  
+        Bytes are estimated only for the schema documents; the other caches 
+        hold objects that mostly refer into those documents, so their 
+        "bytes" is None.  A "missing" member describes the record of schema
+        URIs that could not be found.
+        """
+        return { "schemas": self._schemaStore.stats(),
+                 "validators": self._validators.stats(),
+                 "prepared": self._prepared.stats(),
+                 "resolvers": self._resolvers.stats(),
+                 "fragments": self._fragments.stats(),
+                 "dispatch": self._discriminators.stats(),
+                 "ordering": self._order.stats(),
+                 "missing": self._missing.stats() }
+
+    def reload_schema(self, uri):
+        """
+        replace the cached copy of the schema with the given URI with a fresh
+        one from the loader (e.g. after its file has changed).  Only the 
+        compiled validators whose schemas refer to this schema, directly or 
+        transitively via $ref or $extensionSchemas, are discarded; all 
+        others remain ready for use.  
+
+        :exc `KeyError` if the loader cannot provide the schema; in this case,
+                        the validator is left unchanged.
+        :exc `IOError` if the loader failed to read the schema; in this case,
+                        the validator is left unchanged.
+        """
+        urib = self._spliturifrag(uri)[0]
+        schema = self._from_loader(urib)
+        with self._lock:
+            self._forget_dependents(urib)
+            self._schemaStore[urib] = schema
+            self._missing.discard(_normuri(urib))
+
+    @_synchronized
+    def discard_schema(self, uri):
+        """
+        drop the schema with the given URI from this validator's cache along
+        with the compiled validators whose schemas refer to it, directly or 
+        transitively.  The schema will be requested from the loader again 
+        when it is next needed.
+        """
+        urib = self._spliturifrag(uri)[0]
+        self._forget_dependents(urib)
+        if urib in self._schemaStore:
+            del self._schemaStore[urib]
+        self._missing.discard(_normuri(urib))
+
+    def _forget_dependents(self, urib):
+        # the lock must be held
+        self._generation += 1
+        for u in self._dependents(urib.rstrip('#')):
+            self._forget(u)
+
+        # discriminator analyses may have looked through $refs to the old
+        # version
+        self._discriminators.clear()
+
+    def _dependents(self, urib):
+        # return the base URIs of the cached schema documents that depend on 
+        # the one with the given base URI (given without a trailing '#'),
+        # including that one itself
+        rdeps = {}
+        for u in self._schemaStore:
+            doc = self._schemaStore.peek(u)
+            for dep in loader.schema_dependencies(doc, u):
+                rdeps.setdefault(dep, set()).add(u.rstrip('#'))
+
+        out = set([urib])
+        stack = [urib]
+        while stack:
+            for u in rdeps.get(stack.pop(), ()):
+                if u not in out:
+                    out.add(u)
+                    stack.append(u)
+        return out
+
+    def _evicted(self, urib, schema):
+        # called when a schema is evicted from the store; urib is the 
+        # store's normalized key, which lacks any trailing '#'.
+        with self._lock:
+            self._forget(urib)
+
+            # these hold on to parts of schemas
+            self._discriminators.clear()
+            self._order.clear()
+
+    def _forget(self, urib):
+        # drop validators that depend on the schema with the given base URI.
+        # The caches are keyed by URIs as given, so the base URI is matched
+        # with and without a trailing '#'.  The lock must be held.
+        urib = urib.rstrip('#')
+        def match(uri):
+            return self._spliturifrag(uri)[0].rstrip('#') == urib
+
+        self._resolvers.pop(urib, None)
+        self._resolvers.pop(urib+'#', None)
+        for url in self._fragments.keys():
+            if match(url):
+                self._fragments.pop(url, None)
+        for uri in self._prepared.keys():
+            if match(uri):
+                self._prepared.pop(uri, None)
+        for uris in self._validators.keys():
+            if any([match(u) for u in uris]):
+                self._validators.pop(uris, None)
+
+    def _remember(self, cache, key, val, gen):
+        # cache a value built from the schemas as they were at the given 
+        # generation, unless any schemas have been replaced since
+        with self._lock:
+            if gen == self._generation:
+                cache[key] = val
         
         
     def validate(self, instance, minimally=False, strict=False, schemauri=None):
@@ -89,37 +449,256 @@ class ExtValidator(object):
         self.validate_against(instance, baseSchema, True)
 
         if not minimally:
-            # we need to validate any portions including the EXTSCHEMAS property
-            inst = Instance(instance)
-            extensions = dict(inst.find_extended_objs())
-
             # If instance is actually an extension schema schema, we need to
             # ignore the definition of the EXTSCHEMAS property.
-            is_extschema = self.is_extschema_schema(instance)
-            
-            for ptr in extensions:
-                # make sure that the EXTSCHEMAS property is invoked properly
-                if not isinstance(extensions[ptr][EXTSCHEMAS], list):
-                    if not is_extschema or \
-                       not isinstance(extensions[ptr][EXTSCHEMAS], dict):
-                        msg = "invalid value type for {0} (not an array):\n     {1}"\
-                              .format(EXTSCHEMAS, extensions[ptr][EXTSCHEMAS])
-                        raise ValidationError(msg)
-                    else:
-                        # this is the extension schema schema, so ignore this
-                        # node
-                        continue
-                
-                for val in extensions[ptr][EXTSCHEMAS]:
-                    if not isinstance(val, types.StringTypes):
-                        raise ValidationError(
-                            "invalid {0} array item type:\n    {1}"
-                            .format(EXTSCHEMAS, val))
-                    
-                # now validate marked portion
-                self.validate_against(extensions[ptr], 
-                                      extensions[ptr][EXTSCHEMAS], strict)
-            
+            self._validate_extensions(instance, strict, 
+                                      self.is_extschema_schema(instance))
+
+    def precompile(self, uris=None, workers=4, strict=False):
+        """
+        load the given schemas and compile their validators ahead of use so
+        that later validation against them does not pay that cost.  The 
+        schemas are loaded in parallel and compiled leaf-first, so that each 
+        is compiled after the schemas it refers to (see 
+        depgraph.SchemaGraph.levels()).  
+
+        Only the loading is done in parallel:  compiling (checking each 
+        schema and building its validator) is pure Python, so worker threads
+        would just take turns holding the interpreter lock.  The schemas of
+        each level are therefore compiled one after another in the calling 
+        thread, which does not block validations running in other threads.
+
+        :argument list uris:   the URIs of the schemas to precompile; if None,
+                               all the schemas known to the loader (via its
+                               iterURIs() method) are precompiled.
+        :argument int workers: the number of schemas to load in parallel; 
+                               compilation is always serial
+        :argument bool strict: if True, raise an exception if any of the 
+                               schemas cannot be loaded; otherwise, they are
+                               skipped.
+        :return SchemaGraph:  the dependency graph of the schemas
+        :exc `SchemaError` if a schema is invalid, or, if strict is True, 
+                           cannot be loaded
+        """
+        docs = {}
+        graph = depgraph.SchemaGraph.from_loader(self._loader, uris, workers,
+                                                 docs)
+        if strict and graph.errors:
+            raise SchemaError("Unable to load schemas: " + 
+                              ", ".join(sorted(graph.errors.keys())))
+
+        for level in graph.levels():
+            for node in level:
+                uri = graph.uri_for(node)
+                urib = self._spliturifrag(uri)[0]
+                gen = self._generation
+                with self._lock:
+                    if urib not in self._schemaStore:
+                        self._schemaStore[urib] = docs[uri]
+                cls = self._prepare(uri, strict)
+                if cls and (uri,) not in self._validators:
+                    self._remember(self._validators, (uri,), 
+                                   self._composite((uri,), cls), gen)
+        return graph
+
+    def _validate_extensions(self, instance, strict, is_extschema=False):
+        # validate any portions including the EXTSCHEMAS property
+        inst = Instance(instance)
+
+        for ptr, node in inst.iter_extended_objs(True):
+            # make sure that the EXTSCHEMAS property is invoked properly
+            if not self._check_extschemas(node[EXTSCHEMAS], is_extschema):
+                # this is the extension schema schema, so ignore this
+                # node
+                continue
+
+            # now validate marked portion
+            self.validate_against(node, node[EXTSCHEMAS], strict)
+
+    def _check_extschemas(self, extschemas, is_extschema=False):
+        # make sure that the EXTSCHEMAS property is invoked properly; return
+        # False if the value should be ignored
+        if not isinstance(extschemas, list):
+            if not is_extschema or not isinstance(extschemas, dict):
+                msg = "invalid value type for {0} (not an array):\n     {1}"\
+                      .format(EXTSCHEMAS, extschemas)
+                raise ValidationError(msg)
+            return False
+
+        for val in extschemas:
+            if not isinstance(val, types.StringTypes):
+                raise ValidationError(
+                    "invalid {0} array item type:\n    {1}"
+                    .format(EXTSCHEMAS, val))
+        return True
+
+    def validate_subtree(self, instance, pointer, minimally=False, 
+                         strict=False, schemauri=None):
+        """
+        validate only the portion of the instance document located by the 
+        given JSON Pointer.  The instance's base schema (and any extension 
+        schemas declared by the objects along the way) are used to find the 
+        subschemas that govern that location, and the data there is validated
+        against them, including any $extensionSchemas found within it.  
+
+        Note that where an ancestor is governed by a oneOf or anyOf whose 
+        branches are not discriminated by a constant property (see the 
+        dispatch module), the portion is only required to be valid against 
+        one of the governing branches' subschemas.  
+
+        :argument instance:  the full, parsed JSON document
+        :argument str pointer:  a JSON Pointer to the portion to validate
+        :argument bool minimally:  if True, ignore extension schemas
+        :argument bool strict:  if True, fail if an extension schema cannot 
+                                be resolved
+        :argument str schemauri:  the URI of the base schema to assume for the
+                                document (overriding its $schema property)
+
+        :exc `KeyError` if the pointer does not exist in the instance
+        :exc `ValueError` if the pointer is not a valid JSON Pointer
+        """
+        baseSchema = schemauri
+        if not baseSchema:
+            baseSchema = instance.get("$schema")
+        if not baseSchema:
+            raise ValidationError("Base schema ($schema) not specified; " +
+                                  "unable to validate")
+        cls = self._prepare(baseSchema, True)
+        is_extschema = self.is_extschema_schema(instance)
+
+        tokens = path_from_pointer(pointer)
+        node = _ref(baseSchema)
+        data = instance
+        for i, token in enumerate(tokens):
+            if not minimally:
+                node = self._add_extensions(node, data, strict, is_extschema)
+
+            if isinstance(data, list):
+                # None (not an index) fails below
+                token = array_index(token)
+            try:
+                child = data[token]
+            except (IndexError, KeyError, TypeError), ex:
+                raise KeyError("JSON Pointer not found in document: " + 
+                               pointer_from_path(tokens[:i+1]))
+
+            if node is not None:
+                try:
+                    node = self._child_schema(node, None, token, data)
+                except ValidationError, ex:
+                    ex.path.extendleft(reversed(tokens[:i]))
+                    raise
+            data = child
+
+        if node is not None:
+            urib = self._spliturifrag(baseSchema)[0]
+            val = cls(node, resolver=self._resolver_for(urib))
+            try:
+                val.validate(data)
+            except ValidationError, ex:
+                ex.path.extendleft(reversed(tokens))
+                raise
+
+        if not minimally:
+            self._validate_extensions(data, strict, is_extschema)
+
+    def _add_extensions(self, node, data, strict, is_extschema):
+        # add in the schemas from the extensions declared on data
+        if not isinstance(data, dict) or EXTSCHEMAS not in data or \
+           not self._check_extschemas(data[EXTSCHEMAS], is_extschema):
+            return node
+        
+        parts = [ _ref(u) for u in data[EXTSCHEMAS] 
+                          if self._prepare(u, strict) ]
+        if node is not None:
+            parts.insert(0, node)
+        if not parts:
+            return None
+        return TransientDict({ "allOf": parts })
+
+    def _child_schema(self, schema, loc, token, data):
+        # return a schema that governs data[token] given the schema that
+        # governs data.  loc is the URL locating schema; if None, schema
+        # was constructed by us and contains only absolute $refs, allOf, 
+        # and anyOf.  The constructed schema is returned, or None if 
+        # data[token] is unconstrained.  Constructed schemas are marked 
+        # transient so that the dispatch and ordering caches, which are 
+        # keyed on object identity, do not accumulate them.
+        ref = schema.get("$ref")
+        if ref is not None:
+            url = self._urljoin(loc or "", ref)
+            return self._child_schema(self._resolve_url(url), url, token, data)
+
+        parts = []
+        if loc and isinstance(data, dict):
+            matched = False
+            props = schema.get("properties", {})
+            if token in props:
+                matched = True
+                parts.append(_ref(_subloc(loc, "properties", token)))
+            for pat in schema.get("patternProperties", {}):
+                if re.search(pat, token):
+                    matched = True
+                    parts.append(_ref(_subloc(loc, "patternProperties", pat)))
+            if not matched:
+                addl = schema.get("additionalProperties")
+                if addl is False:
+                    raise ValidationError(
+                        "Additional properties are not allowed (%r was "
+                        "unexpected)" % token)
+                if isinstance(addl, dict):
+                    parts.append(_ref(_subloc(loc, "additionalProperties")))
+        elif loc and isinstance(data, list):
+            items = schema.get("items")
+            if isinstance(items, dict):
+                parts.append(_ref(_subloc(loc, "items")))
+            elif isinstance(items, list):
+                if token < len(items):
+                    parts.append(_ref(_subloc(loc, "items", str(token))))
+                elif isinstance(schema.get("additionalItems"), dict):
+                    parts.append(_ref(_subloc(loc, "additionalItems")))
+
+        for i, sub in enumerate(schema.get("allOf", [])):
+            sub = self._child_schema(sub, loc and _subloc(loc, "allOf", str(i)),
+                                     token, data)
+            if sub is not None:
+                parts.append(sub)
+
+        for kw in ("anyOf", "oneOf"):
+            branches = schema.get(kw)
+            if not branches:
+                continue
+
+            sel = None
+            if loc and self._dispatch:
+                resolver = self._resolver_for(self._spliturifrag(loc)[0])
+                with resolver.in_scope(loc):
+                    sel = _dispatch.select_branch(self._discriminators, 
+                                                  branches, resolver, data)
+            if sel is not None:
+                use = [sel]
+            else:
+                use = range(len(branches))
+
+            alts = TransientList()
+            for i in use:
+                sub = self._child_schema(branches[i], 
+                                         loc and _subloc(loc, kw, str(i)),
+                                         token, data)
+                if sub is None:
+                    # one of the alternatives leaves it unconstrained
+                    alts = None
+                    break
+                alts.append(sub)
+            if alts:
+                parts.append(len(alts) == 1 and alts[0] or 
+                             TransientDict({ "anyOf": alts }))
+
+        if not parts:
+            return None
+        if len(parts) == 1:
+            return parts[0]
+        return TransientDict({ "allOf": parts })
 
     def validate_against(self, instance, schemauris=[], strict=False):
         """
@@ -128,6 +707,11 @@ class ExtValidator(object):
         must validate against each of the named schemas.  $extensionSchema
         properties within the instance are ignored.  
 
+        The schemas are combined into a single CompositeValidator (cached for
+        the given list of URIs) so that the instance is validated in one 
+        pass.  A raised ValidationError will have a schema_uri attribute set
+        to the URI of the schema that the instance failed against.
+
         :argument instance:  a parsed JSON document to be validated.
         :argument list schemauris:  a list of URIs of the schemas to validate
                                     against.  
@@ -139,40 +723,151 @@ class ExtValidator(object):
         """
         if isinstance(schemauris, str) or isinstance(schemauris, unicode):
             schemauris = [ schemauris ]
-        schema = None
-        out = True
-        for uri in schemauris:
-            val = self._validators.get(uri)
-            if not val:
-                (urib,frag) = self._spliturifrag(uri)
-                schema = self._schemaStore.get(urib)
-                if not schema:
-                    try:
-                        schema = self._loader(urib)
-                    except KeyError, e:
-                        if strict:
-                            raise SchemaError("Unable to resolve schema for " + 
-                                              urib)
-                        continue
-                resolver = jsch.RefResolver(uri, schema, self._schemaStore,
-                                            handlers=self._handler)
-
-                if frag:
-                    try:
-                        schema = resolver.resolve_fragment(schema, frag)
-                    except RefResolutionError, ex:
-                        raise SchemaError("Unable to resolve fragment, "+frag+
-                                          "from schema, "+ urib)
-
-                cls = jsch.validator_for(schema)
-                cls.check_schema(schema)
-                val = cls(schema, resolver=resolver)
 
+        # drop the schemas we can't find (when not strict)
+        gen = self._generation
+        classes = [(u, self._prepare(u, strict)) for u in schemauris]
+        classes = [c for c in classes if c[1]]
+        if not classes:
+            return
+
+        uris = tuple([c[0] for c in classes])
+        val = self._validators.get(uris)
+        if not val:
+            val = self._composite(uris, [c[1] for c in classes])
+            self._remember(self._validators, uris, val, gen)
+
+        val.validate(instance)
+
+    def _prepare(self, uri, strict):
+        # make sure the schema for the given URI is loaded and is itself 
+        # valid.  Return the validator class it needs or None if it cannot
+        # be found and strict=False.
+        cls = self._prepared.get(uri)
+        if cls:
+            return cls
+
+        gen = self._generation
+        (urib,frag) = self._spliturifrag(uri)
+        try:
+            schema = self._document(urib)
+        except KeyError, e:
+            if strict:
+                raise SchemaError("Unable to resolve schema for " + 
+                                  urib)
+            return None
+
+        if frag:
             try:
-                val.validate(instance)
-            finally:
-                self._validators[uri] = val
-                self._schemaStore.update(val.resolver.store)
+                schema = self._resolve_url(uri)
+            except RefResolutionError, ex:
+                raise SchemaError("Unable to resolve fragment, "+frag+
+                                  "from schema, "+ urib)
+
+        cls = self._validator_class(schema)
+        cls.check_schema(schema)
+        self._remember(self._prepared, uri, cls, gen)
+        return cls
+
+    def _document(self, urib):
+        # return the schema document with the given base URI, loading it 
+        # if necessary.  The loader is called without holding the lock.
+        schema = self._schemaStore.get(urib)
+        if schema is not None:
+            return schema
+
+        key = _normuri(urib)
+        if key in self._missing:
+            raise KeyError(urib)
+        try:
+            schema = self._from_loader(urib)
+        except KeyError:
+            self._missing.add(key)
+            raise
+
+        with self._lock:
+            # another thread may have stored it (perhaps a newer version) 
+            # while we were loading
+            out = self._schemaStore.get(urib)
+            if out is None:
+                self._schemaStore[urib] = schema
+                out = schema
+        return out
+
+    def _from_loader(self, urib):
+        try:
+            return self._loader(urib)
+        except KeyError:
+            # the loader may know it with(out) an empty fragment
+            if urib.endswith('#'):
+                return self._loader(urib[:-1])
+            else:
+                return self._loader(urib+'#')
+
+    def _composite(self, uris, cls):
+        # create a validator for the given (prepared) schemas; cls is the 
+        # validator class for all of them or a list of their classes
+        (urib,frag) = self._spliturifrag(uris[0])
+        return CompositeValidator(uris, cls, self._resolver_for(urib))
+
+    def _resolver_for(self, urib):
+        # return the RefResolver for the (loaded) schema document with the 
+        # given base URI.  All resolvers share the schema store, the URL 
+        # join cache, and the index of resolved fragments.
+        out = self._resolvers.get(urib)
+        if not out:
+            gen = self._generation
+            out = _SharedResolver(urib, self._document(urib), 
+                                  handlers=self._handler, 
+                                  urljoin_cache=self._urljoin,
+                                  remote_cache=self._resolve_url)
+            out.store = self._schemaStore
+            self._remember(self._resolvers, urib, out, gen)
+        return out
+
+    def _resolve_url(self, url):
+        # return the subschema identified by the given URL (with fragment).
+        # Results are memoized in the fragment index.
+        try:
+            return self._fragments[url]
+        except KeyError:
+            pass
+
+        gen = self._generation
+        (urib,frag) = self._spliturifrag(url)
+        schema = self._schemaStore.get(urib)
+        if schema is None and urib in jsch.meta_schemas:
+            # as with a RefResolver's own store, the meta-schemas are 
+            # always available to $refs
+            schema = jsch.meta_schemas[urib].META_SCHEMA
+        if schema is None:
+            try:
+                schema = self._document(urib)
+            except Exception, ex:
+                raise RefResolutionError(ex)
+
+        out = _fragment_resolver.resolve_fragment(schema, frag)
+        self._remember(self._fragments, url, out, gen)
+        return out
+
+    def _validator_class(self, schema):
+        # return the validator class to use for the given schema, extended
+        # as necessary to support discriminator-based dispatch and 
+        # cost-ordered keywords
+        cls = jsch.validator_for(schema)
+        if not self._dispatch and not self._failfast:
+            return cls
+
+        out = self._vclasses.get(cls)
+        if not out:
+            out = cls
+            if self._dispatch:
+                out = _dispatch.extend_validator(out, self._discriminators)
+            if self._failfast:
+                out = ordering.ordered_validator(out, self._order)
+            with self._lock:
+                out = self._vclasses.setdefault(cls, out)
+        return out
 
     def _spliturifrag(self, uri):
         parts = urlparse.urldefrag(uri)
@@ -187,7 +882,7 @@ class ExtValidator(object):
         validate().
         """
         with open(filepath) as fd:
-            instance = json.load(fd)
+            instance = jsonbackend.load(fd)
         self.validate(instance, minimally, strict)
 
     def is_extschema_schema(self, instance):
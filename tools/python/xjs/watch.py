@@ -0,0 +1,225 @@
+"""
+a module that provides support for reloading schemas when their files
+change, without restarting the process.
+
+A SchemaWatcher keeps track of the schema files known to a SchemaLoader (and,
+optionally, a location file or a schema directory that defines the loader's
+mappings).  When a file changes, only that schema is re-parsed, and the
+ExtValidators being served are told to discard just the compiled validators
+that depend on it (see ExtValidator.reload_schema()).
+
+Changes are detected by comparing file modification times and sizes, either
+on demand via check(), periodically from a background thread, or, when the
+pyinotify package is available, as soon as the operating system reports
+them.
+"""
+from __future__ import with_statement
+import os, threading, logging
+from urlparse import urlparse
+
+from .schemaloader import DirectorySchemaCache
+
+try:
+    import pyinotify
+except ImportError:
+    pyinotify = None
+
+log = logging.getLogger(__name__)
+
+def _stat(path):
+    try:
+        st = os.stat(path)
+        return (st.st_mtime, st.st_size)
+    except OSError:
+        return None
+
+class SchemaWatcher(object):
+    """
+    a monitor of the schema files used by a SchemaLoader that reloads
+    changed schemas into a set of ExtValidators.
+    """
+
+    def __init__(self, loader, validators=None, locfile=None, dirpath=None,
+                 interval=2.0, inotify=None):
+        """
+        create the watcher.  Nothing is monitored until start() is called
+        (or check() is called explicitly).
+
+        :argument SchemaLoader loader:  the loader whose schema files should
+                                   be monitored
+        :argument list validators: the ExtValidators (using loader) to update
+                                   when schemas change
+        :argument str locfile:     the path to a location file that defines
+                                   the loader's mappings; if given, it will
+                                   be re-read when it changes.
+        :argument str dirpath:     the path to a directory of schemas that
+                                   defines the loader's mappings; if given,
+                                   it will be rescanned to find new schema 
+                                   files (reading only the new or changed 
+                                   files).
+        :argument float interval:  the number of seconds between checks when
+                                   polling
+        :argument bool inotify:    if True, use inotify (via pyinotify) to
+                                   detect changes; if False, poll.  If None,
+                                   inotify will be used if it is available.
+        """
+        self._loader = loader
+        self._validators = list(validators or [])
+        self._locfile = locfile
+        self._dircache = None
+        if dirpath:
+            self._dircache = DirectorySchemaCache(dirpath)
+        self.interval = interval
+        if inotify is None:
+            inotify = pyinotify is not None
+        if inotify and pyinotify is None:
+            raise RuntimeError("pyinotify is not available")
+        self._inotify = inotify
+
+        self._lock = threading.RLock()
+        self._stopped = threading.Event()
+        self._thread = None
+        self._notifier = None
+
+        self._locstat = locfile and _stat(locfile)
+        self.last_error = None
+        self._files = {}
+        self._snapshot()
+
+    def _paths(self):
+        # return a mapping of the local schema file paths to the URIs
+        # located there
+        out = {}
+        for uri in self._loader.iterURIs():
+            loc = self._loader.locate(uri)
+            if urlparse(loc).scheme:
+                continue
+            out.setdefault(loc, []).append(uri)
+        return out
+
+    def _snapshot(self):
+        self._files = dict([(path, (uris, _stat(path)))
+                            for path, uris in self._paths().iteritems()])
+
+    def add_validator(self, validator):
+        """
+        add an ExtValidator to be updated when schemas change
+        """
+        with self._lock:
+            self._validators.append(validator)
+
+    def check(self):
+        """
+        look for changed schema files and reload the schemas they contain.
+
+        :return list: the URIs of the schemas that were reloaded
+        """
+        with self._lock:
+            self._update_locations()
+
+            changed = []
+            paths = self._paths()
+            for path, uris in paths.iteritems():
+                (olduris, oldstat) = self._files.get(path, ([], None))
+                newstat = _stat(path)
+                if newstat != oldstat:
+                    self._invalidate(path)
+                    changed.extend(uris)
+                else:
+                    # the file is unchanged, but it may now define new URIs
+                    changed.extend([u for u in uris if u not in olduris])
+                self._files[path] = (uris, newstat)
+            for path in self._files.keys():
+                if path not in paths:
+                    self._invalidate(path)
+                    changed.extend(self._files.pop(path)[0])
+
+            for uri in changed:
+                for validator in self._validators:
+                    try:
+                        validator.reload_schema(uri)
+                    except (KeyError, IOError, ValueError), ex:
+                        # no longer available (or not valid JSON)
+                        validator.discard_schema(uri)
+
+            return changed
+
+    def _invalidate(self, path):
+        # make sure the loader re-reads the file
+        cache = getattr(self._loader, "_cache", None)
+        if cache is not None:
+            cache.invalidate(path)
+
+    def _update_locations(self):
+        if self._locfile:
+            st = _stat(self._locfile)
+            if st != self._locstat:
+                if st:
+                    # if this fails (e.g. the file is half-written), it is
+                    # tried again on the next check
+                    self._loader.load_locations(self._locfile)
+                self._locstat = st
+        if self._dircache:
+            self._loader.add_locations(self._dircache.locations(True))
+
+    def start(self):
+        """
+        start monitoring in the background
+        """
+        if self._thread or self._notifier:
+            return
+        self._stopped.clear()
+        if self._inotify:
+            self._start_inotify()
+        else:
+            self._thread = threading.Thread(target=self._poll)
+            self._thread.daemon = True
+            self._thread.start()
+
+    def _poll(self):
+        while not self._stopped.wait(self.interval):
+            self._check_safely()
+
+    def _check_safely(self):
+        # check from the background, where an exception would otherwise end
+        # monitoring unnoticed; the error is logged and kept in last_error.
+        try:
+            self.check()
+        except Exception, ex:
+            self.last_error = ex
+            log.exception("Failed to check schemas for changes; "
+                          "will try again")
+
+    def _start_inotify(self):
+        watcher = self
+
+        class Handler(pyinotify.ProcessEvent):
+            def process_default(self, event):
+                watcher._check_safely()
+
+        wm = pyinotify.WatchManager()
+        mask = pyinotify.IN_CLOSE_WRITE | pyinotify.IN_MOVED_TO | \
+               pyinotify.IN_DELETE | pyinotify.IN_CREATE
+        dirs = set([os.path.dirname(os.path.abspath(p)) for p in self._files])
+        if self._locfile:
+            dirs.add(os.path.dirname(os.path.abspath(self._locfile)))
+        if self._dircache:
+            dirs.add(os.path.abspath(self._dircache._dir))
+        for d in dirs:
+            wm.add_watch(d, mask, rec=bool(self._dircache))
+
+        self._notifier = pyinotify.ThreadedNotifier(wm, Handler())
+        self._notifier.daemon = True
+        self._notifier.start()
+
+    def stop(self):
+        """
+        stop monitoring
+        """
+        self._stopped.set()
+        if self._thread:
+            self._thread.join()
+            self._thread = None
+        if self._notifier:
+            self._notifier.stop()
+            self._notifier = None